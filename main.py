@@ -1,20 +1,33 @@
 import sys
 
-from PyQt5.QtWidgets import QApplication
-
-from tests.test import average_time
-from tests.test import average_success
-from src import board as b
+from src import cli
 
 
+# PyQt5 y los tests solo se importan al usarlos, para que las órdenes de
+# "src/cli.py" (que no los necesitan) arranquen rápido
 def main(height, width, num_of_mines):
+    from PyQt5.QtWidgets import QApplication
+    from src import board as b
+
     app = QApplication(sys.argv)
     board = b.Board(height, width, num_of_mines)
     sys.exit(app.exec())
 
 
+def average_time(height, width, num_of_mines):
+    from tests.test import average_time
+    average_time(height, width, num_of_mines)
+
+
+def average_success(height, width, num_of_mines):
+    from tests.test import average_success
+    average_success(height, width, num_of_mines)
+
+
 if __name__ == '__main__':
-    if len(sys.argv) == 4:
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+        cli.main(sys.argv[1:])
+    elif len(sys.argv) == 4:
         height = sys.argv[1]
         height = int(height.replace('-', ''))
         width = sys.argv[2]
@@ -42,4 +55,4 @@ if __name__ == '__main__':
 
         average_success(height, width, num_of_mines)
     else:
-        main(5, 5, 5)
\ No newline at end of file
+        main(5, 5, 5)
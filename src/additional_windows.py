@@ -30,9 +30,9 @@ class Configuration(QDialog):
 
         # Inicializar campos del formulario
         self.height_spin = QSpinBox()
-        self.height_spin.setRange(1, 10)
+        self.height_spin.setRange(1, 24)
         self.width_spin = QSpinBox()
-        self.width_spin.setRange(1, 10)
+        self.width_spin.setRange(1, 30)
         self.num_of_mines_spin = QSpinBox()
         self.num_of_mines_spin.setMinimum(1)
 
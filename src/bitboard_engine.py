@@ -0,0 +1,190 @@
+from . import engine as eng
+
+
+# Tablero de bits: cada conjunto de casillas es un entero de Python en el que
+# la casilla (i,j) es el bit i*stride + j, con stride = width + 1. La columna
+# de más (el bit "width" de cada fila) está siempre a 0, de forma que al
+# desplazar una fila un bit a la izquierda o a la derecha no se mezcla con la
+# siguiente. Así los vecinos de todas las casillas de un conjunto se calculan
+# con 8 desplazamientos en lugar de recorrer las casillas una a una.
+class Bitboard:
+
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.stride = width + 1
+        row = (1 << width) - 1
+        self.mask = 0
+        for i in range(height):
+            self.mask |= row << (i*self.stride)
+        # Desplazamiento (positivo: hacia bits mayores) que lleva cada
+        # casilla a su vecino en cada una de las direcciones
+        # de "NEIGHBOR_POSITION"
+        self.shifts = [di*self.stride + dj
+                       for (di, dj) in eng.NEIGHBOR_POSITION]
+
+    def bit(self, i, j):
+        return 1 << (i*self.stride + j)
+
+    def from_squares(self, squares):
+        bits = 0
+        for (i, j) in squares:
+            bits |= 1 << (i*self.stride + j)
+
+        return bits
+
+    # Casillas (i,j) del conjunto "bits", en orden de fila y columna
+    def squares(self, bits):
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(divmod(low.bit_length() - 1, self.stride))
+            bits ^= low
+
+        return result
+
+    def count(self, bits):
+        return bin(bits).count('1')
+
+    # Conjunto "bits" desplazado a cada una de sus 8 direcciones vecinas
+    # (dentro del tablero)
+    def neighbor_sets(self, bits):
+        return [(bits << shift if shift > 0 else bits >> -shift) & self.mask
+                for shift in self.shifts]
+
+    # Casillas vecinas de alguna casilla de "bits"
+    def dilate(self, bits):
+        result = 0
+        for moved in self.neighbor_sets(bits):
+            result |= moved
+
+        return result
+
+    # Número de casillas de "bits" vecinas de cada casilla, como 4 planos de
+    # bits (unidades, doses, cuatros y ochos). Los 8 conjuntos desplazados se
+    # suman con un sumador en cascada bit a bit, por lo que cada suma son
+    # unas pocas operaciones sobre todo el tablero.
+    def neighbor_counts(self, bits):
+        planes = [0, 0, 0, 0]
+        for moved in self.neighbor_sets(bits):
+            carry = moved
+            for k in range(3):
+                planes[k], carry = planes[k] ^ carry, planes[k] & carry
+            planes[3] |= carry
+
+        return planes
+
+
+# Lógica del tablero con los conjuntos de casillas guardados como tableros de
+# bits ("Bitboard"):
+#   - mines, hidden, flagged: casillas con mina, ocultas y con bandera.
+#   - counts: planos de bits del número de minas vecinas de cada casilla
+#     (ver "Bitboard.neighbor_counts").
+#   - zeros: casillas sin mina y sin minas vecinas.
+#
+# Tiene la misma interfaz que "engine.BoardEngine" y, con la misma semilla,
+# coloca las minas en las mismas casillas, pero las operaciones de cada
+# jugada trabajan sobre todo el tablero a la vez:
+#   - La zona que se abre al revelar una casilla sin minas vecinas se
+#     calcula dilatando la casilla repetidamente dentro de "zeros".
+#   - La frontera son las casillas ocultas vecinas de alguna revelada, y
+#     cada componente se obtiene dilatando alternativamente sus casillas
+#     ocultas y las reveladas que las rodean.
+class BitboardEngine(eng.BoardEngine):
+
+    def init_board(self):
+        self.bitboard = Bitboard(self.height, self.width)
+        self.mines = 0
+        self.hidden = self.bitboard.mask
+        self.flagged = 0
+        self.counts = [0, 0, 0, 0]
+        self.zeros = self.bitboard.mask
+
+    def place_mines(self, mine_positions=None):
+        if mine_positions is None:
+            num_of_squares = self.width * self.height
+            mines = self.rng.sample(range(num_of_squares), self.num_of_mines)
+            mine_positions = [self.get_position(m) for m in mines]
+
+        self.mines = self.bitboard.from_squares(mine_positions)
+        self.update_neighbors()
+
+    def update_neighbors(self):
+        self.counts = self.bitboard.neighbor_counts(self.mines)
+        nonzero = self.counts[0] | self.counts[1] | self.counts[2] | self.counts[3]
+        self.zeros = self.bitboard.mask & ~nonzero & ~self.mines
+
+    def get_mine_indices(self):
+        return [i*self.width + j for (i, j) in self.bitboard.squares(self.mines)]
+
+    def is_mine(self, i, j):
+        return bool(self.mines & self.bitboard.bit(i, j))
+
+    def is_hidden(self, i, j):
+        return bool(self.hidden & self.bitboard.bit(i, j))
+
+    def is_flagged(self, i, j):
+        return bool(self.flagged & self.bitboard.bit(i, j))
+
+    def get_neighbor_mines(self, i, j):
+        shift = i*self.bitboard.stride + j
+
+        return sum((plane >> shift & 1) << k for k, plane in enumerate(self.counts))
+
+    def change_flagged_state(self, i, j):
+        self.flagged ^= self.bitboard.bit(i, j)
+
+    def reveal_all_board(self):
+        self.hidden = 0
+
+    # La casilla elegida y, si no tiene minas vecinas, la zona de casillas
+    # ocultas sin minas vecinas conectada con ella más las casillas que la
+    # rodean
+    def get_opened_region(self, i, j):
+        if (self.invalid_position(i, j) or self.is_mine(i, j)
+                or not self.is_hidden(i, j)):
+            return []
+
+        region = self.bitboard.bit(i, j)
+        if region & self.zeros:
+            zeros = self.zeros & self.hidden
+            while True:
+                grown = (region | self.bitboard.dilate(region)) & zeros
+                if grown == region:
+                    break
+                region = grown
+            region = (region | self.bitboard.dilate(region)) & self.hidden
+
+        return self.bitboard.squares(region)
+
+    def set_revealed(self, squares):
+        self.hidden &= ~self.bitboard.from_squares(squares)
+
+    def get_frontier_bits(self):
+        revealed = self.bitboard.mask & ~self.hidden
+
+        return self.hidden & self.bitboard.dilate(revealed)
+
+    def get_frontier_components(self):
+        revealed = self.bitboard.mask & ~self.hidden
+        pending = self.get_frontier_bits()
+        interior = self.hidden & ~pending
+        components = []
+
+        while pending:
+            squares = pending & -pending
+            border = 0
+            while True:
+                new_border = self.bitboard.dilate(squares) & revealed
+                if new_border == border:
+                    break
+                border = new_border
+                squares = self.bitboard.dilate(border) & pending
+            pending &= ~squares
+            components.append((self.bitboard.squares(squares),
+                               self.bitboard.squares(border)))
+
+        return components, self.bitboard.squares(interior)
+
+    def get_hidden_squares(self):
+        return set(self.bitboard.squares(self.hidden))
@@ -1,7 +1,3 @@
-import random
-import math
-import operator
-
 from PyQt5 import QtGui
 from PyQt5.QtCore import QSize, Qt
 from PyQt5.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QLayout, 
@@ -10,18 +6,8 @@ from PyQt5.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QLayout,
 
 from . import square as sq
 from . import additional_windows as aux_windows
-from .inference import variable_elimination as ve
-from .inference import bayesian_network as bn
-
-
-# Cada dupla corresponde a los valores que hay que sumar
-# a una posición determinada del tablero para calcular uno
-# de sus 8 posibles vecinos.
-NEIGHBOR_POSITION = (
-    (-1, -1), (-1, 0), (-1, 1),
-    ( 0, -1),          ( 0, 1),
-    ( 1, -1), ( 1, 0), ( 1, 1)
-)
+from . import engine as eng
+from . import suggestion_worker as sw
 
 SQUARE_SIZE = QSize(24, 24)
 
@@ -33,6 +19,17 @@ NUMBER_COLORS = ['', 'blue', 'green', 'red', 'blueViolet',
                  'brown', 'yellow', 'aquamarine', 'black']
  
 
+# Ventana principal del juego. Toda la lógica del tablero (minas, casillas
+# reveladas, evidencias y sugerencias) se encuentra en "engine.BoardEngine";
+# esta clase solo refleja su estado en los widgets.
+#
+# Las jugadas y las sugerencias se calculan en otro hilo
+# ("suggestion_worker.SuggestionWorker"), por lo que la ventana no se
+# bloquea durante la inferencia. Las casillas reveladas se muestran en cuanto
+# llegan, y la casilla sugerida solo si corresponde a la última jugada. La
+# ventana no consulta el estado de la partida al motor (que se modifica en
+# el otro hilo), sino que lo recibe junto con las casillas reveladas.
+#
 # La casilla (0,0) corresponde a la esquina superior izquierda
 # Representación de posición: (i,j) ==> i: fila, j: columna
 class Board(QMainWindow):
@@ -43,13 +40,15 @@ class Board(QMainWindow):
         self.height = height
         self.width = width
         self.num_of_mines = num_of_mines
-        self.evidences = {}
-        self.suggested_pos = (0, 0)
-        self.variable_elimination = ve.VariableElimination(
-            bn.generate_BN(height, width, num_of_mines))
+        self.engine = eng.BoardEngine(height, width, num_of_mines)
+        # Casilla marcada en verde como sugerencia (None si no hay ninguna)
+        self.highlighted = None
+
+        self.worker = sw.SuggestionWorker(self.engine)
+        self.worker.revealed.connect(self.show_revealed)
+        self.worker.suggested.connect(self.show_suggestion)
 
         self.initUi()
-        self.place_mines()
 
     def initUi(self):
         # Inicializar la barra del menú
@@ -132,188 +131,80 @@ class Board(QMainWindow):
                 self.squares.addWidget(square, i, j)
 
 
-    # Coloca las minas en el tablero:
-    #   1.- Se genera un número aleatorio distinto
-    #       por cada mina.
-    #   2.- A cada número aleatorio se le asocia una casilla
-    #       mediante "get_position()".
-    #   3.- Se coloca cada mina en la posición calculada.
-    #   4.- Se actualiza "Square::neighbor_mines" de las
-    #       casillas vecinas de cada una de las minas
-    #       (llamando a "update_neighbors()").
-    def place_mines(self):
-        num_of_squares = self.width * self.height
-        mines = random.sample(range(num_of_squares), self.num_of_mines)
-        
-        for m in mines:
-            mine_position = self.get_position(m)
-            i = mine_position[0]
-            j = mine_position[1]
-            
-            self.get_square(i, j).set_mine()
-            
-            self.update_neighbors(i, j)
-    
-    # Devuelve la posición (i,j) dado un índice "index":
-    #                 
-    # +---+---+      Ejemplos con tablero 2x2:
-    # | 0 | 1 |
-    # +---+---+        - index = 0 ==> (0,0)
-    # | 2 | 3 |        - index = 2 ==> (1,0)
-    # +---+---+
-    def get_position(self, index):
-        i = math.floor(index/self.width)
-        j = index - self.width*i
-        
-        return (i, j)
-
     def get_square(self, i, j):
         return self.squares.itemAtPosition(i, j).widget()
-    
-    def update_neighbors(self, i, j):
-        for n in range(8):
-            ni = i + NEIGHBOR_POSITION[n][0]
-            nj = j + NEIGHBOR_POSITION[n][1]
-            if not (self.invalid_position(ni, nj)):
-                self.get_square(ni, nj).inc_neighbor_mines()
-    
-    # Tiene en cuenta los límites del tablero
-    def invalid_position(self, i, j):
-        return (j < 0 
-                or j >= self.width 
-                or i < 0 
-                or i >= self.height
-               )
-
-    def is_end_game(self):
-        revealed_square_count = len(self.evidences)/2
-        board_len = self.width*self.height
-        
-        return revealed_square_count == board_len - self.num_of_mines
-               
+
+    def reveal_square(self, i, j):
+        self.get_square(i, j).reveal(self.engine.is_mine(i, j),
+                                     self.engine.get_neighbor_mines(i, j))
+
     def reveal_all_board(self):
         for i in range(self.height):
             for j in range(self.width):
-                square = self.get_square(i, j)
-                square.reveal()
+                if self.get_square(i, j).is_hidden:
+                    self.reveal_square(i, j)
+
+    def show_end_game_message(self, text):
+        self.end_game_message.setText(text)
+        self.end_game_message.setStyleSheet('border: 1px;'
+                                            + ' border-style: solid;')
 
     def reveal(self, i, j):
-        square = self.get_square(i, j)
-    
-        if square.is_mine:
-            self.reveal_all_board()
-            self.end_game_message.setText('Has perdido')
-            self.end_game_message.setStyleSheet('border: 1px;' 
-                                                + ' border-style: solid;')
-            self.suggested_pos = False
-        else:
-            self.reveal_information(i, j)
-                
-            if self.is_end_game():
+        self.clear_suggestion()
+        self.worker.request_reveal(i, j)
+
+    def clear_suggestion(self):
+        if self.highlighted:
+            square = self.get_square(*self.highlighted)
+            if square.is_hidden:
+                square.setStyleSheet('')
+            self.highlighted = None
+
+    # Muestra las casillas reveladas por el motor en la última jugada. La
+    # ventana no se repinta hasta haber actualizado todas las casillas, por
+    # lo que abrir una zona grande solo provoca un repintado.
+    def update_view(self, revealed, state):
+        self.setUpdatesEnabled(False)
+        try:
+            if state == sw.LOST:
+                self.reveal_all_board()
+                self.show_end_game_message('Has perdido')
+            elif state == sw.WON:
                 self.reveal_all_board()
-                self.end_game_message.setText('¡Felicidades! Has ganado')
-                self.end_game_message.setStyleSheet('border: 1px;'
-                                                    + ' border-style: solid;')
-                self.suggested_pos = False
+                self.show_end_game_message('¡Felicidades! Has ganado')
             else:
-                self.suggested_pos = self.suggest_next_square()
-            
-    # P=(i,j): casilla que se encuentra en las coordenadas (i,j)
-    # del tablero. Debe mostrar la información de aquellas
-    # casillas vecinas hasta que se topa con una cuya Y>=1
-    # Flood fill algorithm: https://en.wikipedia.org/wiki/Flood_fill
-    def reveal_information(self, i, j):
-        if not (self.invalid_position(i, j)):        
-            square = self.get_square(i, j)
-            if square.is_mine==False and square.is_hidden==True:
-                square.reveal()
-                self.add_evidence(i, j)
-                if square.neighbor_mines==0:
-                    for n in range(8):
-                        ni = i + NEIGHBOR_POSITION[n][0]
-                        nj = j + NEIGHBOR_POSITION[n][1]
-                        self.reveal_information(ni, nj)
-
-    def add_evidence(self, i, j):
-        square = self.get_square(i, j)
-        X = bn.bn_X_name(i, j)
-        Y = bn.bn_Y_name(i, j)
-        
-        self.evidences[X] = int(square.is_mine)
-        self.evidences[Y] = square.neighbor_mines
-                
-    def suggest_next_square(self):
-        prob_X = {}
-        hidden = self.get_hidden_squares()
-        
-        for sq in hidden:
-            i = sq[0]
-            j = sq[1]
-            prob_X[(i, j)] = bn.calcule_prob_X(self.variable_elimination, i, j, 
-                                               self.evidences)
-
-        # Primera casilla con mayor probabilidad
-        # de no contener una mina.
-        return max(prob_X.items(), key=operator.itemgetter(1))[0]
-    
-    def get_hidden_squares(self):
-        hidden = set()
-        
-        for j in range(self.width):
-            for i in range(self.height):
-                square = self.get_square(i, j)
-                if square.is_hidden:
-                    hidden.add((i,j))
-                    
-        return hidden
-        
+                for (ri, rj) in revealed:
+                    self.reveal_square(ri, rj)
+        finally:
+            self.setUpdatesEnabled(True)
+
     def __str__(self):
-        res = ''
-        
-        for i in range(self.height):
-            for j in range(self.width):
-                square = self.get_square(i, j)
-                if square.is_hidden:
-                    res += '_ '
-                elif square.is_mine:
-                    res += '* '
-                else:
-                    res += '{} '.format(square.neighbor_mines)
-            res += '\n'
-        
-        return res    
+        return str(self.engine)
 
 
 # Las siguientes funciones corresponden a los "slots" usados en la aplicación:
 
-    # Resuelve automáticamente un tablero
+    # Resuelve automáticamente un tablero (en el hilo del trabajador)
     def play_game(self):
-        if self.suggested_pos:
-            print('Pasos de la resolución automática:\n')
-            while(self.suggested_pos):
-                i = self.suggested_pos[0]
-                j = self.suggested_pos[1]
-                self.reveal(i, j)
-                print('{0}\nCasilla seleccionada: {1}\n'.format(self, (i, j)))
-                print('============================')
-
-            if self.get_square(i, j).is_mine:
-                print('\tDERROTA\n============================')
-            else:
-                print('\tVICTORIA\n============================')
+        self.clear_suggestion()
+        self.worker.request_play_game()
 
     def handle_left_click(self):
-        i = self.suggested_pos[0]
-        j = self.suggested_pos[1]
-        self.get_square(i, j).setStyleSheet('')
-
         square = self.sender()
         self.reveal(square.property('i'), square.property('j'))
-        
-        if self.suggested_pos:
-            i = self.suggested_pos[0]
-            j = self.suggested_pos[1]
-            self.get_square(i, j).setStyleSheet('background-color: green')
+
+    def show_revealed(self, revealed, state, generation):
+        self.update_view(revealed, state)
+
+    def show_suggestion(self, suggested_pos, generation):
+        if generation != self.worker.generation:
+            return
+
+        self.clear_suggestion()
+        if suggested_pos:
+            self.highlighted = suggested_pos
+            self.get_square(*suggested_pos).setStyleSheet(
+                'background-color: green')
 
     def display_square(self):
         square = self.sender()
@@ -335,13 +226,17 @@ class Board(QMainWindow):
 
     def handle_flag(self):
         square = self.sender()
+        i = square.property('i')
+        j = square.property('j')
         if not square.flagged and not self.game_mine_count == 0:
+            self.worker.request_flag(i, j)
             square.change_flagged_state()
             square.setIcon(QtGui.QIcon(IMAGE_FLAG))
             self.game_mine_count -= 1
             self.label_mine_count.setText('Contador de minas: {0}/{1}'
                               .format(self.game_mine_count, self.num_of_mines))
         elif square.flagged:
+            self.worker.request_flag(i, j)
             square.change_flagged_state()
             square.setIcon(QtGui.QIcon())
             self.game_mine_count += 1
@@ -352,6 +247,10 @@ class Board(QMainWindow):
         self.close()
         self.__init__(self.height, self.width, self.num_of_mines)
 
+    def closeEvent(self, event):
+        self.worker.stop()
+        super().closeEvent(event)
+
     def conf_dialog(self):
         conf_window = aux_windows.Configuration(self)
         conf_window.exec()
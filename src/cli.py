@@ -0,0 +1,106 @@
+import sys
+import json
+import time
+import argparse
+
+from . import engine as eng
+
+
+# Órdenes de la línea de comandos. Ninguna importa PyQt5, y los motores de
+# inferencia (con pgmpy) solo se importan si hace falta calcular alguna
+# probabilidad (ver "engine.create_inference").
+COMMANDS = ('solve', 'suggest', 'benchmark')
+
+
+# Resuelve automáticamente una partida y muestra el tablero final, el
+# resultado y el tiempo empleado
+def solve(args):
+    start = time.perf_counter()
+    board = eng.BoardEngine(args.height, args.width, args.num_of_mines,
+                            args.backend, args.seed,
+                            pattern_table=args.pattern_table)
+    won = board.play_game()
+    end = time.perf_counter()
+
+    print(board)
+    print('Semilla: {0}'.format(args.seed))
+    print('Jugadas: {0}'.format(board.moves))
+    print('Resultado: {0}'.format('VICTORIA' if won else 'DERROTA'))
+    print('Tiempo: {0} seg (inferencia: {1} seg)'.format(end - start,
+                                                        board.inference_time))
+
+
+# Lee el estado visible de un tablero (una fila por línea, con el formato de
+# "BoardEngine.__str__") y escribe la sugerencia con el formato de las
+# respuestas de "server.py"
+def suggest(args):
+    from . import server
+
+    source = open(args.board) if args.board else sys.stdin
+    try:
+        rows = [line.rstrip('\n') for line in source if line.strip()]
+    finally:
+        if args.board:
+            source.close()
+
+    response = server.suggest({'height': args.height, 'width': args.width,
+                               'num_of_mines': args.num_of_mines,
+                               'board': rows, 'backend': args.backend},
+                              [args.pattern_table] if args.pattern_table else [])
+    print(json.dumps(response))
+
+
+def benchmark(args):
+    from tests import benchmark as bench
+
+    bench.main(args.arguments)
+
+
+def add_board_arguments(parser):
+    parser.add_argument('height', type=int)
+    parser.add_argument('width', type=int)
+    parser.add_argument('num_of_mines', type=int)
+    parser.add_argument('--backend', choices=eng.INFERENCE_BACKENDS,
+                        default='variable_elimination')
+    parser.add_argument('--pattern-table', default=None,
+                        help='tabla de patrones precalculada (ver '
+                             'precompute.py)')
+
+
+# Uso:
+#     $ python main.py solve 9 9 10 [--seed 1] [--backend enumeration]
+#     $ python main.py suggest 9 9 10 < tablero.txt
+#     $ python main.py benchmark --quick
+#
+# Los argumentos de "benchmark" se pasan tal cual a "tests/benchmark.py".
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Buscapython sin interfaz gráfica.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    solve_parser = commands.add_parser(
+        'solve', help='resuelve automáticamente una partida')
+    add_board_arguments(solve_parser)
+    solve_parser.add_argument('--seed', type=int, default=None)
+    solve_parser.set_defaults(func=solve)
+
+    suggest_parser = commands.add_parser(
+        'suggest', help='sugiere una casilla para el tablero de la entrada '
+                        'estándar (o de --board)')
+    add_board_arguments(suggest_parser)
+    suggest_parser.add_argument('--board', default=None)
+    suggest_parser.set_defaults(func=suggest)
+
+    benchmark_parser = commands.add_parser(
+        'benchmark', help='mide el rendimiento (ver tests/benchmark.py)')
+    benchmark_parser.set_defaults(func=benchmark)
+
+    args, arguments = parser.parse_known_args(argv)
+    if arguments and args.command != 'benchmark':
+        parser.error('unrecognized arguments: {0}'.format(' '.join(arguments)))
+    args.arguments = arguments
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,526 @@
+import random
+import math
+import functools
+import time
+import collections
+
+import numpy as np
+
+from .inference import constraint_propagation as cp
+from .inference import session as ses
+from .inference import pattern_cache as pc
+from .inference import pattern_table as pt
+from .inference import grid
+from .inference.grid import NEIGHBOR_POSITION
+
+
+INFERENCE_BACKENDS = ('variable_elimination', 'enumeration', 'gibbs_sampling')
+
+# Método de las probabilidades aproximadas (el mismo nombre que en
+# "variable_elimination.py" y "enumeration.py")
+APPROXIMATE_PATH = 'loopy_belief_propagation'
+
+# Diferencia máxima entre dos probabilidades para considerarlas iguales
+PROBABILITY_TOLERANCE = 1e-9
+
+
+# "model" permite usar otra representación de la red (por ejemplo
+# "grid.GridModel") en lugar de la red bayesiana completa. Con
+# max_factor_size=None se usa el límite por defecto de la eliminación de
+# variables.
+#
+# Los motores de inferencia (y pgmpy, que tarda en importarse más que todo
+# lo demás) solo se importan al crear el primero, por lo que importar este
+# módulo no los carga.
+def create_inference(backend, height, width, num_of_mines,
+                     max_factor_size=None, model=None):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError('Unknown inference backend: {0}'.format(backend))
+
+    if model is None:
+        from .inference import bayesian_network as bn
+        model = bn.generate_BN(height, width, num_of_mines)
+
+    if backend == 'variable_elimination':
+        from .inference import variable_elimination as ve
+        if max_factor_size is None:
+            return ve.VariableElimination(model)
+        return ve.VariableElimination(model, max_factor_size=max_factor_size)
+    elif backend == 'enumeration':
+        from .inference import enumeration as enum
+        return enum.Enumeration(model, num_of_mines)
+    else:
+        from .inference import gibbs_sampling as gs
+        return gs.GibbsSampling(model, num_of_mines)
+
+
+# Primera casilla (en orden de fila y columna) con mayor probabilidad de no
+# contener una mina ("prob_X": casilla ==> probabilidad). Las probabilidades
+# que solo se diferencian por errores de redondeo se consideran iguales,
+# para que la casilla elegida no dependa del orden en el que se han
+# calculado.
+def choose_square(prob_X):
+    best = max(prob_X.values())
+    return min(pos for pos, prob in prob_X.items()
+               if prob >= best - PROBABILITY_TOLERANCE)
+
+
+# Nombre de la caché de patrones compartida por las partidas que pueden
+# reutilizar los resultados de las demás. La enumeración y el muestreo no
+# dependen de la probabilidad a priori de las X, por lo que cada uno comparte
+# una única caché. En la eliminación de variables, "max_factor_size" decide
+# qué componentes se calculan de forma aproximada, por lo que los motores
+# con límites distintos no comparten caché (None es el límite por defecto).
+def pattern_cache_name(backend, height, width, num_of_mines,
+                       max_factor_size=None):
+    if backend in ('enumeration', 'gibbs_sampling'):
+        return backend
+    return '{0}:{1}:{2}'.format(backend, num_of_mines/(height*width),
+                                max_factor_size)
+
+
+# Lógica del tablero sin ninguna dependencia de PyQt5. Todo el estado de la
+# partida se guarda en arrays de NumPy de tamaño (height, width):
+#   - mines: True si la casilla contiene una mina.
+#   - neighbor_mines: número de minas vecinas de cada casilla.
+#   - hidden: True si la casilla aún no ha sido revelada.
+#   - flagged: True si la casilla tiene una bandera.
+#
+# La ventana de "board.py" se limita a mostrar este estado, por lo que el
+# motor puede usarse directamente (por ejemplo en los tests) para resolver
+# partidas sin crear una QApplication ni ningún widget.
+#
+# Las probabilidades de las sugerencias se calculan con uno de los motores de
+# inferencia de "INFERENCE_BACKENDS":
+#   - 'variable_elimination': eliminación de variables sobre la red bayesiana.
+#   - 'enumeration': enumeración exacta de las configuraciones de la frontera
+#     teniendo en cuenta el número total de minas del tablero.
+#   - 'gibbs_sampling': estimación por muestreo (Gibbs por bloques) que
+#     también tiene en cuenta el número total de minas, para tableros
+#     demasiado grandes para los motores exactos.
+#
+# La colocación de las minas se puede fijar para reproducir una partida:
+#   - seed: semilla del generador de números aleatorios.
+#   - rng: generador ("random.Random") que se usa en lugar de crear uno.
+#   - mine_positions: lista de posiciones (i,j) de las minas, que se usa en
+#     lugar de colocarlas aleatoriamente (por ejemplo al cargar una
+#     repetición de "replay.py").
+# Sin ninguno de ellos, las minas se colocan de forma aleatoria.
+#
+# Con backend=None no se crea ningún motor de inferencia: las sugerencias
+# probabilísticas quedan siempre pendientes ("suggested_pos" es None) para
+# que las calcule quien usa el motor (ver "selfplay.play_batched_games").
+#
+# Con "sink" (ver "inference/instrumentation.py") se registran los datos de
+# cada sugerencia y de cada consulta del motor de inferencia.
+#
+# Con la eliminación de variables, "pattern_table" (ruta de una tabla de
+# "inference/pattern_table.py" con la densidad de minas del tablero) hace que
+# las componentes de la frontera que aparecen en la tabla se respondan con
+# sus probabilidades precalculadas, sin inferencia.
+#
+# Con la eliminación de variables, "max_factor_size" limita el tamaño de los
+# factores intermedios: las componentes de la frontera que lo superarían se
+# calculan de forma aproximada con propagación de creencias. El método con
+# el que se ha calculado cada sugerencia se guarda en "answered_by".
+#
+# El resto de métodos acceden al tablero a través de "is_mine", "is_hidden"
+# y "get_neighbor_mines", por lo que otra representación del tablero (ver
+# "sparse_engine.py") solo tiene que redefinir esos métodos, "init_board" y
+# "place_mines".
+#
+# La casilla (0,0) corresponde a la esquina superior izquierda
+# Representación de posición: (i,j) ==> i: fila, j: columna
+class BoardEngine:
+
+    def __init__(self, height, width, num_of_mines,
+                 backend='variable_elimination', seed=None, rng=None,
+                 mine_positions=None, sink=None, max_factor_size=None,
+                 pattern_table=None):
+        self.height = height
+        self.width = width
+        self.num_of_mines = num_of_mines
+        self.backend = backend
+        self.seed = seed
+        self.rng = rng if rng is not None else random.Random(seed)
+        self.evidences = {}
+        self.suggested_pos = (0, 0)
+        self.lost = False
+        # Casillas elegidas por el jugador y tiempo total de inferencia
+        self.moves = 0
+        self.inference_time = 0.0
+        # Métodos con los que se ha calculado la última sugerencia y número
+        # de sugerencias que se han calculado de forma aproximada
+        self.answered_by = []
+        self.approximate_suggestions = 0
+        # Casillas reveladas en cada jugada (una lista por jugada, ya que las
+        # casillas seguras se revelan todas a la vez)
+        self.history = []
+        self.sink = sink
+        self.inference = None
+        self.inference_session = None
+        if pattern_table is not None:
+            pattern_table = pt.get_pattern_table(pattern_table)
+            if backend != 'variable_elimination':
+                raise ValueError('Pattern tables require variable_elimination')
+            if not pattern_table.matches(height, width, num_of_mines):
+                raise ValueError('Pattern table density does not match the board')
+        if backend is not None:
+            self.inference = create_inference(backend, height, width,
+                                              num_of_mines, max_factor_size,
+                                              self.create_model())
+            self.inference.sink = sink
+            self.inference_session = ses.InferenceSession(
+                self.inference, functools.partial(grid.bn_position, width=width),
+                pc.get_pattern_cache(pattern_cache_name(backend, height, width,
+                                                       num_of_mines,
+                                                       max_factor_size)),
+                pattern_table)
+            # La sesión guarda las evidencias de la partida, por lo que no
+            # se duplican
+            self.evidences = self.inference_session.evidence
+        self.constraint_propagation = cp.ConstraintPropagation()
+
+        self.init_board()
+        self.place_mines(mine_positions)
+
+    def create_model(self):
+        from .inference import bayesian_network as bn
+        return bn.generate_BN(self.height, self.width, self.num_of_mines)
+
+    def init_board(self):
+        self.mines = np.zeros((self.height, self.width), dtype=bool)
+        self.neighbor_mines = np.zeros((self.height, self.width), dtype=np.int8)
+        self.hidden = np.ones((self.height, self.width), dtype=bool)
+        self.flagged = np.zeros((self.height, self.width), dtype=bool)
+
+    # Coloca las minas en el tablero:
+    #   1.- Se genera un número aleatorio distinto
+    #       por cada mina.
+    #   2.- A cada número aleatorio se le asocia una casilla
+    #       mediante "get_position()".
+    #   3.- Se coloca cada mina en la posición calculada.
+    #   4.- Se calcula "neighbor_mines" de todas las casillas
+    #       a la vez (llamando a "update_neighbors()").
+    # Si se indica "mine_positions", se colocan las minas en esas posiciones.
+    def place_mines(self, mine_positions=None):
+        if mine_positions is None:
+            num_of_squares = self.width * self.height
+            mines = self.rng.sample(range(num_of_squares), self.num_of_mines)
+            mine_positions = [self.get_position(m) for m in mines]
+
+        for (i, j) in mine_positions:
+            self.mines[i, j] = True
+
+        self.update_neighbors()
+
+    # Devuelve la posición (i,j) dado un índice "index":
+    #
+    # +---+---+      Ejemplos con tablero 2x2:
+    # | 0 | 1 |
+    # +---+---+        - index = 0 ==> (0,0)
+    # | 2 | 3 |        - index = 2 ==> (1,0)
+    # +---+---+
+    def get_position(self, index):
+        i = math.floor(index/self.width)
+        j = index - self.width*i
+
+        return (i, j)
+
+    # Suma, para cada casilla, las minas de sus 8 vecinos desplazando
+    # una copia del tablero rodeada por un borde de casillas vacías.
+    def update_neighbors(self):
+        padded = np.pad(self.mines, 1, mode='constant').astype(np.int8)
+        counts = np.zeros((self.height, self.width), dtype=np.int8)
+
+        for di, dj in NEIGHBOR_POSITION:
+            counts += padded[1+di:1+di+self.height, 1+dj:1+dj+self.width]
+
+        self.neighbor_mines = counts
+
+    # Índices (ver "get_position") de las casillas con mina, en orden
+    def get_mine_indices(self):
+        return np.flatnonzero(self.mines).tolist()
+
+    # Tiene en cuenta los límites del tablero
+    def invalid_position(self, i, j):
+        return (j < 0
+                or j >= self.width
+                or i < 0
+                or i >= self.height
+               )
+
+    def is_mine(self, i, j):
+        return bool(self.mines[i, j])
+
+    def is_hidden(self, i, j):
+        return bool(self.hidden[i, j])
+
+    def is_flagged(self, i, j):
+        return bool(self.flagged[i, j])
+
+    def get_neighbor_mines(self, i, j):
+        return int(self.neighbor_mines[i, j])
+
+    def is_end_game(self):
+        revealed_square_count = len(self.evidences)/2
+        board_len = self.width*self.height
+
+        return revealed_square_count == board_len - self.num_of_mines
+
+    def change_flagged_state(self, i, j):
+        self.flagged[i, j] = not self.flagged[i, j]
+
+    def reveal_all_board(self):
+        self.hidden[:, :] = False
+
+    # Revela la casilla (i,j) y devuelve la lista de casillas
+    # que han pasado a estar visibles. Si la partida termina
+    # (por victoria o derrota) no se sugiere ninguna casilla.
+    # Con suggest=False no se calcula la sugerencia probabilística (ver
+    # "update_suggestion").
+    def reveal(self, i, j, suggest=True):
+        if self.is_mine(i, j):
+            self.moves += 1
+            self.history.append([(i, j)])
+            self.reveal_all_board()
+            self.lost = True
+            self.suggested_pos = False
+            return [(i, j)]
+
+        return self.reveal_squares([(i, j)], suggest)
+
+    # Revela de una vez todas las casillas de "squares" (ninguna debe
+    # contener una mina) y calcula la siguiente sugerencia. Devuelve la
+    # lista de casillas que han pasado a estar visibles.
+    def reveal_squares(self, squares, suggest=True):
+        self.moves += len(squares)
+        self.history.append(list(squares))
+        revealed = []
+        for (i, j) in squares:
+            self.reveal_information(i, j, revealed)
+
+        self.add_evidences(revealed)
+        self.update_constraints(revealed)
+        self.update_suggestion(suggest)
+
+        return revealed
+
+    # Revela todas las casillas que se sabe seguro que no tienen mina
+    def reveal_safe_squares(self, suggest=True):
+        return self.reveal_squares(sorted(self.constraint_propagation.safe),
+                                   suggest)
+
+    # Calcula la siguiente sugerencia: False si la partida ha terminado, la
+    # primera casilla segura si la hay o, si no, la casilla con mayor
+    # probabilidad de no tener mina. Con suggest=False este último cálculo
+    # se deja pendiente ("suggested_pos" pasa a ser None) para hacerlo más
+    # tarde, por ejemplo en otro hilo, llamando de nuevo a este método.
+    def update_suggestion(self, suggest=True):
+        if self.is_end_game():
+            self.reveal_all_board()
+            self.suggested_pos = False
+        elif self.constraint_propagation.safe:
+            self.suggested_pos = min(self.constraint_propagation.safe)
+        elif suggest and self.inference is not None:
+            self.suggested_pos = self.suggest_next_square()
+        else:
+            self.suggested_pos = None
+
+    # Añade las restricciones de las casillas recién reveladas y propaga las
+    # reglas deterministas. Solo se revisan las restricciones afectadas por
+    # las nuevas casillas.
+    def update_constraints(self, revealed):
+        for sq in revealed:
+            self.constraint_propagation.remove_square(sq)
+
+        for (i, j) in revealed:
+            hidden_neighbors = [n for n in self.get_neighbors(i, j)
+                                if self.is_hidden(*n)]
+            if hidden_neighbors:
+                self.constraint_propagation.add_constraint(
+                    (i, j), hidden_neighbors, self.get_neighbor_mines(i, j))
+
+        self.constraint_propagation.propagate()
+
+    # P=(i,j): casilla que se encuentra en las coordenadas (i,j)
+    # del tablero. Debe mostrar la información de aquellas
+    # casillas vecinas hasta que se topa con una cuya Y>=1.
+    # Las casillas reveladas se añaden a "revealed"; sus evidencias se
+    # añaden después, todas a la vez, con "add_evidences".
+    def reveal_information(self, i, j, revealed):
+        region = self.get_opened_region(i, j)
+        if region:
+            self.set_revealed(region)
+            revealed.extend(region)
+
+    # Casillas que se revelan al elegir (i,j): la propia casilla y, si no
+    # tiene minas vecinas, la zona que se abre a partir de ella. Se recorre
+    # en anchura con una cola (y no con recursión, que supera el límite de
+    # Python en zonas grandes), y cada casilla se visita una sola vez.
+    # Flood fill algorithm: https://en.wikipedia.org/wiki/Flood_fill
+    def get_opened_region(self, i, j):
+        if (self.invalid_position(i, j) or self.is_mine(i, j)
+                or not self.is_hidden(i, j)):
+            return []
+
+        region = [(i, j)]
+        visited = {(i, j)}
+        queue = collections.deque(region)
+        while queue:
+            i, j = queue.popleft()
+            if self.get_neighbor_mines(i, j) == 0:
+                for n in self.get_neighbors(i, j):
+                    if n not in visited and self.is_hidden(*n):
+                        visited.add(n)
+                        region.append(n)
+                        queue.append(n)
+
+        return region
+
+    def set_revealed(self, squares):
+        rows, cols = zip(*squares)
+        self.hidden[rows, cols] = False
+
+    def add_evidences(self, squares):
+        delta = {}
+        for (i, j) in squares:
+            delta[grid.bn_X_name(i, j, self.width)] = int(self.is_mine(i, j))
+            delta[grid.bn_Y_name(i, j, self.width)] = self.get_neighbor_mines(i, j)
+
+        if self.inference_session is not None:
+            self.inference_session.add_evidence(delta)
+        else:
+            self.evidences.update(delta)
+
+    def suggest_next_square(self):
+        return choose_square(self.get_square_probabilities())
+
+    # Probabilidad de no contener una mina de cada casilla oculta (casilla
+    # ==> probabilidad), calculada con el motor de inferencia
+    def get_square_probabilities(self):
+        from .inference import bayesian_network as bn
+        start = time.perf_counter()
+        components, interior = self.get_frontier_components()
+        num_of_interior = self.count_interior_squares(interior)
+        frontier_time = time.perf_counter()
+        hits = self.inference_session.hits
+        table_hits = self.inference_session.table_hits
+        # Las evidencias ya se han añadido a la sesión en "add_evidences"
+        prob_X = bn.calcule_prob_frontier(self.inference_session, components,
+                                          interior, None,
+                                          self.width, num_of_interior)
+        end = time.perf_counter()
+        self.inference_time += end - start
+
+        paths = getattr(self.inference, 'paths', None)
+        self.answered_by = sorted(set(paths.values())) if paths else [self.backend]
+        if APPROXIMATE_PATH in self.answered_by:
+            self.approximate_suggestions += 1
+
+        if self.sink is not None:
+            self.sink.emit({'event': 'suggest',
+                            'move': self.moves,
+                            'components': [len(squares) for squares, border
+                                           in components],
+                            'interior': num_of_interior,
+                            'cached_components': self.inference_session.hits - hits,
+                            'table_components': (self.inference_session.table_hits
+                                                 - table_hits),
+                            'answered_by': self.answered_by,
+                            'frontier_time': frontier_time - start,
+                            'inference_time': end - frontier_time,
+                            'time': end - start})
+
+        return prob_X
+
+    def get_neighbors(self, i, j):
+        return [(i + di, j + dj) for (di, dj) in NEIGHBOR_POSITION
+                if not self.invalid_position(i + di, j + dj)]
+
+    # Máscara de las casillas ocultas con al menos un vecino revelado.
+    # Solo estas casillas ("frontera") aparecen en alguna evidencia Y.
+    def get_frontier_mask(self):
+        padded = np.pad(~self.hidden, 1, mode='constant')
+        near_revealed = np.zeros((self.height, self.width), dtype=bool)
+
+        for di, dj in NEIGHBOR_POSITION:
+            near_revealed |= padded[1+di:1+di+self.height, 1+dj:1+dj+self.width]
+
+        return self.hidden & near_revealed
+
+    # Divide las casillas ocultas en:
+    #   - components: componentes conexas de la frontera. Dos casillas de la 
+    #     frontera están conectadas si comparten un vecino revelado. Cada 
+    #     componente es una dupla (casillas ocultas, casillas reveladas que 
+    #     las rodean) y es independiente del resto de componentes.
+    #   - interior: casillas ocultas sin vecinos revelados. Ninguna evidencia
+    #     les afecta, por lo que todas tienen la misma probabilidad.
+    def get_frontier_components(self):
+        frontier = self.get_frontier_mask()
+        rows, cols = np.nonzero(frontier)
+        pending = set(zip(rows.tolist(), cols.tolist()))
+        components = []
+
+        while pending:
+            start = pending.pop()
+            squares = [start]
+            border = set()
+            queue = [start]
+            while queue:
+                i, j = queue.pop()
+                for (ri, rj) in self.get_neighbors(i, j):
+                    if self.hidden[ri, rj] or (ri, rj) in border:
+                        continue
+                    border.add((ri, rj))
+                    for n in self.get_neighbors(ri, rj):
+                        if n in pending:
+                            pending.remove(n)
+                            squares.append(n)
+                            queue.append(n)
+            components.append((squares, sorted(border)))
+
+        rows, cols = np.nonzero(self.hidden & ~frontier)
+        interior = list(zip(rows.tolist(), cols.tolist()))
+
+        return components, interior
+
+    # Número de casillas del interior ("interior" es la lista que devuelve
+    # "get_frontier_components")
+    def count_interior_squares(self, interior):
+        return len(interior)
+
+    def get_hidden_squares(self):
+        rows, cols = np.nonzero(self.hidden)
+
+        return set(zip(rows.tolist(), cols.tolist()))
+
+    # Resuelve automáticamente el tablero sin mostrar nada por pantalla.
+    # Las casillas que se sabe seguro que no tienen mina se revelan todas a 
+    # la vez, y solo se recurre a la sugerencia probabilística cuando no hay
+    # ninguna. Devuelve True si se ha ganado la partida.
+    def play_game(self):
+        while(self.suggested_pos):
+            if self.constraint_propagation.safe:
+                self.reveal_safe_squares()
+            else:
+                i = self.suggested_pos[0]
+                j = self.suggested_pos[1]
+                self.reveal(i, j)
+
+        return self.is_end_game()
+
+    def __str__(self):
+        res = ''
+
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.is_hidden(i, j):
+                    res += '_ '
+                elif self.is_mine(i, j):
+                    res += '* '
+                else:
+                    res += '{} '.format(self.get_neighbor_mines(i, j))
+            res += '\n'
+
+        return res
@@ -0,0 +1,183 @@
+import numpy as np
+
+from . import grid
+from .grid import NEIGHBOR_POSITION
+
+
+# Límite de los mensajes (en escala logarítmica, log(q/(1-q))) para que las
+# restricciones que fijan el valor de una variable no den lugar a infinitos
+MAX_LOG_ODDS = 30.0
+
+
+# Propagación de creencias con bucles (ver "belief_propagation.py") para
+# muchas partidas a la vez del mismo tamaño de tablero y número de minas.
+#
+# La estructura de la red es la misma en todas las partidas: cada casilla
+# tiene una restricción (su evidencia Y) sobre sus 8 vecinos, que solo está
+# activa en las partidas en las que la casilla se ha revelado. Por eso todos
+# los mensajes se guardan en arrays con las partidas en el primer eje:
+#   - q[g, c, k]: probabilidad de mina que la restricción de la casilla c
+#     recibe de su k-ésimo vecino en la partida g.
+#   - messages[g, c, k]: mensaje de la restricción c a su k-ésimo vecino,
+#     como log(P(mina)/P(sin mina)).
+# y cada iteración actualiza todas las restricciones de todas las partidas
+# con operaciones de NumPy, sin ningún bucle por partida ni por casilla.
+#
+# Las casillas de fuera del tablero se sustituyen por una casilla ficticia
+# (índice height*width) que nunca tiene mina y cuya restricción nunca está
+# activa.
+#
+# A diferencia de la eliminación de variables, el resultado es aproximado
+# cuando la frontera tiene ciclos, y tiene en cuenta la probabilidad a priori
+# de la red (num_of_mines/size), no el número total de minas.
+class BatchedBeliefPropagation:
+
+    def __init__(self, height, width, num_of_mines, max_iterations=200,
+                 tolerance=1e-6, damping=0.5):
+        self.height = height
+        self.width = width
+        self.num_of_mines = num_of_mines
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.damping = damping
+        self.log_prior = logit(num_of_mines/(height*width))
+        self.neighbors = neighbor_table(height, width)
+        # Iteraciones y convergencia de cada partida en la última consulta
+        self.iterations = 0
+        self.converged = np.zeros(0, dtype=bool)
+
+    # Devuelve un array (partidas, height*width, 2) con la distribución de la
+    # variable X de cada casilla en cada partida, dadas las evidencias de
+    # cada partida ("evidences", lista de diccionarios {variable: valor} con
+    # los mismos nombres que la red bayesiana).
+    def query(self, evidences):
+        num_of_squares = self.height*self.width
+        known = np.full((len(evidences), num_of_squares + 1), -1, dtype=np.int8)
+        targets = np.zeros((len(evidences), num_of_squares + 1), dtype=np.int8)
+        active = np.zeros((len(evidences), num_of_squares + 1), dtype=bool)
+        known[:, num_of_squares] = 0
+        for g, evidence in enumerate(evidences):
+            for var, value in evidence.items():
+                index = (var - 1) // 2
+                if grid.is_Y_variable(var):
+                    targets[g, index] = value
+                    active[g, index] = True
+                else:
+                    known[g, index] = value
+
+        # Las minas ya conocidas se descuentan del valor de la restricción,
+        # y las restricciones sin variables ocultas no aportan nada
+        neighbor_known = known[:, self.neighbors]
+        targets = targets - np.sum(neighbor_known == 1, axis=2)
+        active &= np.any(neighbor_known == -1, axis=2)
+
+        # Solo se calculan las restricciones activas en alguna partida, y
+        # solo en las partidas que todavía no han convergido
+        constraints = np.flatnonzero(np.any(active, axis=0))
+        neighbors = self.neighbors[constraints]
+        neighbor_known = neighbor_known[:, constraints]
+        targets = targets[:, constraints]
+        active = active[:, constraints]
+
+        opposite = len(NEIGHBOR_POSITION) - 1 - np.arange(len(NEIGHBOR_POSITION))
+        messages = np.zeros((len(evidences), num_of_squares + 1,
+                             len(NEIGHBOR_POSITION)))
+        self.converged = np.zeros(len(evidences), dtype=bool)
+        for iteration in range(self.max_iterations):
+            running = np.flatnonzero(~self.converged)
+            games = running[:, None]
+
+            # Mensaje de cada variable a cada restricción: su probabilidad a
+            # priori por los mensajes del resto de restricciones (o su valor,
+            # si tiene evidencia X). Los mensajes que recibe la variable de
+            # cada dirección son los de la restricción del vecino en esa
+            # dirección, en la posición opuesta.
+            old_messages = messages[games, constraints]
+            beliefs = (self.log_prior
+                       + messages[running][:, self.neighbors, opposite].sum(axis=2))
+            q = sigmoid(beliefs[:, neighbors] - old_messages)
+            q = np.where(neighbor_known[running] == -1, q, neighbor_known[running])
+
+            new_messages = np.where(active[running][:, :, None],
+                                    constraint_messages(q, targets[running]), 0.0)
+            new_messages = (self.damping*old_messages
+                            + (1 - self.damping)*new_messages)
+            messages[games, constraints] = new_messages
+
+            change = np.max(np.abs(sigmoid(new_messages) - sigmoid(old_messages)),
+                            axis=(1, 2))
+            self.converged[running] = change < self.tolerance
+            self.iterations = iteration + 1
+            if np.all(self.converged):
+                break
+
+        beliefs = self.log_prior + messages[:, self.neighbors, opposite].sum(axis=2)
+        p = np.where(known == -1, sigmoid(beliefs), known)[:, :num_of_squares]
+
+        return np.stack([1 - p, p], axis=2)
+
+
+# Índice de la casilla de cada uno de los 8 vecinos de cada casilla (las
+# casillas de fuera del tablero pasan a ser la casilla ficticia
+# height*width). La casilla ficticia es vecina de sí misma.
+def neighbor_table(height, width):
+    rows, cols = np.indices((height, width))
+    table = np.full((height*width + 1, len(NEIGHBOR_POSITION)), height*width)
+
+    for k, (di, dj) in enumerate(NEIGHBOR_POSITION):
+        ni = rows + di
+        nj = cols + dj
+        valid = (ni >= 0) & (ni < height) & (nj >= 0) & (nj < width)
+        table[:height*width, k] = np.where(valid, ni*width + nj,
+                                           height*width).flatten()
+
+    return table
+
+
+# Mensajes de las restricciones "suma de las variables = targets" (ver
+# "belief_propagation.constraint_messages") para todas las restricciones a
+# la vez. "q" (..., k) es la probabilidad de mina de cada variable. El
+# mensaje a la variable k depende de la probabilidad de que el resto sume
+# target (sin mina) o target-1 (con mina), que se obtiene combinando:
+#   - prefix[k][..., a]: probabilidad de que las variables 0..k-1 sumen a.
+#   - remaining[k][..., a]: probabilidad de que las variables k..n-1 sumen
+#     target-a.
+# Ambos se calculan añadiendo una variable cada vez, con operaciones
+# elemento a elemento sobre todas las restricciones.
+def constraint_messages(q, targets):
+    num_of_vars = q.shape[-1]
+    shape = q.shape[:-1] + (num_of_vars + 2,)
+    sums = np.arange(num_of_vars + 2)
+
+    prefix = [np.zeros(shape)]
+    prefix[0][..., 0] = 1
+    for k in range(num_of_vars):
+        previous = prefix[-1]
+        current = previous*(1 - q[..., k, None])
+        current[..., 1:] += previous[..., :-1]*q[..., k, None]
+        prefix.append(current)
+
+    remaining = [(sums == targets[..., None]).astype(float)]
+    for k in range(num_of_vars - 1, -1, -1):
+        previous = remaining[-1]
+        current = previous*(1 - q[..., k, None])
+        current[..., :-1] += previous[..., 1:]*q[..., k, None]
+        remaining.append(current)
+    remaining = remaining[::-1]
+
+    messages = np.empty(q.shape)
+    for k in range(num_of_vars):
+        p0 = np.sum(prefix[k][..., :-1]*remaining[k+1][..., :-1], axis=-1)
+        p1 = np.sum(prefix[k][..., :-1]*remaining[k+1][..., 1:], axis=-1)
+        messages[..., k] = (np.log(np.maximum(p1, 1e-300))
+                            - np.log(np.maximum(p0, 1e-300)))
+
+    return np.clip(messages, -MAX_LOG_ODDS, MAX_LOG_ODDS)
+
+
+def logit(p):
+    return np.log(p) - np.log(1 - p)
+
+
+def sigmoid(x):
+    return 1/(1 + np.exp(-x))
@@ -1,144 +1,140 @@
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
 import pgmpy.models as pgmm
 import pgmpy.factors.discrete as pgmf
 
+from . import count_factor as cf
+# La estructura de la red y los nombres de sus variables (que no dependen de
+# pgmpy) están en "grid.py"; se importan aquí para poder seguir usándolos
+# como "bn.bn_X_name", etc.
+from .grid import (NEIGHBOR_POSITION, GridModel, bn_X_name, bn_Y_name,
+                   is_Y_variable, bn_position)
+
+
+# Número máximo de redes guardadas en "_cached_networks"
+MAX_CACHED_NETWORKS = 8
+
+# (height, width, num_of_mines) ==> red bayesiana ya construida, en orden de
+# uso (la última, la usada más recientemente)
+_cached_networks = OrderedDict()
+
+
+# Red bayesiana del buscaminas. La red de cada tamaño de tablero se construye
+# una sola vez y se comparte entre todas sus partidas, por lo que:
+#   - Las CPDs se guardan también en un diccionario indexado por variable,
+#     ya que "BayesianModel.get_cpds" las busca recorriendo toda la lista.
+#   - "check_model" (que se llama cada vez que se crea un motor de
+#     inferencia) solo valida la red la primera vez.
+class MinesweeperModel(pgmm.BayesianModel):
+
+    def __init__(self):
+        super().__init__()
+        self.cpds_by_node = {}
+        self.checked = False
+
+    # Sustituye todas las CPDs de la red de una vez (sin las comprobaciones
+    # de "add_cpds", que recorre la lista de CPDs por cada una que se añade)
+    def set_cpds(self, cpds):
+        self.cpds = list(cpds)
+        self.cpds_by_node = {cpd.variable: cpd for cpd in self.cpds}
+        self.checked = False
+
+    def get_cpds(self, node=None):
+        if node is None:
+            return self.cpds
+        return self.cpds_by_node.get(node)
+
+    def check_model(self):
+        if not self.checked:
+            super().check_model()
+            self.checked = True
+
+        return True
 
+
+# La red no se modifica durante la inferencia, por lo que empezar una nueva
+# partida con el mismo tamaño y número de minas no vuelve a construirla. Se
+# guardan como mucho "MAX_CACHED_NETWORKS" redes: al superarlas se descarta
+# la usada hace más tiempo, para que un proceso que atiende configuraciones
+# distintas (ver "server.py") no acumule redes indefinidamente.
 def generate_BN(height, width, num_of_mines):
-    DAG = generate_DAG(height, width)
-    
-    createCPDs(DAG, height, width, num_of_mines)
-    
-    return DAG
+    key = (height, width, num_of_mines)
 
+    if key not in _cached_networks:
+        DAG = generate_DAG(height, width)
+        createCPDs(DAG, height, width, num_of_mines)
+        _cached_networks[key] = DAG
+        if len(_cached_networks) > MAX_CACHED_NETWORKS:
+            _cached_networks.popitem(last=False)
+    _cached_networks.move_to_end(key)
 
-def generate_DAG(height, width):            
-    n = height
-    m = width
-    modelo_buscaminas = pgmm.BayesianModel()
-    
-    for i in range(1,n+1):
-        for j in range(1,m+1):
-            if i==1:
-                if j==1:
-                    # El vértice Y11 siempre tiene los mismos
-                    # vecinos: X21, X22 y X12
-                    modelo_buscaminas.add_edges_from([('X21', 'Y11'),
-                                                      ('X22', 'Y11'),
-                                                      ('X12', 'Y11')])
-                elif j==m:
-                    # El vértice Y1,m posee siempre los mismos
-                    # vecinos: X1,m-1 y X2,m y X2,m-1:
-                    modelo_buscaminas.add_edges_from([('X1'+str(m-1), 'Y1'+str(m)),
-                                                      ('X2'+str(m), 'Y1'+str(m)),
-                                                      ('X2'+str(m-1), 'Y1'+str(m))])
-                else:
-                    # Se añaden las aristas correspondientes a
-                    # los vértices Y1,j donde se cumple que 1<j<m
-                    modelo_buscaminas.add_edges_from([('X'+str(i)+str(j-1), 'Y1'+str(j)),
-                                                      ('X'+str(i)+str(j+1), 'Y1'+str(j)),
-                                                      ('X'+str(i+1)+str(j-1), 'Y1'+str(j)),
-                                                      ('X'+str(i+1)+str(j), 'Y1'+str(j)),
-                                                      ('X'+str(i+1)+str(j+1), 'Y1'+str(j))])
-            elif i==n:
-                if j==1:
-                    # El vértice Yn,1 posee 3 vecinos que son:
-                    # Xn,2, Xn-1,1 y Xn-1,2:
-                    modelo_buscaminas.add_edges_from([('X'+str(n)+str(2), 'Y'+str(n)+str(1)),
-                                                      ('X'+str(n-1)+str(1), 'Y'+str(n)+str(1)),
-                                                      ('X'+str(n-1)+str(2), 'Y'+str(n)+str(1))])
-                elif j==m:
-                    # El vértice Yn,m posee como vecinos los
-                    # siguientes vértices: Xn,m-1, Xn-1,m y Xn-1,m-1
-                    modelo_buscaminas.add_edges_from([('X'+str(n)+str(m-1), 'Y'+str(n)+str(m)),
-                                                      ('X'+str(n-1)+str(m), 'Y'+str(n)+str(m)),
-                                                      ('X'+str(n-1)+str(m-1), 'Y'+str(n)+str(m))])
-                else:
-                    # Los vecinos de los vértices Yn,j en los que
-                    # 1<j<m son: Xn,j-1, Xn,j+1, Xn-1,j-1, Xn-1,j y Xn-1,j+1
-                    modelo_buscaminas.add_edges_from([('X'+str(n)+str(j-1), 'Y'+str(n)+str(j)),
-                                                      ('X'+str(n)+str(j+1), 'Y'+str(n)+str(j)),
-                                                      ('X'+str(n-1)+str(j-1), 'Y'+str(n)+str(j)),
-                                                      ('X'+str(n-1)+str(j), 'Y'+str(n)+str(j)),
-                                                      ('X'+str(n-1)+str(j+1), 'Y'+str(n)+str(j))])  
-            else:
-                # En esta rama, añadiremos las aristas de
-                # aquellos vértices Yi,j siendo 1<i<m. 
-                if j==1:
-                    # Subrama 1: se añaden las aristas para los
-                    # vértices Yi,1 y sus correspondientes vecinos
-                    modelo_buscaminas.add_edges_from([('X'+str(i)+str(2), 'Y'+str(i)+str(1)),
-                                                      ('X'+str(i+1)+str(1), 'Y'+str(i)+str(1)),
-                                                      ('X'+str(i+1)+str(2), 'Y'+str(i)+str(1)),
-                                                      ('X'+str(i-1)+str(1), 'Y'+str(i)+str(1)),
-                                                      ('X'+str(i-1)+str(2), 'Y'+str(i)+str(1))])
-                elif j==m:
-                    # Subrama 2: se añaden las aristas para los
-                    # vértices Yi,m y sus correspondientes vecinos
-                    modelo_buscaminas.add_edges_from([('X'+str(i)+str(m-1), 'Y'+str(i)+str(m)),
-                                                      ('X'+str(i+1)+str(m), 'Y'+str(i)+str(m)),
-                                                      ('X'+str(i+1)+str(m-1), 'Y'+str(i)+str(m)),
-                                                      ('X'+str(i-1)+str(m), 'Y'+str(i)+str(m)),
-                                                      ('X'+str(i-1)+str(m-1), 'Y'+str(i)+str(m))])
-                else:
-                    # Subrama 3: se añaden las aristas para los
-                    # vértices Yi,j donde 1<j<m y sus correspondientes vecinos
-                    modelo_buscaminas.add_edges_from([('X'+str(i)+str(j+1), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i)+str(j-1), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i+1)+str(j-1), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i+1)+str(j), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i+1)+str(j+1), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i-1)+str(j-1), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i-1)+str(j), 'Y'+str(i)+str(j)),
-                                                      ('X'+str(i-1)+str(j+1), 'Y'+str(i)+str(j))])         
-    
-    return modelo_buscaminas
-    
+    return _cached_networks[key]
 
-# Calcula la probabilidad de Y = y dados los valores de las
-# variables X vecinas (codificadas en "comb") como evidencia:
-#     - 1.0: Si y == número de variables X con valor 1
-#     - 0.0: Si y != número de variables X con valor 1
-def prob_Y(y, comb):
-    comb = format(comb, 'b')
-    one_count = comb.count('1')
-    
-    return float(y == one_count)
+
+# Cada variable Yi,j tiene como padres las variables X de las casillas
+# vecinas de (i,j). Los vecinos se calculan para todas las casillas a la vez
+# desplazando las matrices de filas y columnas con cada dupla de
+# "NEIGHBOR_POSITION" y descartando las posiciones que quedan fuera del
+# tablero.
+def generate_DAG(height, width):
+    rows, cols = np.indices((height, width))
+    edges = []
+
+    for di, dj in NEIGHBOR_POSITION:
+        ni = rows + di
+        nj = cols + dj
+        valid = (ni >= 0) & (ni < height) & (nj >= 0) & (nj < width)
+        edges.append(np.stack([bn_X_name(ni[valid], nj[valid], width),
+                               bn_Y_name(rows[valid], cols[valid], width)],
+                              axis=1))
+
+    # Ordenadas por Y y después por X, para que los padres de cada Y
+    # aparezcan siempre en el mismo orden
+    edges = np.concatenate(edges)
+    edges = edges[np.lexsort((edges[:, 0], edges[:, 1]))]
+
+    modelo_buscaminas = MinesweeperModel()
+    modelo_buscaminas.add_nodes_from(range(1, 2*height*width + 1))
+    # Todas las aristas van de una X a una Y, por lo que no pueden formar
+    # ciclos: se añaden sin la comprobación que hace pgmpy en cada arista.
+    nx.DiGraph.add_edges_from(modelo_buscaminas, edges.tolist())
+
+    return modelo_buscaminas
 
 
 def createCPDs(DAG, height, width, num_of_mines):
+    cpds = []
+
     for node in DAG.nodes():
-        if node[0] == 'Y':
-            create_y_CPD(node, DAG)
-        elif node[0] == 'X':
-            create_x_CPD(node, DAG, height, width, num_of_mines)
+        if is_Y_variable(node):
+            cpds.append(create_y_CPD(node, DAG))
+        else:
+            cpds.append(create_x_CPD(node, height, width, num_of_mines))
+
+    DAG.set_cpds(cpds)
+
 
-            
+# La tabla de Y es determinista (Y = número de minas entre sus vecinos),
+# por lo que en la inferencia se usa como un "CountFactor" que solo
+# guarda esa restricción en lugar de la tabla completa.
 def create_y_CPD(node, DAG):
     neighbors = list(DAG.get_parents(node))
-    num_of_states = len(neighbors)+1
-    combinations = 2**len(neighbors)
-    
-    y_CPD = pgmf.TabularCPD(node, num_of_states, 
-                            [[prob_Y(ns, comb) for comb in range(combinations)]
-                                               for ns in range(num_of_states)
-                            ],
-                            neighbors,
-                            [2 for n in neighbors])
-    
-    DAG.add_cpds(y_CPD)
-    
-    
-def create_x_CPD(node, DAG, height, width, num_of_mines):
+
+    return cf.CountCPD(node, neighbors)
+
+
+def create_x_CPD(node, height, width, num_of_mines):
     size = width*height
     prob_X = num_of_mines/size
     prob_no_X = 1 - prob_X
-    
-    x_CPD = pgmf.TabularCPD(node, 2, [[prob_no_X, prob_X]])
-    
-    DAG.add_cpds(x_CPD)
 
-    
-def calcule_prob_X(variable_elimination, i, j, evidences):
-    var_x = bn_X_name(i,j)
+    return pgmf.TabularCPD(node, 2, [[prob_no_X, prob_X]])
+
+
+def calcule_prob_X(variable_elimination, i, j, evidences, width):
+    var_x = bn_X_name(i, j, width)
     
     query = variable_elimination.query([var_x], evidences)
     query_res = query[var_x]
@@ -146,9 +142,45 @@ def calcule_prob_X(variable_elimination, i, j, evidences):
     return query_res.values[0]
 
 
-def bn_X_name(i, j):
-    return 'X' + str(i+1) + str(j+1)
+# Calcula a la vez la probabilidad de que no haya mina en cada una de las
+# casillas "squares" (lista de posiciones (i,j)), con una única pasada de
+# eliminación de variables en lugar de una consulta por casilla.
+def calcule_prob_all_X(variable_elimination, squares, evidences, width):
+    var_names = {bn_X_name(i, j, width): (i, j) for (i, j) in squares}
+
+    query = variable_elimination.query_all(list(var_names), evidences)
+
+    return {var_names[var_x]: query_res.values[0]
+            for var_x, query_res in query.items()}
+
+
+# Calcula la probabilidad de que no haya mina en las casillas ocultas a partir
+# de la descomposición de la frontera del tablero:
+#   - components: lista de duplas (casillas ocultas, casillas reveladas
+#     vecinas). Cada componente es independiente del resto.
+#   - interior: casillas sin vecinos revelados. Todas comparten la misma 
+#     probabilidad.
+#
+# "inference" puede ser cualquier motor de inferencia con el método 
+# "query_components" (eliminación de variables o enumeración) o una sesión
+# de inferencia incremental ("session.InferenceSession").
+#
+# Si se indica "num_of_interior", "interior" puede contener solo algunas de
+# las casillas del interior (por ejemplo una sola, ya que todas tienen la
+# misma probabilidad) y "num_of_interior" es el número total de casillas del
+# interior.
+def calcule_prob_frontier(inference, components, interior, evidences, width,
+                          num_of_interior=None):
+    var_names = {}
+    component_vars = []
+    for squares, border in components:
+        component_vars.append([bn_X_name(i, j, width) for (i, j) in squares])
+        var_names.update({bn_X_name(i, j, width): (i, j) for (i, j) in squares})
+    interior_vars = [bn_X_name(i, j, width) for (i, j) in interior]
+    var_names.update(zip(interior_vars, interior))
 
+    query = inference.query_components(component_vars, interior_vars, evidences,
+                                       num_of_interior)
 
-def bn_Y_name(i, j):
-    return 'Y' + str(i+1) + str(j+1)
\ No newline at end of file
+    return {var_names[var_x]: query_res.values[0]
+            for var_x, query_res in query.items()}
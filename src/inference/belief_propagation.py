@@ -0,0 +1,160 @@
+import numpy as np
+from pgmpy.factors.discrete import DiscreteFactor
+
+
+# Motor de inferencia aproximada: propagación de creencias con bucles
+# (loopy belief propagation) sobre la misma red bayesiana.
+#
+# Cada evidencia Y es una restricción "suma de sus padres X ocultos = minas
+# restantes", y cada variable X oculta tiene su probabilidad a priori. Los
+# mensajes de una restricción a cada una de sus variables se calculan con
+# convoluciones de los mensajes del resto de variables (la distribución de
+# la suma de los demás padres), sin construir la tabla de la restricción, por
+# lo que el coste no depende del tamaño de los factores que generaría la
+# eliminación de variables. A cambio, el resultado es aproximado cuando la
+# frontera tiene ciclos.
+#
+# Se usa como alternativa de "VariableElimination" cuando la eliminación
+# generaría factores demasiado grandes (ver "max_factor_size"), y tiene la
+# misma interfaz ("query", "query_all", "prepare_component").
+#
+# Por defecto cada restricción usa los mensajes que el resto ya han
+# actualizado en la misma iteración, lo que suele converger antes. Con
+# parallel=True todas las restricciones se actualizan a la vez a partir de
+# los mensajes de la iteración anterior, como en
+# "batched_belief_propagation.py". Cuando la frontera tiene ciclos, los dos
+# órdenes pueden converger a soluciones distintas.
+#
+# Con "prior" todas las variables X tienen esa probabilidad a priori de
+# contener una mina, en lugar de la de su CPD, por lo que también puede
+# usarse con modelos sin CPD (ver "grid.GridModel").
+class LoopyBeliefPropagation:
+
+    def __init__(self, model, max_iterations=200, tolerance=1e-8, damping=0.5,
+                 parallel=False, prior=None):
+        self.model = model
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.damping = damping
+        self.parallel = parallel
+        self.prior = prior
+        # Número de iteraciones y convergencia de la última consulta
+        self.iterations = 0
+        self.converged = True
+
+    def query(self, variables, evidence=None):
+        evidence = evidence if evidence else {}
+        hidden = list(variables)
+        for child in evidence:
+            for parent in self.model.get_parents(child):
+                if parent not in evidence and parent not in hidden:
+                    hidden.append(parent)
+
+        beliefs = self.run(hidden, evidence)
+
+        return {var: DiscreteFactor([var], [2], beliefs[k])
+                for k, var in enumerate(hidden) if var in variables}
+
+    def query_all(self, variables, evidence=None):
+        return self.query(variables, evidence)
+
+    # Igual que "VariableElimination.prepare_component": devuelve un array
+    # (len(component), 2) con la distribución de cada variable de la
+    # componente.
+    def prepare_component(self, component, evidence):
+        return self.run(list(component), evidence)
+
+    # Propaga los mensajes entre las variables "variables" y las
+    # restricciones de las evidencias Y que dependen de ellas hasta que
+    # convergen (o hasta "max_iterations") y devuelve las creencias.
+    def run(self, variables, evidence):
+        index = {var: k for k, var in enumerate(variables)}
+        if self.prior is None:
+            priors = np.array([self.model.get_cpds(var).values.flatten()
+                               for var in variables]).reshape(len(variables), 2)
+        else:
+            priors = np.tile([1 - self.prior, self.prior], (len(variables), 1))
+
+        constraints = []
+        children = {child for var in variables
+                    for child in self.model.get_children(var) if child in evidence}
+        for child in sorted(children):
+            parents = list(self.model.get_parents(child))
+            known_mines = sum(1 for p in parents if evidence.get(p) == 1)
+            members = [index[p] for p in parents if p in index]
+            constraints.append((members, evidence[child] - known_mines))
+
+        # messages[c][k]: mensaje de la restricción c a su k-ésima variable
+        messages = [np.ones((len(members), 2)) for members, target in constraints]
+        var_constraints = [[] for var in variables]
+        for c, (members, target) in enumerate(constraints):
+            for k, var in enumerate(members):
+                var_constraints[var].append((c, k))
+
+        self.converged = False
+        for iteration in range(self.max_iterations):
+            change = 0.0
+            previous = list(messages) if self.parallel else messages
+            for c, (members, target) in enumerate(constraints):
+                # Mensaje de cada variable a la restricción: su probabilidad
+                # a priori por los mensajes del resto de restricciones
+                incoming = priors[members].copy()
+                for k, var in enumerate(members):
+                    for other, position in var_constraints[var]:
+                        if other != c:
+                            incoming[k] *= previous[other][position]
+                incoming = normalize(incoming)
+                new_messages = constraint_messages(incoming, target)
+                new_messages = (self.damping*messages[c]
+                                + (1 - self.damping)*new_messages)
+                change = max(change, np.max(np.abs(new_messages - messages[c])))
+                messages[c] = new_messages
+            self.iterations = iteration + 1
+            if change < self.tolerance:
+                self.converged = True
+                break
+
+        return self.beliefs(priors, messages, var_constraints)
+
+    def beliefs(self, priors, messages, var_constraints):
+        beliefs = priors.copy()
+        for var, incident in enumerate(var_constraints):
+            for c, k in incident:
+                beliefs[var] *= messages[c][k]
+
+        return normalize(beliefs)
+
+
+# Normaliza cada fila de "values" (las filas sin ningún valor positivo pasan
+# a ser uniformes)
+def normalize(values):
+    totals = values.sum(axis=1, keepdims=True)
+    uniform = np.full_like(values, 1/values.shape[1])
+
+    return np.where(totals > 0, values / np.where(totals > 0, totals, 1), uniform)
+
+
+# Mensajes de la restricción "suma de las variables = target" a cada una de
+# sus variables, dados los mensajes "incoming" (k,2) que recibe de ellas. El
+# mensaje a la variable i es, para cada valor s, la probabilidad de que el
+# resto de variables sumen target - s, que se obtiene convolucionando las
+# distribuciones de las demás variables (con prefijos y sufijos para no
+# repetir las convoluciones).
+def constraint_messages(incoming, target):
+    num_of_vars = len(incoming)
+    prefix = [np.ones(1)]
+    for dist in incoming:
+        prefix.append(np.convolve(prefix[-1], dist))
+    suffix = [np.ones(1)]
+    for dist in incoming[::-1]:
+        suffix.append(np.convolve(suffix[-1], dist))
+    suffix = suffix[::-1]
+
+    messages = np.zeros((num_of_vars, 2))
+    for i in range(num_of_vars):
+        others = np.convolve(prefix[i], suffix[i+1])
+        for s in (0, 1):
+            if 0 <= target - s < len(others):
+                messages[i, s] = others[target - s]
+
+    return normalize(messages)
@@ -0,0 +1,112 @@
+# Motor de reglas deterministas que se aplica antes de la inferencia
+# probabilística. Cada casilla revelada con vecinos ocultos es una restricción:
+#
+#     minas entre sus vecinos sin determinar = minas restantes
+#
+# y sobre ellas se aplican dos reglas:
+#   - Regla simple: si las minas restantes son 0, todos los vecinos sin
+#     determinar son seguros; si son tantas como vecinos, todos son minas.
+#   - Regla de subconjuntos: si los vecinos de una restricción A están
+#     contenidos en los de otra B, las casillas de B que no están en A
+#     contienen (minas de B - minas de A) minas, y se aplica la regla simple
+#     sobre ellas.
+#
+# Las restricciones se actualizan de forma incremental: solo se vuelven a
+# revisar las que han cambiado desde la última propagación (las que se
+# acaban de añadir o las que contienen alguna casilla recién determinada),
+# por lo que el coste es proporcional a la parte de la frontera afectada.
+#
+# Las casillas se representan como posiciones (i,j) del tablero.
+class ConstraintPropagation:
+
+    def __init__(self):
+        # casilla revelada ==> [casillas ocultas sin determinar, minas restantes]
+        self.constraints = {}
+        # casilla oculta ==> casillas reveladas cuya restricción la contiene
+        self.squares = {}
+        # casillas ocultas que se sabe seguro que no tienen / tienen mina
+        self.safe = set()
+        self.mines = set()
+        self.pending = set()
+
+    # Añade la restricción de la casilla revelada "cell", cuyas casillas
+    # vecinas ocultas son "neighbors" y cuyo número de minas vecinas es
+    # "value".
+    def add_constraint(self, cell, neighbors, value):
+        unknown = {n for n in neighbors if n not in self.safe and n not in self.mines}
+        value -= sum(1 for n in neighbors if n in self.mines)
+
+        if unknown:
+            self.constraints[cell] = [unknown, value]
+            for sq in unknown:
+                self.squares.setdefault(sq, set()).add(cell)
+            self.pending.add(cell)
+
+    # La casilla "square" se ha revelado (y no tenía mina)
+    def remove_square(self, square):
+        self.safe.discard(square)
+        self.discard_square(square, 0)
+
+    def set_safe(self, square):
+        if square not in self.safe:
+            self.safe.add(square)
+            self.discard_square(square, 0)
+
+    def set_mine(self, square):
+        if square not in self.mines:
+            self.mines.add(square)
+            self.discard_square(square, 1)
+
+    def discard_square(self, square, mine):
+        for cell in self.squares.pop(square, ()):
+            constraint = self.constraints[cell]
+            constraint[0].discard(square)
+            constraint[1] -= mine
+            self.pending.add(cell)
+
+    # Aplica las reglas hasta que no se puede deducir nada más y devuelve
+    # el conjunto de casillas ocultas que se sabe seguro que no tienen mina.
+    def propagate(self):
+        while self.pending:
+            cell = self.pending.pop()
+            if cell not in self.constraints:
+                continue
+
+            unknown, value = self.constraints[cell]
+            if not unknown:
+                del self.constraints[cell]
+            elif not self.apply_rule(unknown, value):
+                self.apply_subset_rule(cell, unknown, value)
+
+        return self.safe
+
+    def apply_rule(self, unknown, value):
+        if value == 0:
+            for sq in list(unknown):
+                self.set_safe(sq)
+            return True
+        elif value == len(unknown):
+            for sq in list(unknown):
+                self.set_mine(sq)
+            return True
+
+        return False
+
+    def apply_subset_rule(self, cell, unknown, value):
+        others = {other for sq in unknown for other in self.squares[sq]}
+        others.discard(cell)
+
+        for other in others:
+            other_unknown, other_value = self.constraints[other]
+            if unknown < other_unknown:
+                applied = self.apply_rule(other_unknown - unknown, other_value - value)
+            elif other_unknown < unknown:
+                applied = self.apply_rule(unknown - other_unknown, value - other_value)
+            else:
+                applied = False
+
+            # Las restricciones modificadas ya están en "pending"
+            if applied:
+                return True
+
+        return False
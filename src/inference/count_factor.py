@@ -0,0 +1,213 @@
+import numpy as np
+
+from pgmpy.factors import factor_product as dense_factor_product
+from pgmpy.factors.discrete import DiscreteFactor, TabularCPD
+
+
+# Devuelve una matriz (2^k, k) con el estado de cada uno de los k padres en
+# cada una de las combinaciones, siguiendo el orden de pgmpy (el primer padre
+# es el bit más significativo).
+def parent_states(k):
+    return (np.arange(2**k)[:, np.newaxis] >> np.arange(k-1, -1, -1)) & 1
+
+
+# CPD de una variable Y = número de minas entre sus padres X. La probabilidad
+# de Y = y dados los valores de las variables X vecinas es:
+#     - 1.0: Si y == número de variables X con valor 1
+#     - 0.0: Si y != número de variables X con valor 1
+#
+# La tabla se construye de forma vectorizada (sin formatear cada combinación
+# como una cadena binaria) y, al pasar a factor, se convierte en un
+# "CountFactor".
+class CountCPD(TabularCPD):
+
+    def __init__(self, variable, parents):
+        num_of_parents = len(parents)
+        ones = parent_states(num_of_parents).sum(axis=1)
+        values = (np.arange(num_of_parents+1)[:, np.newaxis]
+                  == ones[np.newaxis, :]).astype(float)
+
+        super().__init__(variable, num_of_parents+1, values,
+                         parents, [2 for p in parents])
+
+    def to_factor(self):
+        return CountFactor(self.variable, self.variables[1:])
+
+
+# Factor de la restricción "Y = número de minas entre los padres X".
+#
+# En lugar de la tabla densa de tamaño (k+1)x2^k, se guarda:
+#   - parents: las variables X que aún están en el factor.
+#   - count_var: la variable Y (None una vez que Y es evidencia).
+#   - weights: matriz (k,2) con los factores unarios de cada padre que se
+#     han multiplicado con este factor (por ejemplo su probabilidad a priori).
+#   - counts: vector g de longitud k+1, indexado por el número de padres
+#     con valor 1.
+#   - offset: número de padres reducidos con valor 1 mientras Y no era
+#     evidencia.
+#
+# El valor del factor para una asignación (y, x_1..x_k) con s = sum(x_i) es:
+#
+#     prod_i weights[i, x_i] * counts[s] * [y == offset + s]
+#
+# (sin el último término si Y ya es evidencia). Así, reducir una variable es
+# un desplazamiento de "counts" y eliminar un padre es una convolución de
+# "counts" con sus pesos, ambas operaciones vectorizadas y de coste O(k).
+class CountFactor:
+
+    def __init__(self, count_var, parents, weights=None, counts=None,
+                 offset=0, count_card=None):
+        self.count_var = count_var
+        self.parents = list(parents)
+        self.count_card = (count_card if count_card is not None
+                           else len(self.parents)+1)
+        self.weights = (np.array(weights, dtype=float) if weights is not None
+                        else np.ones((len(self.parents), 2)))
+        self.counts = (np.array(counts, dtype=float) if counts is not None
+                       else np.ones(len(self.parents)+1))
+        self.offset = offset
+
+    @property
+    def variables(self):
+        if self.count_var is None:
+            return list(self.parents)
+        return [self.count_var] + self.parents
+
+    @property
+    def cardinality(self):
+        if self.count_var is None:
+            return np.array([2 for p in self.parents])
+        return np.array([self.count_card] + [2 for p in self.parents])
+
+    @property
+    def values(self):
+        return self.to_factor().values
+
+    def scope(self):
+        return self.variables
+
+    def copy(self):
+        return CountFactor(self.count_var, self.parents, self.weights,
+                           self.counts, self.offset, self.count_card)
+
+    def _result(self, inplace):
+        if inplace:
+            return self
+        return self.copy()
+
+    def to_factor(self):
+        num_of_parents = len(self.parents)
+        states = parent_states(num_of_parents)
+        ones = states.sum(axis=1)
+        weight = np.prod(self.weights[np.arange(num_of_parents), states], axis=1)
+        values = self.counts[ones] * weight
+
+        if self.count_var is not None:
+            values = ((np.arange(self.count_card)[:, np.newaxis]
+                       == (self.offset + ones)[np.newaxis, :]) * values)
+
+        return DiscreteFactor(self.variables, self.cardinality, values)
+
+    def reduce(self, values, inplace=True):
+        phi = self._result(inplace)
+
+        for var, state in values:
+            if var == phi.count_var:
+                target = state - phi.offset
+                counts = np.zeros(len(phi.counts))
+                if 0 <= target < len(phi.counts):
+                    counts[target] = phi.counts[target]
+                phi.counts = counts
+                phi.count_var = None
+            else:
+                index = phi.parents.index(var)
+                phi.counts = phi.weights[index, state] * phi.counts[state:len(phi.counts)-1+state]
+                if phi.count_var is not None:
+                    phi.offset += state
+                phi.weights = np.delete(phi.weights, index, axis=0)
+                del phi.parents[index]
+
+        if not inplace:
+            return phi
+
+    def marginalize(self, variables, inplace=True):
+        if self.count_var not in variables and self.count_var is not None:
+            return self.to_factor().marginalize(variables, inplace=False)
+
+        phi = self._result(inplace)
+
+        # Y se elimina antes que sus padres
+        for var in sorted(variables, key=lambda var: var != phi.count_var):
+            if var == phi.count_var:
+                # La suma de [y == offset + s] sobre todos los valores de Y es 1
+                phi.count_var = None
+            else:
+                index = phi.parents.index(var)
+                w_0, w_1 = phi.weights[index]
+                phi.counts = w_0*phi.counts[:-1] + w_1*phi.counts[1:]
+                phi.weights = np.delete(phi.weights, index, axis=0)
+                del phi.parents[index]
+
+        if not inplace:
+            return phi
+
+    def maximize(self, variables, inplace=True):
+        return self.to_factor().maximize(variables, inplace=False)
+
+    # La suma de todos los valores del factor se obtiene eliminando todos
+    # sus padres (varias convoluciones) sin llegar a construir la tabla.
+    def normalize(self, inplace=True):
+        phi = self._result(inplace)
+
+        total = phi.marginalize(phi.variables, inplace=False).counts[0]
+        phi.counts = phi.counts / total
+
+        if not inplace:
+            return phi
+
+    # Multiplica un factor unario sobre uno de los padres dentro de "weights"
+    def absorb(self, factor):
+        var = factor.scope()[0]
+        index = self.parents.index(var)
+        self.weights[index] = self.weights[index] * factor.values
+
+    def __mul__(self, other):
+        return factor_product(self, other)
+
+    def __rmul__(self, other):
+        return factor_product(other, self)
+
+    def __repr__(self):
+        return '<CountFactor representing phi({0}) at {1}>'.format(
+            ', '.join(str(var) for var in self.variables), hex(id(self)))
+
+
+# Producto de factores que mantiene la representación por cuentas siempre que
+# sea posible: los factores unarios sobre un padre de un CountFactor se
+# multiplican en sus pesos. Si después queda más de un factor, los
+# CountFactor se convierten en tablas densas y se usa el producto de pgmpy.
+def factor_product(*factors):
+    count_factors = [f.copy() for f in factors if isinstance(f, CountFactor)]
+    remaining = []
+
+    for factor in factors:
+        if isinstance(factor, CountFactor):
+            continue
+
+        scope = factor.scope()
+        owner = None
+        if len(scope) == 1:
+            owner = next((cf for cf in count_factors if scope[0] in cf.parents),
+                         None)
+        if owner is not None:
+            owner.absorb(factor)
+        else:
+            remaining.append(factor)
+
+    if len(count_factors) == 1 and not remaining:
+        return count_factors[0]
+
+    dense = [cf.to_factor() for cf in count_factors] + remaining
+    if len(dense) == 1:
+        return dense[0]
+    return dense_factor_product(*dense)
@@ -0,0 +1,386 @@
+import math
+import time
+
+import numpy as np
+from pgmpy.factors.discrete import DiscreteFactor
+
+from .belief_propagation import LoopyBeliefPropagation
+
+
+# Número máximo de valores de los arrays de la enumeración de una
+# componente. Las componentes que lo superarían se calculan de forma
+# aproximada con propagación de creencias.
+DEFAULT_MAX_TABLE_SIZE = 2**23
+
+# Método con el que se ha calculado cada componente (el aproximado con el
+# mismo nombre que en "variable_elimination.py")
+EXACT_PATH = 'enumeration'
+APPROXIMATE_PATH = 'loopy_belief_propagation'
+
+
+# Motor de inferencia exacta alternativo a "VariableElimination".
+#
+# La red bayesiana trata cada variable X como independiente, con probabilidad
+# a priori num_of_mines/size, e ignora que el número total de minas es fijo.
+# Este motor sí tiene en cuenta esa restricción global:
+#
+#   1.- Para cada componente de la frontera se enumeran (con backtracking)
+#       todas las configuraciones de minas compatibles con las evidencias Y,
+#       agrupadas por el número de minas k de la configuración.
+#   2.- Cada número total de minas K de la frontera se pondera con el número
+#       de formas de colocar el resto de minas (num_of_mines - K) en las
+#       casillas del interior: C(interior, num_of_mines - K).
+#
+# Las probabilidades obtenidas son las probabilidades exactas dado el tablero,
+# y se devuelven con el mismo formato que las de "VariableElimination". Igual
+# que en "VariableElimination", el método con el que se ha calculado cada
+# variable en la última llamada a "combine_components" se guarda en "paths".
+class Enumeration:
+
+    # Destino de los registros de instrumentación (ver "instrumentation.py")
+    sink = None
+
+    def __init__(self, model, num_of_mines,
+                 max_table_size=DEFAULT_MAX_TABLE_SIZE):
+        self.model = model
+        self.num_of_mines = num_of_mines
+        self.max_table_size = max_table_size
+        self.fallback = LoopyBeliefPropagation(
+            model, prior=num_of_mines / (len(model.nodes()) // 2))
+        self.paths = {}
+        self._x_variables = None
+
+    # Variables X de la red. Solo hacen falta para "query" (que no recibe las
+    # componentes), por lo que se calculan la primera vez que se usan y no al
+    # crear el motor (en tableros enormes serían millones de variables).
+    @property
+    def x_variables(self):
+        if self._x_variables is None:
+            self._x_variables = [node for node in self.model.nodes()
+                                 if not list(self.model.get_parents(node))]
+        return self._x_variables
+
+    # Número de variables X de las evidencias que tienen mina
+    def known_mines(self, evidence):
+        return sum(1 for var, value in evidence.items()
+                   if value == 1 and not list(self.model.get_parents(var)))
+
+    def query(self, variables, evidence=None):
+        components, interior = self.get_components(evidence)
+        query_var_factor = self.query_components(components, interior, evidence)
+
+        return {var: query_var_factor[var] for var in variables}
+
+    def query_all(self, variables, evidence=None):
+        return self.query(variables, evidence)
+
+    # Agrupa las variables X ocultas en componentes conexas (dos variables
+    # están conectadas si son padres de una misma evidencia Y) y en variables
+    # del interior (no son padres de ninguna evidencia Y).
+    def get_components(self, evidence=None):
+        evidence = evidence if evidence else {}
+        hidden = [var for var in self.x_variables if var not in evidence]
+        neighbors = {var: set() for var in hidden}
+
+        for var in evidence:
+            parents = [p for p in self.model.get_parents(var) if p in neighbors]
+            for p in parents:
+                neighbors[p].update(parents)
+
+        components = []
+        interior = []
+        visited = set()
+        for var in hidden:
+            if var in visited:
+                continue
+            if not neighbors[var]:
+                interior.append(var)
+                continue
+            component = []
+            queue = [var]
+            visited.add(var)
+            while queue:
+                current = queue.pop(0)
+                component.append(current)
+                for n in neighbors[current] - visited:
+                    visited.add(n)
+                    queue.append(n)
+            components.append(component)
+
+        return components, interior
+
+    def query_components(self, components, interior, evidence=None,
+                         num_of_interior=None):
+        evidence = evidence if evidence else {}
+        prepared = [(component, self.prepare_component(component, evidence))
+                    for component in components]
+
+        return self.combine_components(prepared, interior, evidence,
+                                       num_of_interior)
+
+    # La enumeración de cada componente solo depende de sus evidencias Y,
+    # por lo que puede reutilizarse mientras no cambien. La restricción
+    # global del número de minas se aplica al combinarlas, con
+    # "num_of_interior" casillas en el interior (por defecto, len(interior);
+    # "interior" puede contener solo algunas de ellas, ya que todas tienen
+    # la misma probabilidad). "known_mines" es el número de minas de las
+    # evidencias (por defecto, se cuentan en "evidence").
+    def prepare_component(self, component, evidence):
+        return self.enumerate_component(component, evidence)
+
+    def combine_components(self, prepared, interior, evidence,
+                           num_of_interior=None, known_mines=None):
+        if known_mines is None:
+            known_mines = self.known_mines(evidence)
+        remaining_mines = self.num_of_mines - known_mines
+        if num_of_interior is None:
+            num_of_interior = len(interior)
+
+        components = [component for component, table in prepared]
+        tables = [table for component, table in prepared]
+        counts = [table[0] for table in tables]
+        self.paths = {var: table[2] for component, table in prepared
+                      for var in component}
+
+        # Peso de cada número total de minas K en la frontera:
+        # C(interior, remaining_mines - K), en escala logarítmica para evitar
+        # desbordamientos.
+        num_of_frontier = sum(len(component) for component in components)
+        log_weights = np.array([log_combinations(num_of_interior, remaining_mines - K)
+                                for K in range(num_of_frontier + 1)])
+        if np.all(np.isinf(log_weights)):
+            raise ValueError('Evidence is not consistent with the number of mines')
+        weights = np.exp(log_weights - np.max(log_weights))
+
+        # prefix[c]: distribución del número de minas en las componentes
+        # anteriores a c.
+        # suffix_weights[c][t]: peso total de las configuraciones de las
+        # componentes posteriores a c cuando las anteriores (y c) tienen t
+        # minas, es decir, la distribución de las posteriores correlada con
+        # los pesos. Se calcula hacia atrás correlando cada vez con una
+        # componente, por lo que el coste total es O(frontera²) y no
+        # O(componentes x frontera²).
+        prefix = [np.ones(1)]
+        for c in counts:
+            prefix.append(np.convolve(prefix[-1], c))
+        suffix_weights = [weights]
+        for c in reversed(counts):
+            suffix_weights.append(np.correlate(suffix_weights[-1], c, 'valid'))
+        suffix_weights = suffix_weights[::-1]
+
+        total = prefix[-1]
+        normalization = np.dot(total, weights)
+        if normalization == 0:
+            raise ValueError('Evidence is not consistent with the number of mines')
+
+        query_var_factor = {}
+        for index, component in enumerate(components):
+            component_counts, component_sums, path = tables[index]
+            if component_sums.ndim == 1:
+                # Probabilidades aproximadas (ver "approximate_component")
+                probs = component_sums
+            else:
+                # Peso de cada número de minas k en la componente:
+                # sum_j prefix[j] * suffix_weights[k+j]
+                component_weights = np.correlate(
+                    suffix_weights[index+1], prefix[index],
+                    'valid')[:len(component_counts)]
+                probs = np.dot(component_weights, component_sums) / normalization
+            for var, p in zip(component, probs):
+                query_var_factor[var] = x_factor(var, p)
+
+        if interior:
+            mines_in_interior = remaining_mines - np.arange(num_of_frontier + 1)
+            p = (np.dot(total * weights, mines_in_interior)
+                 / (normalization * num_of_interior))
+            for var in interior:
+                query_var_factor[var] = x_factor(var, p)
+                self.paths[var] = EXACT_PATH
+
+        return query_var_factor
+
+    # Enumera las configuraciones de la componente "component" compatibles
+    # con las evidencias. Devuelve la terna (counts, sums, path):
+    #   - counts[k]: número de configuraciones con k minas.
+    #   - sums[k][v]: número de configuraciones con k minas en las que la
+    #     variable v tiene mina.
+    #   - path: EXACT_PATH.
+    # Ambos se escalan por el mismo factor, ya que solo interesan
+    # proporciones.
+    #
+    # Cada evidencia Y es una restricción "suma de sus variables (índices de
+    # la componente) = objetivo". Las variables se asignan en orden, y los
+    # subproblemas se identifican por el índice de la variable y lo que falta
+    # por sumar en las restricciones que están a medias (las que tienen
+    # variables ya asignadas y variables por asignar). Los subproblemas forman
+    # un grafo por niveles (uno por variable) que se recorre sin recursión:
+    #   1.- Hacia delante, para construir los estados de cada nivel y sus
+    #       sucesores.
+    #   2.- Hacia atrás, para contar las configuraciones que completan cada
+    #       estado, según su número de minas.
+    #   3.- Hacia delante otra vez, contando las formas de llegar a cada
+    #       estado y sumando, para cada variable, las configuraciones que
+    #       pasan por ella con mina.
+    # Así cada estado solo guarda un array de tamaño O(len(component)), y
+    # las sumas de cada variable se calculan una sola vez.
+    #
+    # Si los arrays necesarios superan "max_table_size" valores, la
+    # componente se calcula con propagación de creencias (ver
+    # "approximate_component").
+    def enumerate_component(self, component, evidence):
+        num_of_vars = len(component)
+        index = {var: k for k, var in enumerate(component)}
+
+        members = []
+        targets = []
+        children = {child for var in component
+                    for child in self.model.get_children(var) if child in evidence}
+        for child in children:
+            parents = list(self.model.get_parents(child))
+            known_mines = sum(1 for p in parents if evidence.get(p) == 1)
+            members.append(sorted(index[p] for p in parents if p in index))
+            targets.append(evidence[child] - known_mines)
+
+        # var_constraints[k]: duplas (restricción, variables de la
+        # restricción posteriores a k) de las restricciones de la variable k.
+        # open_constraints[k]: restricciones a medias al llegar a la
+        # variable k, en el orden en el que aparecen en las claves.
+        var_constraints = [[] for k in range(num_of_vars)]
+        ending = [[] for k in range(num_of_vars)]
+        for c, constraint_members in enumerate(members):
+            for position, k in enumerate(constraint_members):
+                var_constraints[k].append(
+                    (c, len(constraint_members) - position - 1))
+            ending[constraint_members[-1]].append(c)
+        open_constraints = [[]]
+        current = {}
+        for k in range(num_of_vars):
+            for c, remaining in var_constraints[k]:
+                current[c] = True
+            for c in ending[k]:
+                del current[c]
+            open_constraints.append(list(current))
+        # Posición de cada restricción abierta en la clave de los estados
+        positions = [{c: p for p, c in enumerate(constraints)}
+                     for constraints in open_constraints]
+
+        # 1.- levels[k]: claves de los estados del nivel k.
+        #     successors[k][s][value]: estado del nivel k+1 al que se llega
+        #     desde el estado s dando el valor "value" a la variable k (-1
+        #     si incumple alguna restricción).
+        table_size = (num_of_vars + 1) * num_of_vars
+        levels = [[()]]
+        successors = []
+        for k in range(num_of_vars):
+            states = {}
+            level_successors = []
+            for key in levels[k]:
+                successor = [-1, -1]
+                for value in (0, 1):
+                    residuals = {}
+                    for c, remaining in var_constraints[k]:
+                        p = positions[k].get(c)
+                        r = (key[p] if p is not None else targets[c]) - value
+                        if r < 0 or r > remaining:
+                            break
+                        residuals[c] = r
+                    else:
+                        new_key = tuple(residuals[c] if c in residuals
+                                        else key[positions[k][c]]
+                                        for c in open_constraints[k+1])
+                        successor[value] = states.setdefault(new_key,
+                                                             len(states))
+                level_successors.append(successor)
+
+            successors.append(level_successors)
+            levels.append(list(states))
+            table_size += len(states) * (num_of_vars - k)
+            if table_size > self.max_table_size:
+                return self.approximate_component(component, evidence,
+                                                  table_size)
+
+        # 2.- backward[k][s][m]: configuraciones de las variables k.. que
+        #     completan el estado s con m minas. Cada nivel se divide por su
+        #     máximo, guardando el logaritmo del factor en "log_backward".
+        backward = [None] * (num_of_vars + 1)
+        log_backward = np.zeros(num_of_vars + 2)
+        backward[num_of_vars] = np.ones((len(levels[num_of_vars]), 1))
+        for k in range(num_of_vars - 1, -1, -1):
+            following = backward[k+1]
+            current = np.zeros((len(levels[k]), num_of_vars - k + 1))
+            for s, successor in enumerate(successors[k]):
+                for value in (0, 1):
+                    if successor[value] >= 0:
+                        current[s, value:value + num_of_vars - k] += \
+                            following[successor[value]]
+            scale = np.max(current)
+            if scale == 0:
+                raise ValueError('Evidence is not consistent with the board')
+            backward[k] = current / scale
+            log_backward[k] = log_backward[k+1] + math.log(scale)
+
+        # 3.- forward[s][m]: formas de asignar las variables 0..k-1 llegando
+        #     al estado s del nivel k con m minas (también escalado por
+        #     nivel). La columna v de "sums" se reescala a la escala de
+        #     "counts" (la de backward[0]).
+        counts = backward[0][0]
+        sums = np.zeros((num_of_vars + 1, num_of_vars))
+        forward = np.ones((1, 1))
+        log_forward = 0.0
+        for k in range(num_of_vars):
+            following = backward[k+1]
+            next_forward = np.zeros((len(levels[k+1]), k + 2))
+            column = np.zeros(num_of_vars + 1)
+            for s, successor in enumerate(successors[k]):
+                for value in (0, 1):
+                    if successor[value] >= 0:
+                        next_forward[successor[value], value:value + k + 1] += \
+                            forward[s]
+                if successor[1] >= 0:
+                    column[1:] += np.convolve(forward[s], following[successor[1]])
+            sums[:, k] = column * math.exp(log_forward + log_backward[k+1]
+                                           - log_backward[0])
+            scale = np.max(next_forward)
+            forward = next_forward / scale
+            log_forward += math.log(scale)
+
+        scale = np.max(counts)
+
+        return counts / scale, sums / scale, EXACT_PATH
+
+    # Alternativa a "enumerate_component" para las componentes demasiado
+    # grandes: las probabilidades de cada variable se calculan con
+    # propagación de creencias (sin tener en cuenta el número total de
+    # minas), y la distribución del número de minas de la componente se
+    # aproxima como si sus variables fueran independientes. En lugar de la
+    # tabla "sums" se devuelven directamente las probabilidades, que no
+    # dependen del número de minas (ver "combine_components").
+    def approximate_component(self, component, evidence, table_size):
+        start = time.perf_counter()
+        probs = self.fallback.prepare_component(component, evidence)[:, 1]
+
+        counts = np.ones(1)
+        for p in probs:
+            counts = np.convolve(counts, [1 - p, p])
+
+        if self.sink is not None:
+            self.sink.emit({'event': 'enumerate_component',
+                            'path': APPROXIMATE_PATH,
+                            'variables': len(component),
+                            'estimated_table_size': table_size,
+                            'iterations': self.fallback.iterations,
+                            'converged': self.fallback.converged,
+                            'time': time.perf_counter() - start})
+
+        return counts / np.max(counts), probs, APPROXIMATE_PATH
+
+
+# Logaritmo de C(n, k), o -inf si k no está entre 0 y n
+def log_combinations(n, k):
+    if k < 0 or k > n:
+        return -math.inf
+    return math.lgamma(n+1) - math.lgamma(k+1) - math.lgamma(n-k+1)
+
+
+def x_factor(var, prob_mine):
+    return DiscreteFactor([var], [2], [1 - prob_mine, prob_mine])
@@ -0,0 +1,471 @@
+import math
+import time
+
+import numpy as np
+
+from . import enumeration as enum
+
+
+# Inversas de las temperaturas de las réplicas de cada cadena. La primera es
+# tan alta que, en la práctica, esa réplica nunca deja de cumplir las
+# evidencias, y es la que se usa para estimar las probabilidades.
+INVERSE_TEMPERATURES = (20.0, 3.0, 2.0, 1.4, 1.0, 0.7)
+
+# Número máximo de pasos (por variable) de la búsqueda de la configuración
+# inicial de cada componente
+SEARCH_STEPS_PER_VARIABLE = 50
+
+# Por defecto cada consulta termina cuando el error estándar de todas las
+# probabilidades es menor que DEFAULT_TARGET_ERROR (en tableros de 16x16 con
+# 40 minas, unos pocos cientos de barridos), precisión con la que la casilla
+# elegida es la misma que con la enumeración exacta. El número de barridos y
+# el tiempo (en segundos) solo la limitan si la frontera es enorme o las
+# cadenas no convergen.
+DEFAULT_TARGET_ERROR = 0.02
+DEFAULT_MAX_SWEEPS = 5000
+DEFAULT_TIME_BUDGET = 2.0
+
+
+# Motor de inferencia aproximada por muestreo (MCMC), para tableros en los
+# que ni la eliminación de variables ni la enumeración son viables (tableros
+# de 100x100 o más con fronteras grandes).
+#
+# Al igual que "Enumeration", tiene en cuenta el número total de minas: una
+# configuración de la frontera con K minas tiene peso C(interior, minas - K).
+# Se muestrea esa distribución con Gibbs por bloques:
+#
+#   1.- Cada evidencia Y define un bloque (sus padres X ocultos, como mucho
+#       8 variables). Un bloque se vuelve a muestrear enumerando sus 2^s
+#       configuraciones y ponderándolas según las evidencias Y que le
+#       afectan, dado el resto de variables.
+#   2.- Los bloques se agrupan por colores: dos bloques del mismo color
+#       tienen el mismo tamaño y no comparten ninguna evidencia Y, por lo que
+#       todos los de un color se actualizan a la vez con operaciones de NumPy
+#       (y en todas las cadenas a la vez).
+#   3.- Los bloques proponen configuraciones con un peso fijo por mina
+#       (lambda), y la restricción global del número de minas se aplica con
+#       un paso de Metropolis-Hastings sobre cada cadena.
+#
+# Con restricciones estrictas, mover una mina suele exigir cambiar a la vez
+# varios bloques, y las cadenas se quedarían atascadas en una configuración.
+# Por eso cada cadena tiene réplicas a distintas temperaturas
+# ("INVERSE_TEMPERATURES", parallel tempering): en la réplica de inversa
+# beta, cada mina de más o de menos en una evidencia Y multiplica el peso por
+# exp(-beta). Tras cada barrido se proponen intercambios entre réplicas
+# vecinas, de forma que las configuraciones a las que se llega pasando por
+# estados inválidos acaban en la réplica más fría. Esto también permite
+# empezar desde una configuración que no cumple las evidencias cuando no se
+# encuentra una que las cumpla ("find_configuration").
+#
+# Se ejecutan "num_of_chains" cadenas independientes, y las probabilidades se
+# estiman con las medias de sus réplicas frías (mientras cumplen todas las
+# evidencias) tras "burn_in" barridos. El muestreo es "anytime": se detiene
+# al llegar a "max_sweeps" barridos, al agotar "time_budget" segundos o
+# cuando el error estándar de todas las probabilidades es menor que
+# "target_error" (con al menos tantas muestras como barridos de "burn_in").
+# Cualquiera de los dos primeros límites puede quitarse con None.
+# El error estándar de la última consulta (a partir de la dispersión entre
+# cadenas) se guarda en "standard_errors" y "max_standard_error".
+class GibbsSampling(enum.Enumeration):
+
+    sink = None
+
+    def __init__(self, model, num_of_mines, time_budget=DEFAULT_TIME_BUDGET,
+                 num_of_chains=16, burn_in=50, max_sweeps=DEFAULT_MAX_SWEEPS,
+                 target_error=DEFAULT_TARGET_ERROR,
+                 inverse_temperatures=INVERSE_TEMPERATURES, seed=None):
+        super().__init__(model, num_of_mines)
+        self.time_budget = time_budget
+        self.num_of_chains = num_of_chains
+        self.burn_in = burn_in
+        self.max_sweeps = max_sweeps
+        self.target_error = target_error
+        self.inverse_temperatures = inverse_temperatures
+        self.rng = np.random.RandomState(seed)
+        self.standard_errors = {}
+        self.max_standard_error = 0.0
+
+    # Restricciones de la componente (listas de índices de la componente y
+    # número de minas que deben sumar) y una configuración inicial. Solo
+    # dependen de las evidencias Y de la componente, por lo que pueden
+    # reutilizarse igual que la tabla de la enumeración.
+    def prepare_component(self, component, evidence):
+        index = {var: k for k, var in enumerate(component)}
+        constraints = []
+        children = {child for var in component
+                    for child in self.model.get_children(var) if child in evidence}
+
+        for child in sorted(children):
+            parents = list(self.model.get_parents(child))
+            known_mines = sum(1 for p in parents if evidence.get(p) == 1)
+            constraints.append(([index[p] for p in parents if p in index],
+                                evidence[child] - known_mines))
+
+        # Las variables se numeran por filas y columnas del tablero
+        order = sorted(range(len(component)), key=lambda k: component[k])
+        configuration = find_configuration(
+            len(component), constraints, order,
+            SEARCH_STEPS_PER_VARIABLE*len(component))
+        if configuration is None:
+            configuration = [0]*len(component)
+
+        return constraints, configuration
+
+    # Igual que "Enumeration.combine_components"
+    def combine_components(self, prepared, interior, evidence,
+                           num_of_interior=None, known_mines=None):
+        start = time.perf_counter()
+        if known_mines is None:
+            known_mines = self.known_mines(evidence)
+        remaining_mines = self.num_of_mines - known_mines
+        if num_of_interior is None:
+            num_of_interior = len(interior)
+
+        variables = []
+        constraints = []
+        initial = []
+        for component, (component_constraints, configuration) in prepared:
+            offset = len(variables)
+            variables.extend(component)
+            constraints.extend(([offset + k for k in members], target)
+                               for members, target in component_constraints)
+            initial.extend(configuration)
+
+        num_of_vars = len(variables)
+        log_weights = np.array([enum.log_combinations(num_of_interior,
+                                                      remaining_mines - K)
+                                for K in range(num_of_vars + 1)])
+        if np.all(np.isinf(log_weights)):
+            raise ValueError('Evidence is not consistent with the number of mines')
+
+        density = min(max(remaining_mines / max(num_of_interior + num_of_vars, 1),
+                          1e-6), 1 - 1e-6)
+        log_lambda = math.log(density / (1 - density))
+        colors = [self.color_update(blocks, constraints, num_of_vars, log_lambda)
+                  for blocks in color_blocks(constraints)]
+        members = np.full((len(constraints), 8), num_of_vars)
+        for c, (constraint_members, target) in enumerate(constraints):
+            members[c, :len(constraint_members)] = constraint_members
+        targets = np.array([target for constraint_members, target in constraints],
+                           dtype=np.int8)
+
+        # Fila r: réplica r // num_of_chains de la cadena r % num_of_chains.
+        # Una columna más (siempre a 0) para los índices de relleno.
+        num_of_chains = self.num_of_chains
+        betas = np.repeat(np.array(self.inverse_temperatures, dtype=np.float32),
+                          num_of_chains)
+        state = np.zeros((len(betas), num_of_vars + 1), dtype=np.int8)
+        state[:, :num_of_vars] = initial
+        mines = state.sum(axis=1, dtype=np.int64)
+
+        # Suma de las muestras válidas de cada cadena y número de muestras
+        sums = np.zeros((num_of_chains, num_of_vars))
+        interior_sums = np.zeros(num_of_chains)
+        samples = np.zeros(num_of_chains)
+        sweeps = 0
+        accepted = 0
+        swaps = 0
+        while True:
+            for color in colors:
+                accepted += self.update(state, mines, betas, color, log_weights,
+                                        log_lambda)
+            errors = violations(state, members, targets)
+            if colors:
+                swaps += self.exchange(state, mines, sweeps % 2, errors)
+            sweeps += 1
+
+            # Si se agota el tiempo durante el "burn_in", se devuelve lo que
+            # se tenga en ese momento
+            out_of_time = (self.time_budget is not None
+                           and time.perf_counter() - start >= self.time_budget)
+            if sweeps > self.burn_in or out_of_time:
+                valid = errors[:num_of_chains] == 0
+                samples += valid
+                sums += state[:num_of_chains, :num_of_vars] * valid[:, None]
+                if interior:
+                    interior_sums += (valid * (remaining_mines - mines[:num_of_chains])
+                                      / num_of_interior)
+                sampled = samples > 0
+                chain_means = sums[sampled] / samples[sampled, None]
+                standard_errors = standard_error(chain_means)
+                if (self.max_sweeps is not None and sweeps >= self.max_sweeps
+                        or out_of_time
+                        or not colors
+                        or np.min(samples) >= self.burn_in
+                        and np.max(standard_errors) < self.target_error):
+                    break
+
+        # Sin ninguna muestra válida, se usa el estado actual de las réplicas
+        # frías (con error estándar infinito)
+        if not np.any(sampled):
+            chain_means = state[:num_of_chains, :num_of_vars].astype(float)
+            standard_errors = np.full(num_of_vars, math.inf)
+        probs = np.mean(chain_means, axis=0)
+        self.standard_errors = dict(zip(variables, standard_errors.tolist()))
+        query_var_factor = {var: enum.x_factor(var, p)
+                            for var, p in zip(variables, probs.tolist())}
+
+        if interior:
+            if np.any(sampled):
+                interior_means = interior_sums[sampled] / samples[sampled]
+                interior_error = float(standard_error(interior_means[:, None])[0])
+            else:
+                interior_means = ((remaining_mines - mines[:num_of_chains])
+                                  / num_of_interior)
+                interior_error = math.inf
+            p = float(np.mean(interior_means))
+            for var in interior:
+                query_var_factor[var] = enum.x_factor(var, p)
+                self.standard_errors[var] = interior_error
+
+        self.max_standard_error = max(self.standard_errors.values(), default=0.0)
+
+        if self.sink is not None:
+            updates = sweeps * len(colors) * len(betas)
+            self.sink.emit({'event': 'gibbs_sampling',
+                            'variables': num_of_vars,
+                            'interior': num_of_interior,
+                            'blocks': len(constraints),
+                            'colors': len(colors),
+                            'chains': num_of_chains,
+                            'replicas': len(self.inverse_temperatures),
+                            'sweeps': sweeps,
+                            'samples': int(np.sum(samples)),
+                            'acceptance_rate': accepted / updates if updates else 1.0,
+                            'swaps': swaps,
+                            'max_standard_error': self.max_standard_error,
+                            'time': time.perf_counter() - start})
+
+        return query_var_factor
+
+    # Arrays para actualizar a la vez los bloques de un mismo color
+    # ("blocks": índices de las restricciones que definen cada bloque, todos
+    # con el mismo número de variables s):
+    #   - cells (B, s): variables de cada bloque.
+    #   - configs (2^s, s): configuraciones de un bloque, y mines (2^s) su
+    #     número de minas.
+    #   - tilt (2^s): peso lambda^k de cada configuración con k minas.
+    #   - Por cada par (bloque, restricción que le afecta): la suma de la
+    #     restricción en cada configuración del bloque ("contributions"), las
+    #     variables de la restricción fuera del bloque ("outside", rellenas
+    #     con el índice de la columna auxiliar num_of_vars) y su objetivo
+    #     ("targets"). Los pares están ordenados por bloque y "starts" indica
+    #     dónde empieza cada bloque.
+    def color_update(self, blocks, constraints, num_of_vars, log_lambda):
+        size = len(constraints[blocks[0]][0])
+        configs = ((np.arange(2**size)[:, None] >> np.arange(size)) & 1).astype(np.int8)
+        var_constraints = {}
+        for c, (members, target) in enumerate(constraints):
+            for var in members:
+                var_constraints.setdefault(var, []).append(c)
+
+        cells = np.array([constraints[c][0] for c in blocks])
+        contributions = []
+        outside = []
+        targets = []
+        starts = []
+        for c in blocks:
+            members = constraints[c][0]
+            position = {var: k for k, var in enumerate(members)}
+
+            starts.append(len(targets))
+            for other in sorted({o for var in members for o in var_constraints[var]}):
+                other_members, target = constraints[other]
+                inside = [position[var] for var in other_members if var in position]
+                contributions.append(configs[:, inside].sum(axis=1))
+                outside.append([var for var in other_members if var not in position]
+                               + [num_of_vars]*(8 - len(other_members) + len(inside)))
+                targets.append(target)
+
+        return {
+            'cells': cells,
+            'configs': configs,
+            'mines': configs.sum(axis=1, dtype=np.int64),
+            'tilt': np.exp(configs.sum(axis=1) * log_lambda).astype(np.float32),
+            'contributions': np.array(contributions, dtype=np.int8),
+            'outside': np.array(outside),
+            'targets': np.array(targets, dtype=np.int8),
+            'starts': np.array(starts)
+        }
+
+    # Propone nuevas configuraciones para todos los bloques del color en
+    # todas las réplicas y las acepta o rechaza (por réplica) según el peso
+    # global del número de minas. Modifica "state" y "mines" y devuelve el
+    # número de réplicas que han aceptado la propuesta.
+    def update(self, state, mines, betas, color, log_weights, log_lambda):
+        cells = color['cells']
+        num_of_blocks = len(cells)
+
+        # Minas de más o de menos en cada evidencia Y con cada configuración
+        residuals = color['targets'] - state[:, color['outside']].sum(axis=2,
+                                                                      dtype=np.int8)
+        errors = np.abs(color['contributions'][None] - residuals[:, :, None])
+        errors = np.add.reduceat(errors, color['starts'], axis=1, dtype=np.int16)
+        weights = np.exp(-betas[:, None, None] * errors) * color['tilt']
+
+        weights = np.cumsum(weights, axis=2)
+        r = self.rng.random_sample((len(state), num_of_blocks, 1)) * weights[:, :, -1:]
+        choice = np.minimum((weights <= r).sum(axis=2), len(color['configs']) - 1)
+        proposal = color['configs'][choice]
+
+        new_mines = (mines + color['mines'][choice].sum(axis=1)
+                     - state[:, cells].sum(axis=(1, 2), dtype=np.int64))
+        current = log_weights[np.minimum(mines, len(log_weights) - 1)]
+        proposed = log_weights[np.minimum(new_mines, len(log_weights) - 1)]
+        with np.errstate(invalid='ignore'):
+            log_ratio = proposed - current - (new_mines - mines) * log_lambda
+        accept = (np.isneginf(current)
+                  | (log_ratio >= np.log(self.rng.random_sample(len(state)))))
+
+        rows = np.flatnonzero(accept)
+        state[rows[:, None, None], cells[None]] = proposal[rows]
+        mines[rows] = new_mines[rows]
+
+        return len(rows)
+
+    # Propone intercambiar el estado de las réplicas vecinas (las parejas
+    # que empiezan en las réplicas pares o impares, según "parity") de cada
+    # cadena, según el número de minas de más o de menos en las evidencias
+    # de cada réplica ("errors", que se actualiza con los intercambios).
+    # Devuelve el número de intercambios aceptados.
+    def exchange(self, state, mines, parity, errors):
+        num_of_chains = self.num_of_chains
+        swaps = 0
+
+        for t in range(parity, len(self.inverse_temperatures) - 1, 2):
+            cold = slice(t*num_of_chains, (t+1)*num_of_chains)
+            hot = slice((t+1)*num_of_chains, (t+2)*num_of_chains)
+            log_ratio = ((self.inverse_temperatures[t] - self.inverse_temperatures[t+1])
+                         * (errors[cold] - errors[hot]))
+            accept = log_ratio >= np.log(self.rng.random_sample(num_of_chains))
+
+            rows = np.flatnonzero(accept)
+            cold_rows = rows + t*num_of_chains
+            hot_rows = rows + (t+1)*num_of_chains
+            state[cold_rows], state[hot_rows] = state[hot_rows], state[cold_rows]
+            mines[cold_rows], mines[hot_rows] = mines[hot_rows], mines[cold_rows]
+            errors[cold_rows], errors[hot_rows] = errors[hot_rows], errors[cold_rows]
+            swaps += len(rows)
+
+        return swaps
+
+
+# Total de minas de más o de menos en todas las evidencias Y de cada fila de
+# "state" ("members": variables de cada restricción, rellenas con el índice
+# de la columna auxiliar)
+def violations(state, members, targets):
+    return np.abs(targets - state[:, members].sum(axis=2, dtype=np.int8)).sum(
+        axis=1, dtype=np.int64)
+
+
+# Agrupa las restricciones (bloques) en colores de forma voraz: dos bloques
+# pueden tener el mismo color si tienen el mismo número de variables y
+# ninguna restricción afecta a variables de ambos.
+def color_blocks(constraints):
+    var_constraints = {}
+    for c, (members, target) in enumerate(constraints):
+        for var in members:
+            var_constraints.setdefault(var, []).append(c)
+
+    colors = []
+    for size in sorted({len(members) for members, target in constraints}):
+        size_colors = []
+        used = []
+        for c, (members, target) in enumerate(constraints):
+            if len(members) != size:
+                continue
+            touched = {o for var in members for o in var_constraints[var]}
+            for blocks, affected in zip(size_colors, used):
+                if not touched & affected:
+                    blocks.append(c)
+                    affected.update(touched)
+                    break
+            else:
+                size_colors.append([c])
+                used.append(touched)
+        colors.extend(size_colors)
+
+    return colors
+
+
+# Primera configuración de "num_of_vars" variables que cumple todas las
+# restricciones, o None si no se encuentra en "max_steps" pasos. Se asignan
+# las variables en el orden "order" (búsqueda en profundidad, con la misma
+# poda que "Enumeration.enumerate_component"), y se recuerdan los
+# subproblemas sin solución según el índice de la variable y lo que falta por
+# sumar en las restricciones que están a medias, para no volver a
+# explorarlos.
+def find_configuration(num_of_vars, constraints, order=None, max_steps=None):
+    order = list(order) if order is not None else list(range(num_of_vars))
+    step = {var: k for k, var in enumerate(order)}
+    var_constraints = [[] for k in range(num_of_vars)]
+    remaining = [len(members) for members, target in constraints]
+    open_constraints = [[] for k in range(num_of_vars + 1)]
+    for c, (members, target) in enumerate(constraints):
+        steps = [step[var] for var in members]
+        for k in steps:
+            var_constraints[k].append(c)
+        for k in range(min(steps) + 1, max(steps) + 1):
+            open_constraints[k].append(c)
+
+    residuals = [target for members, target in constraints]
+    failed = set()
+    values = []
+    # Pila de la búsqueda: siguiente valor a probar en cada variable asignada
+    # y subproblema al que corresponde
+    stack = [0]
+    keys = [(0, ())]
+    num_of_steps = 0
+    while stack:
+        num_of_steps += 1
+        if max_steps is not None and num_of_steps > max_steps:
+            return None
+
+        k = len(stack) - 1
+        value = stack[-1]
+        if value > 1:
+            failed.add(keys.pop())
+            stack.pop()
+            if values:
+                for c in var_constraints[k-1]:
+                    residuals[c] += values[-1]
+                    remaining[c] += 1
+                values.pop()
+            continue
+
+        stack[-1] += 1
+        valid = all(0 <= residuals[c] - value <= remaining[c] - 1
+                    for c in var_constraints[k])
+        if not valid:
+            continue
+
+        for c in var_constraints[k]:
+            residuals[c] -= value
+            remaining[c] -= 1
+        values.append(value)
+        if len(values) == num_of_vars:
+            configuration = [0]*num_of_vars
+            for var, v in zip(order, values):
+                configuration[var] = v
+            return configuration
+
+        key = (k+1, tuple(residuals[c] for c in open_constraints[k+1]))
+        if key in failed:
+            for c in var_constraints[k]:
+                residuals[c] += value
+                remaining[c] += 1
+            values.pop()
+            continue
+        stack.append(0)
+        keys.append(key)
+
+    raise ValueError('Evidence is not consistent with the board')
+
+
+# Error estándar de la media de cada columna a partir de las medias de cada
+# cadena (filas de "chain_means")
+def standard_error(chain_means):
+    if len(chain_means) < 2:
+        return np.full(chain_means.shape[1], np.inf)
+
+    return np.std(chain_means, axis=0, ddof=1) / math.sqrt(len(chain_means))
@@ -0,0 +1,72 @@
+# Estructura del tablero como red bayesiana (vecinos de cada casilla y
+# nombres de sus variables), sin depender de pgmpy. Los módulos que solo
+# necesitan la estructura (el motor del tablero, la enumeración sobre
+# "GridModel" o la propagación de creencias por lotes) la importan desde aquí,
+# sin pagar el coste de importar pgmpy.
+
+
+# Cada dupla corresponde a los valores que hay que sumar
+# a una posición determinada del tablero para calcular uno
+# de sus 8 posibles vecinos.
+NEIGHBOR_POSITION = (
+    (-1, -1), (-1, 0), (-1, 1),
+    ( 0, -1),          ( 0, 1),
+    ( 1, -1), ( 1, 0), ( 1, 1)
+)
+
+
+# Las variables de la red se identifican con enteros consecutivos en lugar de
+# cadenas como 'X'+str(i)+str(j), que son ambiguas cuando alguna dimensión del
+# tablero llega a 10 ('X111' puede ser (1,11) u (11,1)). A la casilla (i,j),
+# con índice k = i*width + j, le corresponden:
+#   - X: 2*k + 1
+#   - Y: 2*k + 2
+# (se empieza en 1 porque pgmpy trata la variable 0 como "ninguna variable").
+def bn_X_name(i, j, width):
+    return 2*(i*width + j) + 1
+
+
+def bn_Y_name(i, j, width):
+    return 2*(i*width + j) + 2
+
+
+def is_Y_variable(var):
+    return var % 2 == 0
+
+
+# Posición (i,j) de la casilla de la variable "var" (X o Y)
+def bn_position(var, width):
+    return divmod((var - 1) // 2, width)
+
+
+# Misma estructura que la red bayesiana (padres e hijos de cada variable),
+# calculada a partir de la posición de las casillas en lugar de guardar el
+# grafo y las CPDs. Los motores que solo usan la estructura de la red
+# (enumeración y muestreo) pueden usarla en tableros con millones de
+# casillas, en los que no es viable construir la red completa.
+class GridModel:
+
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+
+    def nodes(self):
+        return range(1, 2*self.height*self.width + 1)
+
+    def neighbors(self, var):
+        i, j = bn_position(var, self.width)
+
+        return [(i + di, j + dj) for (di, dj) in NEIGHBOR_POSITION
+                if 0 <= i + di < self.height and 0 <= j + dj < self.width]
+
+    # Variables X de las casillas vecinas (ordenadas, como en la red)
+    def get_parents(self, node):
+        if not is_Y_variable(node):
+            return []
+        return sorted(bn_X_name(i, j, self.width) for (i, j) in self.neighbors(node))
+
+    # Variables Y de las casillas vecinas (ordenadas, como en la red)
+    def get_children(self, node):
+        if is_Y_variable(node):
+            return []
+        return sorted(bn_Y_name(i, j, self.width) for (i, j) in self.neighbors(node))
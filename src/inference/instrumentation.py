@@ -0,0 +1,50 @@
+import json
+
+from . import count_factor as cf
+
+
+# Destinos ("sinks") de los registros de instrumentación de la inferencia.
+#
+# Los motores de inferencia y el motor del tablero tienen un atributo "sink"
+# (None por defecto). Si se le asigna uno de estos objetos, cada consulta
+# llama a su método "emit" con un diccionario con los datos de la consulta
+# (tiempos, orden de eliminación, tamaño máximo de factor, anchura inducida,
+# etc.). Con "sink" a None solo se comprueba ese atributo, por lo que el coste
+# de la instrumentación desactivada es prácticamente nulo.
+#
+# Cualquier objeto con un método "emit(record)" puede usarse como destino.
+
+
+# Guarda los registros en memoria (en la lista "records")
+class MemorySink:
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def clear(self):
+        self.records = []
+
+
+# Escribe cada registro como una línea JSON en el fichero "path"
+class JsonLinesSink:
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def emit(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Número de valores que guarda un factor: el tamaño de la tabla en un
+# "DiscreteFactor", o de los vectores de cuentas y pesos en un "CountFactor".
+def factor_size(factor):
+    if isinstance(factor, cf.CountFactor):
+        return factor.counts.size + factor.weights.size
+    return factor.values.size
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+
+
+# Las 8 simetrías del cuadrado (rotaciones y reflexiones) aplicadas a una
+# posición (i,j).
+SYMMETRIES = (
+    lambda i, j: (i, j),
+    lambda i, j: (j, -i),
+    lambda i, j: (-i, -j),
+    lambda i, j: (-j, i),
+    lambda i, j: (i, -j),
+    lambda i, j: (-i, j),
+    lambda i, j: (j, i),
+    lambda i, j: (-j, -i)
+)
+
+# Número máximo de patrones guardados por defecto en cada caché
+DEFAULT_MAXSIZE = 4096
+
+_shared_caches = {}
+
+
+# Caché LRU de resultados de inferencia indexada por la forma canónica de un
+# patrón local del tablero (ver "canonical_pattern"). Cuando se llena, se
+# descarta el patrón usado hace más tiempo. Lleva la cuenta de aciertos y
+# fallos para poder medir su efectividad.
+class PatternCache:
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Devuelve la caché compartida con nombre "name", creándola si no existe. Así
+# todas las partidas con la misma configuración reutilizan los patrones.
+def get_pattern_cache(name, maxsize=DEFAULT_MAXSIZE):
+    if name not in _shared_caches:
+        _shared_caches[name] = PatternCache(maxsize)
+
+    return _shared_caches[name]
+
+
+# Calcula la forma canónica de una componente de la frontera, formada por:
+#   - squares: posiciones (i,j) de sus casillas ocultas.
+#   - border: lista de duplas ((i,j), valor) con las casillas reveladas que
+#     la rodean y su número de minas vecinas.
+#
+# Para cada una de las 8 simetrías se transforma el patrón, se traslada para
+# que empiece en (0,0) y se ordena; la forma canónica es la menor de todas.
+# Dos componentes con la misma forma canónica son iguales salvo traslación,
+# rotación o reflexión, por lo que tienen las mismas probabilidades.
+#
+# Devuelve la forma canónica y la lista de índices de "squares" en el orden
+# en el que aparecen en ella, para poder asociar un resultado guardado con
+# las casillas de la componente.
+def canonical_pattern(squares, border):
+    best = None
+
+    for symmetry in SYMMETRIES:
+        moved_squares = [symmetry(i, j) for (i, j) in squares]
+        moved_border = [symmetry(i, j) for ((i, j), value) in border]
+        min_i = min(i for (i, j) in moved_squares + moved_border)
+        min_j = min(j for (i, j) in moved_squares + moved_border)
+
+        hidden = sorted((i - min_i, j - min_j, k)
+                        for k, (i, j) in enumerate(moved_squares))
+        revealed = sorted((i - min_i, j - min_j, value)
+                          for (i, j), (position, value) in zip(moved_border, border))
+        key = (tuple((i, j) for (i, j, k) in hidden), tuple(revealed))
+
+        if best is None or key < best[0]:
+            best = (key, [k for (i, j, k) in hidden])
+
+    return best
@@ -0,0 +1,178 @@
+import mmap
+import math
+import struct
+import hashlib
+
+import numpy as np
+
+
+# Formato del fichero de la tabla (todos los valores en little-endian):
+#   - Cabecera (HEADER): identificador (MAGIC), versión, densidad de minas,
+#     tamaño de la ventana, número de patrones, número total de
+#     probabilidades y tamaño total de las claves (en bytes).
+#   - hashes: uint64[patrones], hash de la clave de cada patrón, ordenados.
+#   - key_offsets: uint64[patrones+1], posición de la clave de cada patrón
+#     en "keys".
+#   - prob_offsets: uint64[patrones+1], posición de las probabilidades de
+#     cada patrón en "probs".
+#   - probs: float64[probabilidades], probabilidad de que cada casilla
+#     oculta del patrón contenga una mina (en el orden de la forma canónica).
+#   - keys: bytes de las claves (ver "encode_pattern").
+MAGIC = b'BPPT'
+VERSION = 1
+HEADER = struct.Struct('<4sIdI4xQQQ')
+
+# Método con el que se responden las componentes encontradas en la tabla
+# (ver "VariableElimination.paths")
+TABLE_PATH = 'pattern_table'
+
+# Tamaño máximo de la ventana, para que cada coordenada de la clave quepa en
+# un byte y el número de casillas ocultas también
+MAX_WINDOW = 15
+
+# ruta ==> tabla ya abierta
+_open_tables = {}
+
+
+# Tabla de probabilidades de patrones locales precalculada (ver
+# "src/precompute.py"), abierta con mmap: solo se leen del disco las páginas
+# que se consultan, y los procesos que abren la misma tabla comparten su
+# memoria.
+#
+# Las claves son las formas canónicas de "pattern_cache.canonical_pattern"
+# que caben en una ventana de window x window casillas. Las probabilidades
+# de una componente solo dependen de su forma y de la probabilidad a priori
+# de las X (la densidad de minas), por lo que la tabla sirve para cualquier
+# tablero con su densidad y el motor 'variable_elimination'.
+class PatternTable:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.density, self.window, count, num_of_probs,
+         key_size) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a pattern table: {0}'.format(path))
+
+        offset = HEADER.size
+        self.hashes = np.frombuffer(self.buffer, np.uint64, count, offset)
+        offset += 8*count
+        self.key_offsets = np.frombuffer(self.buffer, np.uint64, count + 1,
+                                         offset)
+        offset += 8*(count + 1)
+        self.prob_offsets = np.frombuffer(self.buffer, np.uint64, count + 1,
+                                          offset)
+        offset += 8*(count + 1)
+        self.probs = np.frombuffer(self.buffer, np.float64, num_of_probs,
+                                   offset)
+        self.keys_offset = offset + 8*num_of_probs
+        self.hits = 0
+        self.misses = 0
+
+    # Probabilidades del patrón "pattern" (forma canónica), con el mismo
+    # formato que "VariableElimination.prepare_component", o None si no
+    # está en la tabla
+    def get(self, pattern):
+        if not fits(pattern, self.window):
+            self.misses += 1
+            return None
+
+        key = encode_pattern(pattern)
+        key_hash = pattern_hash(key)
+        k = int(np.searchsorted(self.hashes, np.uint64(key_hash)))
+        while k < len(self.hashes) and int(self.hashes[k]) == key_hash:
+            start = self.keys_offset + int(self.key_offsets[k])
+            end = self.keys_offset + int(self.key_offsets[k+1])
+            if self.buffer[start:end] == key:
+                self.hits += 1
+                p = self.probs[int(self.prob_offsets[k]):
+                               int(self.prob_offsets[k+1])]
+                return np.stack([1 - p, p], axis=1), TABLE_PATH
+            k += 1
+
+        self.misses += 1
+        return None
+
+    def matches(self, height, width, num_of_mines):
+        return math.isclose(self.density, num_of_mines/(height*width),
+                            rel_tol=1e-9)
+
+    def close(self):
+        self.hashes = self.key_offsets = self.prob_offsets = self.probs = None
+        self.buffer.close()
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+# Devuelve la tabla del fichero "path", abriéndola si aún no está abierta en
+# este proceso
+def get_pattern_table(path):
+    if path not in _open_tables:
+        _open_tables[path] = PatternTable(path)
+
+    return _open_tables[path]
+
+
+# True si todas las casillas del patrón caben en una ventana de
+# window x window (las coordenadas de la forma canónica empiezan en 0)
+def fits(pattern, window):
+    hidden, revealed = pattern
+
+    return (all(i < window and j < window for (i, j) in hidden)
+            and all(i < window and j < window for (i, j, value) in revealed))
+
+
+# Clave binaria de un patrón que cabe en la ventana: número de casillas
+# ocultas, sus coordenadas y las coordenadas y el valor de cada casilla
+# revelada (un byte por número)
+def encode_pattern(pattern):
+    hidden, revealed = pattern
+    values = [len(hidden)]
+    for (i, j) in hidden:
+        values += (i, j)
+    for (i, j, value) in revealed:
+        values += (i, j, value)
+
+    return bytes(values)
+
+
+def pattern_hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(),
+                          'little')
+
+
+# Escribe en "path" la tabla de los patrones de "entries" (forma canónica
+# ==> probabilidad de mina de cada casilla oculta, en el orden de la forma
+# canónica). Los patrones que no caben en la ventana se descartan.
+def save(path, entries, density, window):
+    if window > MAX_WINDOW:
+        raise ValueError('Window larger than {0}'.format(MAX_WINDOW))
+
+    rows = sorted((pattern_hash(key), key, probs) for key, probs in
+                  ((encode_pattern(pattern), probs)
+                   for pattern, probs in entries.items()
+                   if fits(pattern, window)))
+
+    hashes = np.array([key_hash for key_hash, key, probs in rows],
+                      dtype=np.uint64)
+    key_offsets = np.cumsum([0] + [len(key) for key_hash, key, probs in rows],
+                            dtype=np.uint64)
+    prob_offsets = np.cumsum([0] + [len(probs) for key_hash, key, probs in rows],
+                             dtype=np.uint64)
+    probs = np.concatenate([np.asarray(probs, dtype=np.float64)
+                            for key_hash, key, probs in rows] + [np.zeros(0)])
+    keys = b''.join(key for key_hash, key, probs in rows)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, density, window, len(rows),
+                            len(probs), len(keys)))
+        f.write(hashes.tobytes())
+        f.write(key_offsets.tobytes())
+        f.write(prob_offsets.tobytes())
+        f.write(probs.tobytes())
+        f.write(keys)
+
+    return len(rows)
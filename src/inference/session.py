@@ -0,0 +1,148 @@
+from . import pattern_cache
+
+
+# Se lanza cuando se abandona una consulta (ver "InferenceSession.cancelled")
+class QueryCancelled(Exception):
+    pass
+
+
+# Sesión de inferencia incremental a lo largo de una partida.
+#
+# Entre una jugada y la siguiente solo cambian unas pocas evidencias, y la
+# mayoría de componentes de la frontera siguen siendo las mismas. La sesión
+# guarda el resultado de "prepare_component" de cada componente (las
+# probabilidades de la eliminación de variables o la tabla de la enumeración)
+# y solo lo vuelve a calcular para las componentes afectadas por las nuevas
+# evidencias:
+#   - Una nueva evidencia X invalida la componente que contiene esa variable.
+#   - Una nueva evidencia Y invalida las componentes que contienen alguno de
+#     sus padres.
+#
+# Además, si se le pasa una caché de patrones ("pattern_cache.PatternCache")
+# y la función que da la posición en el tablero de cada variable
+# ("position", por ejemplo "bayesian_network.bn_position"), los resultados
+# se comparten entre componentes con la misma forma salvo traslación,
+# rotación o reflexión, incluso de partidas distintas.
+#
+# Con una tabla de patrones precalculada ("pattern_table.PatternTable"), las
+# componentes cuya forma está en la tabla no se calculan: se usan las
+# probabilidades de la tabla ("table_hits" cuenta cuántas). La tabla tiene el
+# formato de resultados de la eliminación de variables, por lo que solo
+# puede usarse con ese motor.
+#
+# Tiene la misma interfaz "query_components" que los motores de inferencia,
+# por lo que puede usarse en su lugar. Las evidencias se añaden de forma
+# incremental ("add_evidence"), y el número de minas reveladas
+# ("known_mines") se actualiza con ellas, de forma que el coste de cada
+# consulta no depende del número de casillas reveladas.
+#
+# Si se asigna a "cancelled" una función sin argumentos, se llama antes de
+# calcular cada componente y, si devuelve True, la consulta se abandona con
+# "QueryCancelled" (por ejemplo cuando la interfaz ya no necesita el
+# resultado). Los resultados de las componentes ya calculadas se conservan.
+class InferenceSession:
+
+    def __init__(self, inference, position=None, pattern_cache=None,
+                 pattern_table=None):
+        self.inference = inference
+        self.position = position
+        self.pattern_cache = pattern_cache
+        self.pattern_table = pattern_table
+        self.table_hits = 0
+        self.evidence = {}
+        # Número de variables X de "evidence" con mina
+        self.known_mines = 0
+        # frozenset de variables de la componente ==> (componente, resultado)
+        self.cache = {}
+        # variable ==> claves de "cache" de las componentes que la contienen
+        self.cached_by_var = {}
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = None
+
+    # Añade las evidencias "delta" e invalida los resultados afectados
+    def add_evidence(self, delta):
+        affected = set()
+
+        for var, value in delta.items():
+            previous = self.evidence.get(var)
+            if previous != value:
+                self.evidence[var] = value
+                affected.add(var)
+                parents = self.inference.model.get_parents(var)
+                if not parents:
+                    self.known_mines += (value == 1) - (previous == 1)
+                affected.update(parents)
+
+        for var in affected:
+            for key in self.cached_by_var.pop(var, ()):
+                self.invalidate(key)
+
+    def invalidate(self, key):
+        if key in self.cache:
+            del self.cache[key]
+            for var in key:
+                keys = self.cached_by_var.get(var)
+                if keys is not None:
+                    keys.discard(key)
+
+    # "evidence" puede contener todas las evidencias de la partida: solo se
+    # tienen en cuenta las que han cambiado desde la última consulta. Si ya
+    # se han añadido con "add_evidence", no hace falta pasarlas.
+    def query_components(self, components, interior, evidence=None,
+                         num_of_interior=None):
+        if evidence:
+            self.add_evidence(evidence)
+
+        prepared = []
+        for component in components:
+            key = frozenset(component)
+            if key in self.cache:
+                self.hits += 1
+            else:
+                if self.cancelled is not None and self.cancelled():
+                    raise QueryCancelled()
+                self.misses += 1
+                self.cache[key] = self.prepare_component(component)
+                for var in key:
+                    self.cached_by_var.setdefault(var, set()).add(key)
+            prepared.append(self.cache[key])
+
+        return self.inference.combine_components(prepared, interior, self.evidence,
+                                                 num_of_interior,
+                                                 known_mines=self.known_mines)
+
+    # Devuelve la dupla (componente, resultado de "prepare_component"). Si
+    # hay caché o tabla de patrones, la componente se ordena según su forma
+    # canónica, de forma que el resultado guardado sirve para cualquier
+    # componente con la misma forma.
+    def prepare_component(self, component):
+        if self.pattern_cache is None and self.pattern_table is None:
+            return (list(component),
+                    self.inference.prepare_component(component, self.evidence))
+
+        model = self.inference.model
+        squares = [self.position(var) for var in component]
+        border = [(self.position(child), self.evidence[child])
+                  for child in {child for var in component
+                                for child in model.get_children(var)
+                                if child in self.evidence}]
+        pattern, order = pattern_cache.canonical_pattern(squares, border)
+        ordered = [component[k] for k in order]
+
+        if self.pattern_table is not None:
+            result = self.pattern_table.get(pattern)
+            if result is not None:
+                self.table_hits += 1
+                return (ordered, result)
+
+        if self.pattern_cache is None:
+            return (ordered,
+                    self.inference.prepare_component(ordered, self.evidence))
+
+        result = self.pattern_cache.get(pattern)
+        if result is None:
+            result = self.inference.prepare_component(ordered, self.evidence)
+            self.pattern_cache.put(pattern, result)
+
+        return (ordered, result)
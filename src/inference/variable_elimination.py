@@ -1,16 +1,57 @@
 import itertools
+import time
 
 import networkx as nx
 import numpy as np
 from pgmpy.extern.six.moves import filter, range
 
 from pgmpy.extern.six import string_types
-from pgmpy.factors import factor_product
+from pgmpy.factors.discrete import DiscreteFactor
 from pgmpy.inference import Inference
 from pgmpy.utils import StateNameDecorator
 
+from .count_factor import factor_product
+from .instrumentation import factor_size
+from .pattern_cache import PatternCache
+from .belief_propagation import LoopyBeliefPropagation
+
+# Heurísticas disponibles para calcular el orden de eliminación (ver
+# "VariableElimination._elimination_order")
+ELIMINATION_HEURISTICS = ('min_degree', 'min_fill', 'weighted_min_fill')
+
+# Número máximo de órdenes de eliminación guardados
+ORDER_CACHE_SIZE = 1024
+
+# Tamaño máximo (número de valores) de los factores intermedios. Si el orden
+# de eliminación generaría un factor mayor, la consulta se responde con
+# propagación de creencias (aproximada) en lugar de eliminación de variables.
+DEFAULT_MAX_FACTOR_SIZE = 2**22
+
+# Método con el que se ha respondido una consulta
+EXACT_PATH = 'variable_elimination'
+APPROXIMATE_PATH = 'loopy_belief_propagation'
+
+
 class VariableElimination(Inference):
 
+    # Destino de los registros de instrumentación (ver "instrumentation.py")
+    sink = None
+
+    def __init__(self, model, elimination_heuristic='weighted_min_fill',
+                 max_factor_size=DEFAULT_MAX_FACTOR_SIZE):
+        super().__init__(model)
+        if elimination_heuristic not in ELIMINATION_HEURISTICS:
+            raise ValueError('Unknown elimination heuristic: {0}'.format(
+                elimination_heuristic))
+        self.elimination_heuristic = elimination_heuristic
+        self.order_cache = PatternCache(ORDER_CACHE_SIZE)
+        self.max_factor_size = max_factor_size
+        self.fallback = LoopyBeliefPropagation(model)
+        # Método con el que se ha respondido la última consulta y, en la
+        # última llamada a "combine_components", cada variable
+        self.last_path = None
+        self.paths = {}
+
     @StateNameDecorator(argument='evidence', return_val=None)
     def _variable_elimination(self, variables, operation, evidence=None, elimination_order=None):
         """
@@ -42,6 +83,9 @@ class VariableElimination(Inference):
             return set(all_factors)
 
         eliminated_variables = set()
+        sink = self.sink
+        if sink is not None:
+            start = time.perf_counter()
         
         # --MODIFICACIÓN 1, 2:
         #     Ya que las evidencias son fijas en cada partida, aplicamos las 
@@ -53,48 +97,30 @@ class VariableElimination(Inference):
         #     (en la red) de alguna de las variables de consulta o de
         #     evidencia, es irrelevante para la consulta"
 
-        if evidence:
-            for evidence_var in evidence:
-                for factor in self.factors[evidence_var]:
-                    factor_reduced = factor.reduce([(evidence_var, evidence[evidence_var])], inplace=False)
-                    for var in factor_reduced.scope():
-                        self.factors[var].remove(factor)
-                        self.factors[var].append(factor_reduced)
-                        
-                del self.factors[evidence_var]
-                
-        # En este problema en concreto:
-        #    - Las variables de consulta (que siempre serán variables X)
-        #      nunca tendrán padres ==> solo tenemos que calcular los
-        #      antecesores de las variables de evidencia.
-        #    - Las variables de evidencia son "eliminadas" en el bloque
-        #      if-else de arriba ==> dejan de ser variables relevantes
-        #    - Las variables X no tienen antecesores, y las variables Y solo 
-        #      tienen como antecesores sus padres directos (es decir, no 
-        #      tienen abuelos) ==> no es necesario un algoritmo recursivo 
-        #      para calcular los antecesores de las variables de evidencia.
-        
-        relevant_variables = set(variables)
-        for e in evidence.keys():
-            parents = self.model.get_parents(e)
-            for p in parents:
-                relevant_variables.add(p)
+        self._reduce_evidence(evidence)
+        if sink is not None:
+            reduced = time.perf_counter()
+        relevant_variables = self._relevant_variables(variables, evidence)
                 
         working_factors = {node: {factor for factor in self.factors[node] 
                                   if (set(factor.variables).issubset(relevant_variables))}
                            for node in self.factors if node in relevant_variables}
+        # Lista de factores distintos (se comparan por identidad, ya que el 
+        # hash de un DiscreteFactor depende de todos sus valores)
+        all_working_factors = list({id(factor): factor for factor
+                                    in itertools.chain(*working_factors.values())}.values())
         #
         # --
                 
         if not elimination_order:
-        # --MODIFICACIÓN 3: Min-Degree Heuristic. Eliminamos primero las 
-        #     variables con menos vecinos.
+        # --MODIFICACIÓN 3: Heurística de orden de eliminación (Min-Degree, 
+        #     Min-Fill o Weighted-Min-Fill, ver "_elimination_order") 
+        #     calculada sobre los factores ya reducidos de las variables
+        #     relevantes, no sobre la red completa.
 
-            ordered_degree = sorted(self.model.degree, key=lambda node: node[1])
-            ordered_nodes = [node[0] for node in ordered_degree]
-            elimination_order = [var for var in ordered_nodes 
-                                 if var not in set(variables).union(set(evidence.keys() if evidence else []))
-                                    and var in relevant_variables]
+            eliminable = [var for var in relevant_variables
+                          if var not in set(variables).union(set(evidence.keys() if evidence else []))]
+            elimination_order = self._elimination_order(eliminable, all_working_factors)
 
         #
         # --
@@ -102,7 +128,22 @@ class VariableElimination(Inference):
                  set(variables).union(set(evidence.keys() if evidence else []))):
             raise ValueError("Elimination order contains variables which are in"
                              " variables or evidence args")
+
+        if self.max_factor_size is not None:
+            estimated_size = self._max_factor_size(elimination_order,
+                                                   all_working_factors)
+            if estimated_size > self.max_factor_size:
+                if operation != 'marginalize':
+                    raise ValueError("Elimination would create a factor of size"
+                                     " {0}".format(estimated_size))
+                return self._approximate_query('variable_elimination', variables,
+                                               evidence, estimated_size)
+        self.last_path = EXACT_PATH
             
+        if sink is not None:
+            ordered = time.perf_counter()
+            max_factor_size = 0
+
         for var in elimination_order:
             # Removing all the factors containing the variables which are
             # eliminated (as all the factors should be considered only once)
@@ -110,6 +151,8 @@ class VariableElimination(Inference):
                        if not set(factor.variables).intersection(eliminated_variables)]
             
             phi = factor_product(*factors)
+            if sink is not None:
+                max_factor_size = max(max_factor_size, factor_size(phi))
             phi = getattr(phi, operation)([var], inplace=False)
             del working_factors[var]
             for variable in phi.variables:
@@ -129,8 +172,465 @@ class VariableElimination(Inference):
             query_var_factor[query_var] = phi.marginalize(list(set(variables) -
                                                                set([query_var])),
                                                           inplace=False).normalize(inplace=False)
+
+        if sink is not None:
+            end = time.perf_counter()
+            sink.emit({'event': 'variable_elimination',
+                       'path': EXACT_PATH,
+                       'variables': list(variables),
+                       'evidence': len(evidence) if evidence else 0,
+                       'relevant_variables': len(relevant_variables),
+                       'elimination_heuristic': self.elimination_heuristic,
+                       'elimination_order': list(elimination_order),
+                       'max_factor_size': max_factor_size,
+                       'induced_width': self.induced_width(elimination_order,
+                                                           all_working_factors),
+                       'reduce_time': reduced - start,
+                       'order_time': ordered - reduced,
+                       'elimination_time': end - ordered,
+                       'time': end - start})
+
+        return query_var_factor
+
+
+    def _reduce_evidence(self, evidence):
+        """
+        Permanently reduces the factors of the network with the given evidence
+        (see MODIFICACIÓN 1) and removes the evidence variables from it.
+
+        Parameters
+        ----------
+        evidence: dict
+            a dict key, value pair as {var: state_of_var_observed}
+            None if no evidence
+        """
+        if evidence:
+            for evidence_var in evidence:
+                for factor in self.factors[evidence_var]:
+                    factor_reduced = factor.reduce([(evidence_var, evidence[evidence_var])], inplace=False)
+                    for var in factor_reduced.scope():
+                        self.factors[var].remove(factor)
+                        self.factors[var].append(factor_reduced)
+                        
+                del self.factors[evidence_var]
+
+    def _relevant_variables(self, variables, evidence):
+        """
+        Returns the set formed by the query variables and the ancestors of the
+        evidence variables (see MODIFICACIÓN 2).
+
+        Parameters
+        ----------
+        variables: list, array-like
+            query variables.
+        evidence: dict
+            a dict key, value pair as {var: state_of_var_observed}
+            None if no evidence
+        """
+        # En este problema en concreto:
+        #    - Las variables de consulta (que siempre serán variables X)
+        #      nunca tendrán padres ==> solo tenemos que calcular los
+        #      antecesores de las variables de evidencia.
+        #    - Las variables de evidencia son "eliminadas" en 
+        #      "_reduce_evidence" ==> dejan de ser variables relevantes
+        #    - Las variables X no tienen antecesores, y las variables Y solo 
+        #      tienen como antecesores sus padres directos (es decir, no 
+        #      tienen abuelos) ==> no es necesario un algoritmo recursivo 
+        #      para calcular los antecesores de las variables de evidencia.
+        
+        relevant_variables = set(variables)
+        for e in (evidence.keys() if evidence else []):
+            parents = self.model.get_parents(e)
+            for p in parents:
+                relevant_variables.add(p)
+
+        return relevant_variables
+
+    def _min_degree_order(self, variables):
+        """
+        Min-Degree Heuristic (see MODIFICACIÓN 3): returns `variables` sorted
+        by their degree in the network.
+        """
+        ordered_degree = sorted(self.model.degree, key=lambda node: node[1])
+        return [node[0] for node in ordered_degree if node[0] in variables]
+
+    def _max_factor_size(self, elimination_order, factors):
+        """
+        Returns the size (number of values) of the largest dense factor that
+        eliminating `elimination_order` among `factors` would create, without
+        building any factor.
+        """
+        scopes = [set(factor.scope()) for factor in factors]
+        largest = 0
+        for var in elimination_order:
+            used = [scope for scope in scopes if var in scope]
+            scopes = [scope for scope in scopes if var not in scope]
+            phi_scope = set().union(*used)
+            size = 1
+            for phi_var in phi_scope:
+                size *= int(self.cardinality[phi_var])
+            largest = max(largest, size)
+            phi_scope.discard(var)
+            if phi_scope:
+                scopes.append(phi_scope)
+
+        return largest
+
+    def _approximate_query(self, event, variables, evidence, estimated_size):
+        """
+        Answers the query with loopy belief propagation (see
+        `belief_propagation.py`) because variable elimination would create a
+        factor larger than `self.max_factor_size`.
+        """
+        start = time.perf_counter()
+        query_var_factor = self.fallback.query(variables, evidence)
+        self.last_path = APPROXIMATE_PATH
+
+        if self.sink is not None:
+            self.sink.emit({'event': event,
+                            'path': APPROXIMATE_PATH,
+                            'variables': list(variables),
+                            'evidence': len(evidence) if evidence else 0,
+                            'estimated_factor_size': estimated_size,
+                            'iterations': self.fallback.iterations,
+                            'converged': self.fallback.converged,
+                            'time': time.perf_counter() - start})
+
+        return query_var_factor
+
+    def _elimination_order(self, variables, factors):
+        """
+        Returns an elimination order for `variables` computed with
+        `self.elimination_heuristic` on the interaction graph of `factors`
+        (two variables are adjacent if they share a factor), that is, on the
+        network already reduced by the evidence and restricted to the
+        relevant variables.
+
+        - 'min_degree': static degree in the whole network (the original
+          MODIFICACIÓN 3).
+        - 'min_fill': greedily eliminates the variable whose elimination adds
+          the fewest edges between its neighbors.
+        - 'weighted_min_fill': like 'min_fill', but each added edge weighs the
+          product of the cardinalities of its ends.
+
+        Orders are cached by the scopes of `factors`, so they are reused
+        while the shape of the frontier does not change.
+
+        Parameters
+        ----------
+        variables: iterable
+            variables to eliminate.
+        factors: iterable
+            factors among which the variables are eliminated.
+        """
+        if self.elimination_heuristic == 'min_degree':
+            return self._min_degree_order(set(variables))
+
+        scopes = frozenset(frozenset(factor.scope()) for factor in factors)
+        key = (self.elimination_heuristic, frozenset(variables), scopes)
+        order = self.order_cache.get(key)
+        if order is not None:
+            return list(order)
+
+        neighbors = {}
+        for scope in scopes:
+            for var in scope:
+                neighbors.setdefault(var, set()).update(scope)
+        for var in neighbors:
+            neighbors[var].discard(var)
+
+        if self.elimination_heuristic == 'weighted_min_fill':
+            weight = lambda a, b: self.cardinality[a] * self.cardinality[b]
+        else:
+            weight = lambda a, b: 1
+
+        def fill_cost(var):
+            nbrs = list(neighbors[var])
+            return sum(weight(a, b)
+                       for k, a in enumerate(nbrs) for b in nbrs[k+1:]
+                       if b not in neighbors[a])
+
+        remaining = set(variables)
+        costs = {var: fill_cost(var) for var in remaining}
+        order = []
+        while remaining:
+            # Los empates se deshacen por el nombre de la variable para que
+            # el orden sea siempre el mismo
+            var = min(remaining, key=lambda v: (costs[v], v))
+            order.append(var)
+            remaining.remove(var)
+
+            nbrs = neighbors.pop(var)
+            affected = set(nbrs)
+            for n in nbrs:
+                neighbors[n].discard(var)
+                neighbors[n].update(nbrs - {n})
+            for n in nbrs:
+                affected.update(neighbors[n])
+            for n in affected & remaining:
+                costs[n] = fill_cost(n)
+
+        self.order_cache.put(key, tuple(order))
+        return order
+
+    @StateNameDecorator(argument='evidence', return_val=None)
+    def query_all(self, variables, evidence=None, elimination_order=None):
+        """
+        Computes the posterior distribution of every variable in `variables`
+        with a single elimination pass.
+
+        Every relevant variable (including the query variables) is eliminated
+        once. Each elimination step defines a clique of the elimination tree
+        and its message goes to the clique that later consumes it. A second,
+        downward pass sends the messages back from the roots (Shafer-Shenoy),
+        so every clique ends up calibrated and the posterior of the variable
+        eliminated in it is read from its belief. The total cost is about
+        twice the cost of a single `query`, instead of one full elimination
+        per query variable.
+
+        Parameters
+        ----------
+        variables: list
+            list of variables for which you want to compute the probability
+        evidence: dict
+            a dict key, value pair as {var: state_of_var_observed}
+            None if no evidence
+        elimination_order: list
+            order in which the relevant variables (query variables included)
+            are eliminated. If None it is computed with
+            `self.elimination_heuristic` (see `_elimination_order`).
+
+        Returns
+        -------
+        dict: {var: DiscreteFactor} with the normalized posterior of each
+            variable in `variables`.
+        """
+        if isinstance(variables, string_types):
+            raise TypeError("variables must be a list of strings")
+
+        sink = self.sink
+        if sink is not None:
+            start = time.perf_counter()
+
+        self._reduce_evidence(evidence)
+        if sink is not None:
+            reduced = time.perf_counter()
+        relevant_variables = (self._relevant_variables(variables, evidence)
+                              - set(evidence.keys() if evidence else []))
+
+        # Cada factor se usa una única vez aunque aparezca en la lista de
+        # varias variables (se comparan por identidad, no por valor).
+        potentials = []
+        seen = set()
+        for var in relevant_variables:
+            for factor in self.factors[var]:
+                if (id(factor) not in seen and factor.scope()
+                        and set(factor.scope()).issubset(relevant_variables)):
+                    seen.add(id(factor))
+                    potentials.append(factor)
+
+        active_variables = set(itertools.chain(*(factor.scope() for factor in potentials)))
+        if not elimination_order:
+            elimination_order = self._elimination_order(active_variables, potentials)
+        elif set(elimination_order) != active_variables:
+            raise ValueError("Elimination order must contain every relevant"
+                             " variable, query variables included")
+
+        if self.max_factor_size is not None:
+            estimated_size = self._max_factor_size(elimination_order, potentials)
+            if estimated_size > self.max_factor_size:
+                return self._approximate_query('query_all', variables, evidence,
+                                               estimated_size)
+        self.last_path = EXACT_PATH
+
+        if sink is not None:
+            ordered = time.perf_counter()
+            max_factor_size = 0
+
+        # Fase ascendente. "pool" contiene los factores pendientes de usar:
+        # (factor, índice de la clique que lo envía o None si es un factor
+        # original de la red).
+        pool = [(factor, None) for factor in potentials]
+        cliques = []
+        for var in elimination_order:
+            used = [item for item in pool if var in item[0].scope()]
+            pool = [item for item in pool if var not in item[0].scope()]
+
+            clique = {'var': var,
+                      'potentials': [f for f, sender in used if sender is None],
+                      'children': [sender for f, sender in used if sender is not None],
+                      'parent': None,
+                      'message': None}
+            phi = factor_product(*[f for f, sender in used])
+            if sink is not None:
+                max_factor_size = max(max_factor_size, factor_size(phi))
+            if len(phi.scope()) > 1:
+                message = phi.marginalize([var], inplace=False)
+                clique['message'] = message.normalize(inplace=False)
+                pool.append((clique['message'], len(cliques)))
+            for child in clique['children']:
+                cliques[child]['parent'] = len(cliques)
+            cliques.append(clique)
+
+        # Fase descendente: cada clique envía a sus hijos el producto de su
+        # potencial con todos los mensajes recibidos salvo el del propio hijo.
+        downward = {}
+        query_var_factor = {}
+        for index in reversed(range(len(cliques))):
+            clique = cliques[index]
+            incoming = list(clique['potentials'])
+            if index in downward:
+                incoming.append(downward[index])
+
+            for child in clique['children']:
+                others = [cliques[c]['message'] for c in clique['children'] if c != child]
+                phi = factor_product(*(incoming + others))
+                child_scope = set(cliques[child]['message'].scope())
+                message = phi.marginalize([var for var in phi.scope() if var not in child_scope],
+                                          inplace=False)
+                downward[child] = message.normalize(inplace=False)
+
+            if clique['var'] in variables:
+                belief = factor_product(*(incoming + [cliques[c]['message']
+                                                      for c in clique['children']]))
+                query_var_factor[clique['var']] = belief.marginalize(
+                    [var for var in belief.scope() if var != clique['var']],
+                    inplace=False).normalize(inplace=False)
+
+        if sink is not None:
+            end = time.perf_counter()
+            sink.emit({'event': 'query_all',
+                       'path': EXACT_PATH,
+                       'variables': list(variables),
+                       'evidence': len(evidence) if evidence else 0,
+                       'relevant_variables': len(active_variables),
+                       'elimination_heuristic': self.elimination_heuristic,
+                       'elimination_order': list(elimination_order),
+                       'max_factor_size': max_factor_size,
+                       'induced_width': self.induced_width(elimination_order,
+                                                           potentials),
+                       'reduce_time': reduced - start,
+                       'order_time': ordered - reduced,
+                       'elimination_time': end - ordered,
+                       'time': end - start})
+
         return query_var_factor
 
+    def query_components(self, components, interior, evidence=None,
+                         num_of_interior=None):
+        """
+        Computes the posterior distribution of every hidden X variable of the
+        board, given the decomposition of the hidden variables into
+        independent frontier components.
+
+        Each component is queried separately (see `prepare_component`) and
+        every interior variable has the same posterior, so it is computed
+        only once (see `combine_components`).
+
+        Parameters
+        ----------
+        components: list
+            list of lists of X variables. Variables of different components
+            do not share any Y evidence.
+        interior: list
+            list of X variables that are not parents of any Y evidence.
+        evidence: dict
+            a dict key, value pair as {var: state_of_var_observed}
+            None if no evidence
+        num_of_interior: int
+            total number of interior variables, when `interior` only holds
+            some of them (see `combine_components`).
+
+        Returns
+        -------
+        dict: {var: DiscreteFactor} with the normalized posterior of each
+            variable in `components` and `interior`.
+        """
+        evidence = evidence if evidence else {}
+        prepared = [(component, self.prepare_component(component, evidence))
+                    for component in components]
+
+        return self.combine_components(prepared, interior, evidence,
+                                       num_of_interior)
+
+    def prepare_component(self, component, evidence):
+        """
+        Computes the posteriors of the variables of a single frontier
+        component with `query_all`.
+
+        Only the evidence of the Y variables that depend on the component,
+        and the X evidence of their parents, is passed to the query. The
+        result depends only on that evidence, so it can be reused while it
+        does not change.
+
+        Parameters
+        ----------
+        component: list
+            list of X variables of the component.
+        evidence: dict
+            a dict key, value pair as {var: state_of_var_observed}
+
+        Returns
+        -------
+        tuple: (posteriors, path), where posteriors is an array of shape
+            (len(component), 2) whose k-th row is the posterior of the k-th
+            variable of `component`, and path is the method that answered
+            the query (`EXACT_PATH` or `APPROXIMATE_PATH`).
+        """
+        component_evidence = {}
+        for var in component:
+            for child in self.model.get_children(var):
+                if child in evidence and child not in component_evidence:
+                    component_evidence[child] = evidence[child]
+                    for parent in self.model.get_parents(child):
+                        if parent in evidence:
+                            component_evidence[parent] = evidence[parent]
+
+        query_var_factor = self.query_all(component, component_evidence)
+
+        return (np.array([query_var_factor[var].values for var in component]),
+                self.last_path)
+
+    def combine_components(self, prepared, interior, evidence,
+                           num_of_interior=None, known_mines=None):
+        """
+        Joins the results of `prepare_component` and adds the posterior of
+        the interior variables, computed once for all of them.
+
+        Parameters
+        ----------
+        prepared: list
+            list of (component, result of `prepare_component`) pairs.
+        interior: list
+            list of X variables that are not parents of any Y evidence.
+        evidence: dict
+            a dict key, value pair as {var: state_of_var_observed}
+        num_of_interior: int
+            total number of interior variables. Unused: the network treats
+            every X variable as independent, so the posterior of the
+            interior does not depend on it.
+        known_mines: int
+            number of X evidences with a mine. Unused, for the same reason.
+
+        Returns
+        -------
+        dict: {var: DiscreteFactor} with the posterior of each variable. The
+            method that answered each variable is stored in `self.paths`.
+        """
+        query_var_factor = {}
+        self.paths = {}
+        for component, (posteriors, path) in prepared:
+            for var, values in zip(component, posteriors):
+                query_var_factor[var] = DiscreteFactor([var], [2], values)
+                self.paths[var] = path
+
+        if interior:
+            interior_factor = self.query_all(interior[:1], {})[interior[0]]
+            for var in interior:
+                query_var_factor[var] = interior_factor
+                self.paths[var] = self.last_path
+
+        return query_var_factor
 
     def query(self, variables, evidence=None, elimination_order=None):
         """
@@ -258,7 +758,7 @@ class VariableElimination(Inference):
             return return_dict
 
         
-    def induced_graph(self, elimination_order):
+    def induced_graph(self, elimination_order, factors=None):
         """
         Returns the induced graph formed by running Variable Elimination on the network.
 
@@ -266,6 +766,11 @@ class VariableElimination(Inference):
         ----------
         elimination_order: list, array like
             List of variables in the order in which they are to be eliminated.
+        factors: list, array like (optional)
+            Factors among which the variables are eliminated (for example the
+            factors of a query, already reduced by the evidence). If given,
+            `elimination_order` may contain only part of their variables.
+            If not, the factors of the whole network are used.
 
         Examples
         --------
@@ -281,14 +786,23 @@ class VariableElimination(Inference):
         >>> inference.induced_graph(['C', 'D', 'A', 'B', 'E'])
         <networkx.classes.graph.Graph at 0x7f34ac8c5160>
         """
+        if factors is not None:
+            working_factors = {}
+            for factor in factors:
+                for var in factor.scope():
+                    working_factors.setdefault(var, []).append(factor.scope())
+            if not set(elimination_order).issubset(working_factors):
+                raise ValueError("Elimination order contains variables"
+                                 " which are not in the factors")
         # If the elimination order does not contain the same variables as the model
-        if set(elimination_order) != set(self.variables):
+        elif set(elimination_order) != set(self.variables):
             raise ValueError("Set of variables in elimination order"
                              " different from variables in model")
+        else:
+            working_factors = {node: [factor.scope() for factor in self.factors[node]]
+                               for node in self.factors}
 
         eliminated_variables = set()
-        working_factors = {node: [factor.scope() for factor in self.factors[node]]
-                           for node in self.factors}
 
         # The set of cliques that should be in the induced graph
         cliques = set()
@@ -313,7 +827,7 @@ class VariableElimination(Inference):
         return nx.Graph(itertools.chain(*edges_comb))
 
     
-    def induced_width(self, elimination_order):
+    def induced_width(self, elimination_order, factors=None):
         """
         Returns the width (integer) of the induced graph formed by running Variable Elimination on the network.
         The width is the defined as the number of nodes in the largest clique in the graph minus 1.
@@ -322,6 +836,9 @@ class VariableElimination(Inference):
         ----------
         elimination_order: list, array like
             List of variables in the order in which they are to be eliminated.
+        factors: list, array like (optional)
+            Factors among which the variables are eliminated (see
+            `induced_graph`).
 
         Examples
         --------
@@ -337,5 +854,7 @@ class VariableElimination(Inference):
         >>> inference.induced_width(['C', 'D', 'A', 'B', 'E'])
         3
         """
-        induced_graph = self.induced_graph(elimination_order)
+        induced_graph = self.induced_graph(elimination_order, factors)
+        if not induced_graph.number_of_nodes():
+            return 0
         return nx.graph_clique_number(induced_graph) - 1
\ No newline at end of file
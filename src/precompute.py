@@ -0,0 +1,103 @@
+import os
+import sys
+import math
+import argparse
+import functools
+import multiprocessing
+
+from . import engine as eng
+from . import selfplay
+from .inference import pattern_cache as pc
+from .inference import pattern_table as pt
+
+
+DEFAULT_WINDOW = 5
+
+# Partidas que juega cada tarea de "collect_patterns"
+GAMES_PER_TASK = 20
+
+
+# Juega sin tabla de patrones las partidas de "seeds" con la eliminación de
+# variables y devuelve las probabilidades exactas (forma canónica ==>
+# probabilidad de mina de cada casilla oculta) de todas las componentes de la
+# frontera que han aparecido y caben en la ventana. Las componentes se
+# recogen de la caché de patrones del proceso, que durante la tarea no
+# descarta ninguna (al terminar recupera su tamaño máximo).
+def collect_patterns(height, width, num_of_mines, window, seeds):
+    cache = pc.get_pattern_cache(eng.pattern_cache_name(
+        'variable_elimination', height, width, num_of_mines))
+    maxsize = cache.maxsize
+    cache.clear()
+    cache.maxsize = math.inf
+
+    try:
+        for seed in seeds:
+            eng.BoardEngine(height, width, num_of_mines, seed=seed).play_game()
+
+        patterns = {pattern: posteriors[:, 1].tolist()
+                    for pattern, (posteriors, path) in cache.entries.items()
+                    if path != eng.APPROXIMATE_PATH
+                    and pt.fits(pattern, window)}
+    finally:
+        cache.clear()
+        cache.maxsize = maxsize
+
+    return patterns
+
+
+# Reúne los patrones de "num_of_games" partidas (repartidas entre "workers"
+# procesos) y los guarda en la tabla "path". Devuelve el número de patrones.
+#
+# No se enumeran todos los patrones posibles de la ventana (en una ventana de
+# 5x5 hay del orden de 10^25 combinaciones de casillas ocultas y números, casi
+# todas imposibles en una partida), sino los que aparecen al jugar partidas
+# con la densidad de la tabla, que son los que el solver va a consultar.
+def build(height, width, num_of_mines, num_of_games, path,
+          window=DEFAULT_WINDOW, workers=None, seed=0):
+    seeds = selfplay.game_seeds(seed, num_of_games)
+    tasks = [seeds[k:k+GAMES_PER_TASK]
+             for k in range(0, len(seeds), GAMES_PER_TASK)]
+    collect = functools.partial(collect_patterns, height, width, num_of_mines,
+                                window)
+
+    entries = {}
+    if workers == 1:
+        for task in tasks:
+            entries.update(collect(task))
+    else:
+        workers = workers if workers else multiprocessing.cpu_count()
+        with multiprocessing.Pool(workers) as pool:
+            for patterns in pool.imap_unordered(collect, tasks):
+                entries.update(patterns)
+
+    return pt.save(path, entries, num_of_mines/(height*width), window)
+
+
+# Uso:
+#     $ python -m src.precompute 16 16 40 --games 2000 --output 16x16x40.bin
+#
+# La tabla sirve para cualquier tablero con la misma densidad de minas (por
+# ejemplo, ver "--pattern-table" en "selfplay.py").
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Precalcula la tabla de probabilidades de patrones.')
+    parser.add_argument('height', type=int)
+    parser.add_argument('width', type=int)
+    parser.add_argument('num_of_mines', type=int)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    count = build(args.height, args.width, args.num_of_mines, args.games,
+                  args.output, args.window, args.workers, args.seed)
+
+    print('- Patrones: {0}'.format(count), file=sys.stderr)
+    print('- Tamaño: {0} bytes'.format(os.path.getsize(args.output)),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
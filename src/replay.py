@@ -0,0 +1,139 @@
+import json
+import time
+import argparse
+
+from . import engine as eng
+
+
+REPLAY_VERSION = 1
+
+
+# Formato de las repeticiones de partidas (un objeto JSON):
+#   - version: versión del formato.
+#   - height, width, num_of_mines, backend: configuración de la partida.
+#   - seed: semilla con la que se generó el tablero (None si no se conoce).
+#   - mines: mapa de bits de las minas en hexadecimal. El bit k corresponde
+#     a la casilla de índice k (ver "BoardEngine.get_position").
+#   - moves: lista de jugadas. Cada jugada es la lista de casillas [i, j]
+#     reveladas a la vez (una sola casilla, o todas las casillas seguras).
+#
+# Al cargar una repetición se usa siempre el mapa de bits, de forma que el
+# tablero es el mismo aunque cambie el generador de números aleatorios.
+def record(board):
+    return {
+        'version': REPLAY_VERSION,
+        'height': board.height,
+        'width': board.width,
+        'num_of_mines': board.num_of_mines,
+        'backend': board.backend,
+        'seed': board.seed,
+        'mines': encode_mines(board.get_mine_indices()),
+        'moves': [[[i, j] for (i, j) in move] for move in board.history]
+    }
+
+
+def save(board, path):
+    with open(path, 'w') as f:
+        json.dump(record(board), f)
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+
+    if data.get('version') != REPLAY_VERSION:
+        raise ValueError('Unsupported replay version: {0}'.format(
+            data.get('version')))
+
+    return data
+
+
+def encode_mines(mine_indices):
+    bitmap = 0
+    for index in mine_indices:
+        bitmap |= 1 << index
+
+    return format(bitmap, 'x')
+
+
+def decode_mines(bitmap, width):
+    bitmap = int(bitmap, 16)
+    positions = []
+    index = 0
+    while bitmap:
+        if bitmap & 1:
+            positions.append(divmod(index, width))
+        bitmap >>= 1
+        index += 1
+
+    return positions
+
+
+# Crea el tablero de la repetición "data" sin hacer ninguna jugada
+def create_board(data, backend=None, sink=None):
+    return eng.BoardEngine(data['height'], data['width'], data['num_of_mines'],
+                           backend if backend else data['backend'],
+                           data['seed'],
+                           mine_positions=decode_mines(data['mines'],
+                                                       data['width']),
+                           sink=sink)
+
+
+# Repite las jugadas de "data" (todas, o solo las "num_of_moves" primeras)
+# y devuelve el tablero resultante. Cada jugada se revela igual que en la
+# partida original, por lo que también se repiten los mismos cálculos de
+# sugerencias. Con "backend" se puede repetir la partida con otro motor de
+# inferencia, y con "sink" registrar los datos de cada consulta (ver
+# "inference/instrumentation.py").
+def replay(data, num_of_moves=None, backend=None, sink=None):
+    board = create_board(data, backend, sink)
+    moves = data['moves'] if num_of_moves is None else data['moves'][:num_of_moves]
+
+    for move in moves:
+        squares = [tuple(square) for square in move]
+        if len(squares) == 1:
+            board.reveal(*squares[0])
+        else:
+            board.reveal_squares(squares)
+
+    return board
+
+
+# Uso:
+#     $ python -m src.replay partida.json [--backend enumeration]
+#                                         [--trace consultas.jsonl]
+#
+# Repite la partida guardada y muestra el tablero final y el tiempo empleado.
+# Con "--trace" se escriben los datos de cada sugerencia y de cada consulta
+# en un fichero JSON-lines. Para perfilarla:
+#     $ python -m cProfile -s cumtime -m src.replay partida.json
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Repite una partida guardada.')
+    parser.add_argument('replay')
+    parser.add_argument('--backend', choices=eng.INFERENCE_BACKENDS,
+                        default=None)
+    parser.add_argument('--trace', default=None)
+    args = parser.parse_args(argv)
+
+    from .inference import instrumentation as ins
+
+    data = load(args.replay)
+    sink = ins.JsonLinesSink(args.trace) if args.trace else None
+
+    start = time.perf_counter()
+    board = replay(data, backend=args.backend, sink=sink)
+    end = time.perf_counter()
+
+    if sink is not None:
+        sink.close()
+
+    print(board)
+    print('Jugadas: {0}'.format(len(data['moves'])))
+    print('Resultado: {0}'.format('DERROTA' if board.lost else 'VICTORIA'
+                                  if board.is_end_game() else 'SIN TERMINAR'))
+    print('Tiempo: {0} seg (inferencia: {1} seg)'.format(end - start,
+                                                        board.inference_time))
+
+
+if __name__ == '__main__':
+    main()
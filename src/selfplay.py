@@ -0,0 +1,355 @@
+import os
+import sys
+import json
+import math
+import random
+import time
+import argparse
+import functools
+import tracemalloc
+import multiprocessing
+
+from . import engine as eng
+from . import bitboard_engine as bb
+from . import replay
+from .inference import batched_belief_propagation as bbp
+
+
+# Valor z del intervalo de confianza del 95%
+CONFIDENCE_Z = 1.96
+
+# Representaciones del tablero con las que se pueden jugar las partidas
+# (todas juegan las mismas partidas con la misma semilla)
+BOARD_ENGINES = {
+    'dense': eng.BoardEngine,
+    'bitboard': bb.BitboardEngine
+}
+
+
+# Juega una partida completa sin interfaz gráfica. El tablero se genera a
+# partir de "seed", por lo que cualquier partida puede volver a jugarse con
+# su semilla. Devuelve un diccionario con:
+#   - seed: semilla de la partida.
+#   - won: True si se ha ganado la partida.
+#   - moves: número de casillas elegidas por el jugador.
+#   - time: tiempo total de la partida (en segundos).
+#   - inference_time: tiempo dedicado a calcular sugerencias (en segundos).
+#   - approximate_suggestions: número de sugerencias calculadas de forma
+#     aproximada (ver "max_factor_size" en "engine.py").
+#   - peak_memory: pico de memoria reservada durante la partida (en bytes),
+#     o None si no se ha pedido medirla ("track_memory").
+# Si se indica "replay_dir", las partidas perdidas se guardan en ese
+# directorio como repeticiones ("replay.py") con el nombre <seed>.json.
+# "pattern_table" es la ruta de una tabla de patrones precalculada (ver
+# "precompute.py") o None, y "board_engine" el nombre de la representación
+# del tablero (ver "BOARD_ENGINES").
+def play_seeded_game(height, width, num_of_mines, backend, track_memory,
+                     replay_dir, pattern_table, board_engine, seed):
+    if track_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    board = BOARD_ENGINES[board_engine](height, width, num_of_mines, backend,
+                                        seed, pattern_table=pattern_table)
+    won = board.play_game()
+    elapsed = time.perf_counter() - start
+
+    peak_memory = None
+    if track_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    if replay_dir and not won:
+        replay.save(board, os.path.join(replay_dir, '{0}.json'.format(seed)))
+
+    return {
+        'seed': seed,
+        'won': won,
+        'moves': board.moves,
+        'time': elapsed,
+        'inference_time': board.inference_time,
+        'approximate_suggestions': board.approximate_suggestions,
+        'peak_memory': peak_memory
+    }
+
+
+# Juega a la vez las partidas de "seeds", avanzando una jugada en cada
+# tablero por ronda. Las sugerencias de todos los tableros que la necesitan
+# en una ronda se calculan con una sola consulta de
+# "BatchedBeliefPropagation", de forma que el coste de cada iteración se
+# reparte entre todas las partidas. Devuelve la lista de resultados, con el
+# mismo formato que "play_seeded_game". El tiempo de cada partida incluye
+# su parte proporcional de las consultas, y todas sus sugerencias se cuentan
+# como aproximadas. El pico de memoria es el de todo el lote.
+def play_batched_games(height, width, num_of_mines, track_memory, replay_dir,
+                       board_engine, seeds):
+    if track_memory:
+        tracemalloc.start()
+
+    inference = bbp.BatchedBeliefPropagation(height, width, num_of_mines)
+    boards = [BOARD_ENGINES[board_engine](height, width, num_of_mines, None,
+                                          seed)
+              for seed in seeds]
+    times = [0.0]*len(boards)
+    playing = list(range(len(boards)))
+
+    while playing:
+        pending = [g for g in playing if boards[g].suggested_pos is None]
+        if pending:
+            start = time.perf_counter()
+            marginals = inference.query([boards[g].evidences for g in pending])
+            for g, marginal in zip(pending, marginals):
+                board = boards[g]
+                board.suggested_pos = eng.choose_square(
+                    {(i, j): marginal[i*width + j, 0]
+                     for (i, j) in board.get_hidden_squares()})
+                board.approximate_suggestions += 1
+            elapsed = (time.perf_counter() - start)/len(pending)
+            for g in pending:
+                boards[g].inference_time += elapsed
+                times[g] += elapsed
+
+        for g in playing:
+            start = time.perf_counter()
+            board = boards[g]
+            if board.constraint_propagation.safe:
+                board.reveal_safe_squares(suggest=False)
+            else:
+                board.reveal(*board.suggested_pos, suggest=False)
+            times[g] += time.perf_counter() - start
+        playing = [g for g in playing if boards[g].suggested_pos is not False]
+
+    peak_memory = None
+    if track_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    results = []
+    for board, elapsed in zip(boards, times):
+        won = board.is_end_game()
+        if replay_dir and not won:
+            replay.save(board, os.path.join(replay_dir,
+                                            '{0}.json'.format(board.seed)))
+        results.append({
+            'seed': board.seed,
+            'won': won,
+            'moves': board.moves,
+            'time': elapsed,
+            'inference_time': board.inference_time,
+            'approximate_suggestions': board.approximate_suggestions,
+            'peak_memory': peak_memory
+        })
+
+    return results
+
+
+# Prepara el proceso para jugar partidas: crear un tablero sin minas importa
+# el motor de inferencia (y pgmpy) y construye la red del tablero (y abre la
+# tabla de patrones), de forma que ese trabajo, que solo se hace una vez por
+# proceso, no se cuenta en el tiempo ni en la memoria de su primera partida.
+# Con backend=None (partidas por lotes) no hay nada que preparar.
+def warm_up(height, width, num_of_mines, backend, pattern_table):
+    if backend is not None:
+        eng.BoardEngine(height, width, num_of_mines, backend,
+                        mine_positions=[], pattern_table=pattern_table)
+
+
+# Semillas de cada una de las partidas, obtenidas a partir de una semilla
+# común para que toda la serie sea reproducible
+def game_seeds(seed, num_of_games):
+    rng = random.Random(seed)
+
+    return [rng.randrange(2**32) for k in range(num_of_games)]
+
+
+# Juega "num_of_games" partidas repartidas entre "workers" procesos (por
+# defecto, uno por núcleo) y devuelve los resultados de cada partida a medida
+# que terminan, por lo que no tienen por qué llegar en orden. Con workers=1
+# las partidas se juegan en el propio proceso, lo que facilita perfilarlas.
+#
+# Con "batch_size", las partidas se juegan en lotes de ese tamaño con
+# "play_batched_games" (en lugar de con el motor de inferencia "backend").
+#
+# Cada proceso se prepara con "warm_up" antes de jugar su primera partida.
+def run_games(height, width, num_of_mines, num_of_games,
+              backend='variable_elimination', workers=None, seed=0,
+              track_memory=False, replay_dir=None, batch_size=None,
+              pattern_table=None, board_engine='dense'):
+    seeds = game_seeds(seed, num_of_games)
+    if batch_size:
+        play = functools.partial(play_batched_games, height, width,
+                                 num_of_mines, track_memory, replay_dir,
+                                 board_engine)
+        tasks = [seeds[k:k+batch_size] for k in range(0, len(seeds), batch_size)]
+        backend = None
+    else:
+        play = functools.partial(play_seeded_game, height, width, num_of_mines,
+                                 backend, track_memory, replay_dir,
+                                 pattern_table, board_engine)
+        tasks = seeds
+
+    prepare = functools.partial(warm_up, height, width, num_of_mines, backend,
+                                pattern_table)
+
+    if workers == 1:
+        prepare()
+        for task in tasks:
+            yield from results_of(play(task), batch_size)
+        return
+
+    workers = workers if workers else multiprocessing.cpu_count()
+    chunksize = max(1, len(tasks) // (workers*16))
+    with multiprocessing.Pool(workers, initializer=prepare) as pool:
+        for result in pool.imap_unordered(play, tasks, chunksize):
+            yield from results_of(result, batch_size)
+
+
+# Resultados de cada partida de una tarea de "run_games" (una partida, o una
+# lista de partidas si se juegan por lotes)
+def results_of(result, batch_size):
+    return result if batch_size else [result]
+
+
+# Intervalo de confianza de Wilson para una proporción de "successes" éxitos
+# en "n" intentos. Se comporta mejor que la aproximación normal cuando la
+# proporción está cerca de 0 o de 1.
+def wilson_interval(successes, n, z=CONFIDENCE_Z):
+    if n == 0:
+        return (0.0, 1.0)
+
+    p = successes/n
+    denominator = 1 + z**2/n
+    center = (p + z**2/(2*n)) / denominator
+    margin = z*math.sqrt(p*(1-p)/n + z**2/(4*n**2)) / denominator
+
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+
+# Media de "values" y su intervalo de confianza (aproximación normal)
+def mean_interval(values, z=CONFIDENCE_Z):
+    n = len(values)
+    if n == 0:
+        return (None, (None, None))
+
+    mean = sum(values)/n
+    if n == 1:
+        return (mean, (mean, mean))
+
+    variance = sum((v - mean)**2 for v in values)/(n-1)
+    margin = z*math.sqrt(variance/n)
+
+    return (mean, (mean - margin, mean + margin))
+
+
+# Resumen de una serie de partidas: tasa de victoria y medias de tiempo,
+# tiempo de inferencia y jugadas, con sus intervalos de confianza del 95%
+def summarize(results):
+    results = list(results)
+    wins = sum(1 for r in results if r['won'])
+    time_mean, time_ci = mean_interval([r['time'] for r in results])
+    inference_mean, inference_ci = mean_interval(
+        [r['inference_time'] for r in results])
+    moves_mean, moves_ci = mean_interval([r['moves'] for r in results])
+    peaks = [r['peak_memory'] for r in results if r['peak_memory'] is not None]
+
+    return {
+        'games': len(results),
+        'wins': wins,
+        'win_rate': wins/len(results) if results else None,
+        'win_rate_ci': wilson_interval(wins, len(results)),
+        'time': time_mean,
+        'time_ci': time_ci,
+        'inference_time': inference_mean,
+        'inference_time_ci': inference_ci,
+        'moves': moves_mean,
+        'moves_ci': moves_ci,
+        'peak_memory': max(peaks) if peaks else None
+    }
+
+
+def print_summary(summary, out=sys.stderr):
+    print('- Partidas: {0}'.format(summary['games']), file=out)
+    print('- Victorias: {0} ({1:.4f}, IC 95%: {2[0]:.4f} - {2[1]:.4f})'.format(
+        summary['wins'], summary['win_rate'], summary['win_rate_ci']), file=out)
+    print('- Tiempo medio: {0:.4f} seg (IC 95%: {1[0]:.4f} - {1[1]:.4f})'.format(
+        summary['time'], summary['time_ci']), file=out)
+    print('- Tiempo medio de inferencia: {0:.4f} seg'.format(
+        summary['inference_time']), file=out)
+    print('- Jugadas de media: {0:.2f}'.format(summary['moves']), file=out)
+    if summary['peak_memory'] is not None:
+        print('- Pico de memoria: {0} bytes'.format(summary['peak_memory']),
+              file=out)
+
+
+# Uso:
+#     $ python -m src.selfplay 9 9 10 --games 10000 --workers 8 --seed 1
+#
+# Escribe el resultado de cada partida como una línea JSON en la salida
+# estándar (o en el fichero "--output") y, al terminar, el resumen en la
+# salida de errores.
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Juega partidas automáticas en paralelo.')
+    parser.add_argument('height', type=int)
+    parser.add_argument('width', type=int)
+    parser.add_argument('num_of_mines', type=int)
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', choices=eng.INFERENCE_BACKENDS,
+                        default=None,
+                        help='motor de inferencia (por defecto, '
+                             'variable_elimination); no se puede usar con '
+                             '--batch')
+    parser.add_argument('--memory', action='store_true',
+                        help='mide el pico de memoria de cada partida')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--replays', default=None,
+                        help='directorio donde guardar las partidas perdidas')
+    parser.add_argument('--batch', type=int, default=None,
+                        help='juega las partidas en lotes de este tamaño, '
+                             'con propagación de creencias por lotes '
+                             '(aproximada, sin tener en cuenta el número '
+                             'total de minas) en lugar de --backend')
+    parser.add_argument('--pattern-table', default=None,
+                        help='tabla de patrones precalculada (ver '
+                             'precompute.py), solo con variable_elimination')
+    parser.add_argument('--board', choices=sorted(BOARD_ENGINES),
+                        default='dense',
+                        help='representación del tablero (por defecto, '
+                             'arrays de NumPy)')
+    args = parser.parse_args(argv)
+
+    if args.batch and args.backend:
+        parser.error('--batch y --backend no se pueden usar a la vez')
+    if args.backend is None:
+        args.backend = 'variable_elimination'
+    if args.pattern_table and (args.batch
+                               or args.backend != 'variable_elimination'):
+        parser.error('--pattern-table solo se puede usar con '
+                     'variable_elimination')
+
+    if args.replays:
+        os.makedirs(args.replays, exist_ok=True)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    results = []
+    try:
+        for result in run_games(args.height, args.width, args.num_of_mines,
+                                args.games, args.backend, args.workers,
+                                args.seed, args.memory, args.replays,
+                                args.batch, args.pattern_table,
+                                args.board):
+            results.append(result)
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    finally:
+        if args.output:
+            out.close()
+
+    if results:
+        print_summary(summarize(results))
+
+
+if __name__ == '__main__':
+    main()
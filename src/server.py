@@ -0,0 +1,548 @@
+import sys
+import json
+import math
+import time
+import queue
+import signal
+import argparse
+import threading
+import socketserver
+import multiprocessing
+
+from . import engine as eng
+from .inference import pattern_table as pt
+
+
+# Número máximo de peticiones de cada lote y tiempo máximo (en segundos) que
+# se espera a que lleguen más peticiones antes de enviar un lote incompleto
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BATCH_DELAY = 0.005
+
+# Número máximo de casillas (height*width) de los tableros de las peticiones
+DEFAULT_MAX_SQUARES = 50*50
+
+# Carácter de las casillas ocultas en el estado del tablero (el mismo que en
+# "BoardEngine.__str__"). Las banderas también se tratan como casillas ocultas.
+HIDDEN_SQUARES = '_F'
+
+
+# Protocolo (JSON-lines: un objeto JSON por línea, tanto en las peticiones
+# como en las respuestas).
+#
+# Petición:
+#   - id: identificador de la petición, que se devuelve en la respuesta (las
+#     respuestas no tienen por qué llegar en el orden de las peticiones).
+#   - height, width, num_of_mines: configuración del tablero (como mucho
+#     "--max-squares" casillas y menos minas que casillas).
+#   - board: lista de filas del tablero, con el formato de
+#     "BoardEngine.__str__" ('_' o 'F' para las casillas ocultas y el número
+#     de minas vecinas para las reveladas; los espacios se ignoran).
+#   - backend: motor de inferencia (opcional, ver "engine.INFERENCE_BACKENDS").
+#
+# Respuesta:
+#   - id: el de la petición.
+#   - suggestion: casilla [i, j] que elegiría "BoardEngine.update_suggestion"
+#     (la primera casilla segura si la hay o, si no, la de menor
+#     probabilidad de contener una mina), o None si la partida ha terminado.
+#   - safe: casillas que se sabe seguro que no tienen mina.
+#   - mine_probabilities: filas del tablero con la probabilidad de que cada
+#     casilla oculta contenga una mina (None en las casillas reveladas).
+#   - answered_by: métodos con los que se han calculado las probabilidades.
+#   - compute_time: tiempo de cálculo en el proceso de trabajo.
+#   - queue_time: tiempo desde que se recibe la petición hasta que se envía
+#     a un proceso de trabajo.
+#   - latency: tiempo total desde que se recibe la petición hasta que se
+#     responde.
+#   - batch: número de peticiones del lote en el que se ha calculado.
+# Si la petición no es válida, la respuesta solo tiene "id" y "error".
+
+
+# Comprueba que la configuración del tablero es válida: dimensiones enteras
+# positivas, como mucho "max_squares" casillas (sin límite si es None) y al
+# menos una casilla sin mina
+def check_configuration(height, width, num_of_mines, max_squares=None):
+    if not all(isinstance(n, int) for n in (height, width, num_of_mines)):
+        raise ValueError('Board size and number of mines must be integers')
+    if height <= 0 or width <= 0:
+        raise ValueError('Board size must be positive')
+    if max_squares is not None and height*width > max_squares:
+        raise ValueError('Board larger than {0} squares'.format(max_squares))
+    if not 0 <= num_of_mines < height*width:
+        raise ValueError('Number of mines must be between 0 and the number '
+                         'of squares minus 1')
+
+
+# Crea el motor del tablero descrito por "board" (ver el protocolo). Las
+# posiciones de las minas no se conocen, pero el motor solo las usa en las
+# casillas reveladas (que no tienen mina), por lo que basta con copiar el
+# número de minas vecinas de esas casillas y añadir sus evidencias.
+#
+# Los tableros imposibles se rechazan con ValueError antes de la inferencia
+# (ver "check_revealed_squares" y "check_constraints"), para que la
+# respuesta no dependa de cómo trate cada motor unas evidencias
+# incoherentes.
+def observed_board(height, width, num_of_mines, board,
+                   backend='variable_elimination', pattern_table=None):
+    check_configuration(height, width, num_of_mines)
+    rows = [row.replace(' ', '') for row in board]
+    if len(rows) != height or any(len(row) != width for row in rows):
+        raise ValueError('Board does not match its size')
+
+    engine = eng.BoardEngine(height, width, num_of_mines, backend,
+                             mine_positions=[], pattern_table=pattern_table)
+    revealed = []
+    for i, row in enumerate(rows):
+        for j, square in enumerate(row):
+            if square in HIDDEN_SQUARES:
+                continue
+            if not square.isdigit() or int(square) > 8:
+                raise ValueError('Invalid square: {0}'.format(square))
+            engine.neighbor_mines[i, j] = int(square)
+            revealed.append((i, j))
+
+    if revealed:
+        engine.set_revealed(revealed)
+        check_revealed_squares(engine, revealed)
+        engine.add_evidences(revealed)
+        engine.update_constraints(revealed)
+        check_constraints(engine, revealed)
+    engine.update_suggestion(suggest=False)
+
+    return engine
+
+
+# Ninguna casilla revelada puede tener más minas vecinas que vecinos ocultos
+def check_revealed_squares(engine, revealed):
+    for (i, j) in revealed:
+        hidden = sum(1 for n in engine.get_neighbors(i, j)
+                     if engine.is_hidden(*n))
+        if engine.get_neighbor_mines(i, j) > hidden:
+            raise ValueError('Square ({0}, {1}) has more mines than hidden '
+                             'neighbors'.format(i, j))
+
+
+# Comprueba que las deducciones de "constraint_propagation" no se
+# contradicen: ninguna casilla es a la vez segura y mina, el número de cada
+# casilla revelada está entre las minas deducidas a su alrededor y esas
+# minas más los vecinos sin determinar, y el número de minas del tablero
+# cabe en él:
+#   - Las minas necesarias se acotan por debajo con las deducidas más las de
+#     restricciones sin casillas en común, que no pueden compartir ninguna
+#     mina.
+#   - Las que caben se acotan por encima con las deducidas, las casillas
+#     ocultas que no están en ninguna restricción y las de un conjunto de
+#     restricciones que cubre el resto (cada mina cuenta en al menos una).
+#     Se eligen primero las restricciones con menos minas por casilla.
+def check_constraints(engine, revealed):
+    propagation = engine.constraint_propagation
+    if propagation.safe & propagation.mines:
+        raise ValueError('Board is not consistent')
+
+    for (i, j) in revealed:
+        hidden = [n for n in engine.get_neighbors(i, j) if engine.is_hidden(*n)]
+        mines = sum(1 for n in hidden if n in propagation.mines)
+        unknown = sum(1 for n in hidden
+                      if n not in propagation.mines and n not in propagation.safe)
+        if not mines <= engine.get_neighbor_mines(i, j) <= mines + unknown:
+            raise ValueError('Square ({0}, {1}) is not consistent with its '
+                             'neighbors'.format(i, j))
+
+    needed = len(propagation.mines)
+    used = set()
+    for unknown, value in propagation.constraints.values():
+        if not unknown & used:
+            used |= unknown
+            needed += value
+    if needed > engine.num_of_mines:
+        raise ValueError('Board needs more than {0} mines'.format(
+            engine.num_of_mines))
+
+    room = len(propagation.mines)
+    covered = set()
+    for unknown, value in sorted(propagation.constraints.values(),
+                                 key=lambda c: c[1]/len(c[0])):
+        if not unknown <= covered:
+            covered |= unknown
+            room += value
+    hidden = engine.height*engine.width - len(revealed)
+    room += (hidden - len(propagation.mines) - len(propagation.safe)
+             - len(covered))
+    if room < engine.num_of_mines:
+        raise ValueError('Board has room for fewer than {0} mines'.format(
+            engine.num_of_mines))
+
+
+# Comprueba que el motor de inferencia ha encontrado alguna configuración de
+# minas compatible con el tablero: ninguna probabilidad es NaN y, con el
+# muestreo, alguna cadena tiene muestras válidas (si no, su error estándar
+# es infinito). La enumeración ya lanza ValueError en ese caso.
+def check_probabilities(engine, prob_X):
+    if any(math.isnan(prob) for prob in prob_X.values()):
+        raise ValueError('Evidence is not consistent with the board')
+    if math.isinf(getattr(engine.inference, 'max_standard_error', 0.0)):
+        raise ValueError('No mine configuration is consistent with the board')
+
+
+# Tabla de "pattern_tables" (rutas de tablas de patrones) que corresponde a
+# la configuración, o None si ninguna sirve
+def find_pattern_table(pattern_tables, height, width, num_of_mines, backend):
+    if backend != 'variable_elimination':
+        return None
+
+    for path in pattern_tables:
+        if pt.get_pattern_table(path).matches(height, width, num_of_mines):
+            return path
+
+    return None
+
+
+# Responde a una petición ya decodificada (sin los tiempos de la cola). Se
+# usa la tabla de "pattern_tables" con la densidad del tablero, si la hay.
+def suggest(request, pattern_tables=()):
+    start = time.perf_counter()
+    backend = request.get('backend', 'variable_elimination')
+    pattern_table = find_pattern_table(pattern_tables, request['height'],
+                                       request['width'],
+                                       request['num_of_mines'], backend)
+    engine = observed_board(request['height'], request['width'],
+                            request['num_of_mines'], request['board'],
+                            backend, pattern_table)
+
+    probabilities = [[None]*engine.width for i in range(engine.height)]
+    if engine.suggested_pos is not False:
+        prob_X = engine.get_square_probabilities()
+        check_probabilities(engine, prob_X)
+        for (i, j), prob in prob_X.items():
+            probabilities[i][j] = 1 - float(prob)
+        if engine.suggested_pos is None:
+            engine.suggested_pos = eng.choose_square(prob_X)
+
+    return {
+        'id': request.get('id'),
+        'suggestion': list(engine.suggested_pos) if engine.suggested_pos else None,
+        'safe': [list(sq) for sq in sorted(engine.constraint_propagation.safe)],
+        'mine_probabilities': probabilities,
+        'answered_by': engine.answered_by,
+        'compute_time': time.perf_counter() - start
+    }
+
+
+# Respuesta de error a "request" por la excepción "error"
+def error_response(request, error):
+    return {'id': request.get('id'),
+            'error': '{0}: {1}'.format(type(error).__name__, error)}
+
+
+# Tarea de cada proceso de trabajo: responde a todas las peticiones de un
+# lote. Un error en una petición (por ejemplo, un tablero incoherente) se
+# devuelve como respuesta a esa petición, sin afectar al resto del lote ni
+# dejar al cliente esperando.
+def suggest_batch(requests, pattern_tables=()):
+    responses = []
+    for request in requests:
+        try:
+            responses.append(suggest(request, pattern_tables))
+        except Exception as e:
+            responses.append(error_response(request, e))
+
+    return responses
+
+
+# Inicializador de los procesos de trabajo: abre las tablas de patrones y
+# construye la red bayesiana y el motor de inferencia de cada configuración
+# (height, width, num_of_mines, backend) de "configurations". Las redes se
+# guardan en la caché de "bayesian_network.generate_BN", por lo que las
+# peticiones con esas configuraciones no pagan su construcción.
+def warm_up(configurations, pattern_tables=()):
+    for path in pattern_tables:
+        pt.get_pattern_table(path)
+    for height, width, num_of_mines, backend in configurations:
+        eng.BoardEngine(height, width, num_of_mines, backend,
+                        mine_positions=[])
+
+
+# Los procesos de trabajo ignoran Ctrl+C: es el proceso principal el que, al
+# recibirlo, termina de responder las peticiones pendientes y los cierra.
+def init_worker(configurations, pattern_tables):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    warm_up(configurations, pattern_tables)
+
+
+# Servidor de sugerencias. Las peticiones de todas las conexiones se
+# encolan y un hilo las agrupa en lotes de como mucho "batch_size"
+# peticiones (esperando como mucho "batch_delay" segundos a que se llene
+# cada lote). Las peticiones de un lote tienen la misma configuración de
+# tablero, para que las resuelva un proceso que ya tiene su red construida.
+# Cada lote se resuelve en uno de los "workers" procesos de trabajo (por
+# defecto, uno por núcleo). Con workers=1 los lotes se resuelven en el hilo
+# que los agrupa, sin crear ningún proceso.
+#
+# "pattern_tables" son las rutas de las tablas de patrones precalculadas
+# (ver "precompute.py"); cada petición usa la que tiene su densidad de minas.
+#
+# Las peticiones con tableros de más de "max_squares" casillas se rechazan
+# antes de llegar a los procesos de trabajo, que guardan la red de cada
+# configuración (ver "bayesian_network.generate_BN").
+class SuggestionServer:
+
+    def __init__(self, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+                 batch_delay=DEFAULT_BATCH_DELAY, configurations=(),
+                 pattern_tables=(), max_squares=DEFAULT_MAX_SQUARES):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_squares = max_squares
+        self.pattern_tables = list(pattern_tables)
+        self.requests = queue.Queue()
+        self.pool = None
+        if workers != 1:
+            self.pool = multiprocessing.Pool(
+                workers, initializer=init_worker,
+                initargs=(list(configurations), self.pattern_tables))
+        else:
+            warm_up(configurations, self.pattern_tables)
+        # Latencias de las peticiones respondidas
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    # Encola la petición "line" (una línea JSON). La respuesta se pasa a
+    # "reply" (desde otro hilo) cuando está calculada.
+    def submit(self, line, reply):
+        received = time.perf_counter()
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                request = {}
+                raise ValueError('Request must be a JSON object')
+            backend = request.get('backend', 'variable_elimination')
+            if backend not in eng.INFERENCE_BACKENDS:
+                raise ValueError('Unknown inference backend: {0}'.format(
+                    backend))
+            check_configuration(request['height'], request['width'],
+                                request['num_of_mines'], self.max_squares)
+            # Los lotes se agrupan por configuración en un diccionario
+            key = (request['height'], request['width'], request['num_of_mines'],
+                   backend)
+        except (ValueError, KeyError, TypeError) as e:
+            reply(error_response(request, e))
+            return
+
+        self.requests.put((key, received, request, reply))
+
+    def dispatch(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+
+            batches = {item[0]: [item]}
+            deadline = time.perf_counter() + self.batch_delay
+            count = 1
+            while count < self.batch_size:
+                try:
+                    item = self.requests.get(
+                        timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.requests.put(None)
+                    break
+                batches.setdefault(item[0], []).append(item)
+                count += 1
+
+            for batch in batches.values():
+                self.run_batch(batch)
+
+    def run_batch(self, batch):
+        sent = time.perf_counter()
+        requests = [request for key, received, request, reply in batch]
+
+        def answer(responses):
+            end = time.perf_counter()
+            for (key, received, request, reply), response in zip(batch,
+                                                                  responses):
+                response['queue_time'] = sent - received
+                response['latency'] = end - received
+                response['batch'] = len(batch)
+                with self.lock:
+                    self.latencies.append(response['latency'])
+                reply(response)
+
+        # Si la tarea falla fuera de "suggest_batch" (por ejemplo, al enviar
+        # el lote o las respuestas entre procesos), todas las peticiones del
+        # lote se responden con el error
+        def fail(error):
+            answer([error_response(request, error) for request in requests])
+
+        if self.pool is None:
+            answer(suggest_batch(requests, self.pattern_tables))
+        else:
+            self.pool.apply_async(suggest_batch,
+                                  (requests, self.pattern_tables),
+                                  callback=answer, error_callback=fail)
+
+    # Espera a que se respondan todas las peticiones encoladas y termina los
+    # procesos de trabajo
+    def close(self):
+        self.requests.put(None)
+        self.dispatcher.join()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+# Conexión con un cliente: lee sus peticiones y le escribe las respuestas
+# (cada una en una línea) a medida que se calculan. No se cierra la conexión
+# hasta haber respondido a todas sus peticiones.
+class ConnectionHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        pending = threading.Condition()
+        count = [0]
+
+        def reply(response):
+            with pending:
+                try:
+                    self.wfile.write((json.dumps(response) + '\n').encode())
+                    self.wfile.flush()
+                except OSError:
+                    pass
+                count[0] -= 1
+                pending.notify_all()
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            with pending:
+                count[0] += 1
+            self.server.suggestions.submit(line.decode(), reply)
+
+        with pending:
+            pending.wait_for(lambda: count[0] == 0)
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn,
+                          socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Atiende las peticiones de la entrada estándar y escribe las respuestas en
+# la salida estándar. Termina al cerrarse la entrada, después de responder a
+# todas las peticiones.
+def serve_stdio(server, stdin=sys.stdin, stdout=sys.stdout):
+    lock = threading.Lock()
+
+    def reply(response):
+        with lock:
+            stdout.write(json.dumps(response) + '\n')
+            stdout.flush()
+
+    for line in stdin:
+        if line.strip():
+            server.submit(line, reply)
+
+    server.close()
+
+
+def serve_socket(server, socket_server):
+    socket_server.suggestions = server
+    try:
+        socket_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        socket_server.server_close()
+        server.close()
+
+
+# Configuración "HEIGHTxWIDTHxMINES" de "--warm"
+def parse_configuration(text):
+    try:
+        height, width, num_of_mines = (int(n) for n in text.split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'configuración no válida: {0}'.format(text))
+
+    return height, width, num_of_mines
+
+
+# La latencia p95 es la del percentil 95 por rango más cercano: la menor
+# latencia que no superan el 95% de las peticiones
+def print_summary(latencies, out=sys.stderr):
+    if not latencies:
+        return
+
+    latencies = sorted(latencies)
+    print('- Peticiones: {0}'.format(len(latencies)), file=out)
+    print('- Latencia media: {0:.4f} seg'.format(
+        sum(latencies)/len(latencies)), file=out)
+    print('- Latencia p95: {0:.4f} seg'.format(
+        latencies[math.ceil(0.95*len(latencies)) - 1]), file=out)
+
+
+# Uso:
+#     $ python -m src.server [--workers 4] [--warm 9x9x10 --warm 16x16x40]
+#     $ python -m src.server --socket /tmp/buscapython.sock
+#     $ python -m src.server --port 8765
+#
+# Sin "--socket" ni "--port" atiende las peticiones de la entrada estándar
+# (ver el protocolo al principio del fichero). Al terminar escribe un
+# resumen de las latencias en la salida de errores.
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Servidor de sugerencias (JSON-lines).')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--batch-delay', type=float,
+                        default=DEFAULT_BATCH_DELAY,
+                        help='segundos que se espera a que se llene un lote')
+    parser.add_argument('--backend', choices=eng.INFERENCE_BACKENDS,
+                        default='variable_elimination',
+                        help='motor de inferencia de las configuraciones '
+                             'de --warm')
+    parser.add_argument('--warm', type=parse_configuration, action='append',
+                        default=[],
+                        help='configuración HEIGHTxWIDTHxMINES cuya red se '
+                             'construye al arrancar (se puede repetir)')
+    parser.add_argument('--max-squares', type=int,
+                        default=DEFAULT_MAX_SQUARES,
+                        help='número máximo de casillas de los tableros de '
+                             'las peticiones')
+    parser.add_argument('--pattern-table', action='append', default=[],
+                        help='tabla de patrones precalculada (ver '
+                             'precompute.py); se puede repetir')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--socket', default=None,
+                       help='atiende las peticiones en este socket Unix')
+    group.add_argument('--port', type=int, default=None,
+                       help='atiende las peticiones en este puerto de '
+                            '127.0.0.1')
+    args = parser.parse_args(argv)
+
+    configurations = [(height, width, num_of_mines, args.backend)
+                      for height, width, num_of_mines in args.warm]
+    server = SuggestionServer(args.workers, args.batch_size, args.batch_delay,
+                              configurations, args.pattern_table,
+                              args.max_squares)
+
+    if args.socket:
+        serve_socket(server, ThreadingUnixServer(args.socket,
+                                                 ConnectionHandler))
+    elif args.port is not None:
+        serve_socket(server, ThreadingTCPServer(('127.0.0.1', args.port),
+                                                ConnectionHandler))
+    else:
+        serve_stdio(server)
+
+    print_summary(server.latencies)
+
+
+if __name__ == '__main__':
+    main()
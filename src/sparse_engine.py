@@ -0,0 +1,147 @@
+from . import engine as eng
+from .inference import grid
+
+
+# Motores de inferencia que solo usan la estructura de la red, por lo que
+# pueden trabajar con "grid.GridModel"
+SPARSE_BACKENDS = ('enumeration', 'gibbs_sampling')
+
+
+# Lógica del tablero para tableros enormes con pocas minas (por ejemplo
+# 10000x10000), en los que no es viable guardar arrays de tamaño
+# (height, width) ni construir la red bayesiana completa. Tiene la misma
+# interfaz que "engine.BoardEngine", pero el estado se guarda en conjuntos
+# cuyo tamaño depende de las minas y de las casillas reveladas:
+#   - mines: índices (ver "get_position") de las casillas con mina.
+#   - revealed: índices de las casillas reveladas.
+#   - flagged: casillas (i,j) con bandera.
+#   - frontier: casillas ocultas con al menos un vecino revelado, que se
+#     actualiza al revelar cada casilla en lugar de recalcularla entera.
+#   - neighbor_mines: índice ==> número de minas vecinas de las casillas
+#     con alguna mina vecina.
+#
+# El interior (casillas ocultas sin vecinos revelados) no se enumera: todas
+# sus casillas tienen la misma probabilidad, por lo que solo se consulta la
+# primera (en orden de fila y columna), que es la que se sugeriría de entre
+# ellas, y el número de casillas del interior se calcula a partir del número
+# de casillas reveladas y de la frontera.
+#
+# Con la misma semilla se colocan las minas en las mismas casillas que en
+# "BoardEngine", por lo que las partidas son las mismas con ambos motores.
+class SparseBoardEngine(eng.BoardEngine):
+
+    def __init__(self, height, width, num_of_mines, backend='enumeration',
+                 seed=None, rng=None, mine_positions=None, sink=None):
+        if backend not in SPARSE_BACKENDS:
+            raise ValueError('Unsupported inference backend for sparse boards: '
+                             '{0}'.format(backend))
+
+        super().__init__(height, width, num_of_mines, backend, seed, rng,
+                         mine_positions, sink)
+
+    def create_model(self):
+        return grid.GridModel(self.height, self.width)
+
+    def init_board(self):
+        self.mines = set()
+        self.revealed = set()
+        self.flagged = set()
+        self.frontier = set()
+        self.neighbor_mines = {}
+        self.all_revealed = False
+        # Ninguna casilla con índice menor que "interior_start" está en el
+        # interior. Las casillas solo salen del interior (al revelarse o al
+        # pasar a la frontera), por lo que nunca hay que retroceder.
+        self.interior_start = 0
+
+    def place_mines(self, mine_positions=None):
+        if mine_positions is None:
+            num_of_squares = self.width * self.height
+            self.mines = set(self.rng.sample(range(num_of_squares),
+                                             self.num_of_mines))
+        else:
+            self.mines = {i*self.width + j for (i, j) in mine_positions}
+        self.update_neighbors()
+
+    def update_neighbors(self):
+        self.neighbor_mines = {}
+        for (i, j) in map(self.get_position, self.mines):
+            for (ni, nj) in self.get_neighbors(i, j):
+                index = ni*self.width + nj
+                self.neighbor_mines[index] = self.neighbor_mines.get(index, 0) + 1
+
+    def get_mine_indices(self):
+        return sorted(self.mines)
+
+    def is_mine(self, i, j):
+        return i*self.width + j in self.mines
+
+    def is_hidden(self, i, j):
+        return not self.all_revealed and i*self.width + j not in self.revealed
+
+    def is_flagged(self, i, j):
+        return (i, j) in self.flagged
+
+    def get_neighbor_mines(self, i, j):
+        return self.neighbor_mines.get(i*self.width + j, 0)
+
+    def change_flagged_state(self, i, j):
+        self.flagged ^= {(i, j)}
+
+    def reveal_all_board(self):
+        self.all_revealed = True
+
+    # Además de marcar las casillas, actualiza la frontera: las casillas
+    # reveladas salen de ella y sus vecinos ocultos entran
+    def set_revealed(self, squares):
+        self.revealed.update(i*self.width + j for (i, j) in squares)
+        self.frontier.difference_update(squares)
+        for (i, j) in squares:
+            for n in self.get_neighbors(i, j):
+                if self.is_hidden(*n):
+                    self.frontier.add(n)
+
+    # Igual que "BoardEngine.get_frontier_components", salvo que "interior"
+    # solo contiene la primera casilla del interior (o ninguna si está vacío)
+    def get_frontier_components(self):
+        pending = set(self.frontier)
+        components = []
+
+        while pending:
+            start = pending.pop()
+            squares = [start]
+            border = set()
+            queue = [start]
+            while queue:
+                i, j = queue.pop()
+                for (ri, rj) in self.get_neighbors(i, j):
+                    if self.is_hidden(ri, rj) or (ri, rj) in border:
+                        continue
+                    border.add((ri, rj))
+                    for n in self.get_neighbors(ri, rj):
+                        if n in pending:
+                            pending.remove(n)
+                            squares.append(n)
+                            queue.append(n)
+            components.append((squares, sorted(border)))
+
+        interior = []
+        num_of_squares = self.width * self.height
+        while self.interior_start < num_of_squares:
+            square = self.get_position(self.interior_start)
+            if self.is_hidden(*square) and square not in self.frontier:
+                interior.append(square)
+                break
+            self.interior_start += 1
+
+        return components, interior
+
+    def count_interior_squares(self, interior):
+        if not interior:
+            return 0
+        return self.width*self.height - len(self.revealed) - len(self.frontier)
+
+    def get_hidden_squares(self):
+        return {self.get_position(index)
+                for index in range(self.width*self.height)
+                if self.is_hidden(*self.get_position(index))}
@@ -17,15 +17,13 @@ class Square(QPushButton):
         self.flagged = flag
         
 
-    def reveal(self):
+    # El estado real de la casilla lo guarda "engine.BoardEngine"; el
+    # widget solo recibe la información necesaria para mostrarse.
+    def reveal(self, mine, neighbor_mines):
+        self.is_mine = mine
+        self.neighbor_mines = neighbor_mines
         self.is_hidden = False
         self.square_revealed.emit()
-        
-    def set_mine(self):
-        self.is_mine = True
-        
-    def inc_neighbor_mines(self):
-        self.neighbor_mines += 1
 
     def change_flagged_state(self):
         self.flagged = not self.flagged
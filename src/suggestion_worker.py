@@ -0,0 +1,156 @@
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+
+from . import engine as eng
+from .inference import session as ses
+
+
+# Estado de la partida que se envía con cada jugada
+PLAYING = 'playing'
+LOST = 'lost'
+WON = 'won'
+
+
+# Ejecuta las jugadas de "engine.BoardEngine" y el cálculo de sus
+# sugerencias en un hilo aparte, para que la ventana siga respondiendo
+# mientras se calcula la inferencia.
+#
+# Cada petición de la interfaz ("request_reveal", "request_play_game")
+# incrementa "generation", y los resultados se envían a la interfaz con la
+# generación de la petición que los ha producido, de forma que la interfaz
+# puede descartar los que ya no corresponden a la última jugada. Una
+# sugerencia que todavía se está calculando cuando llega una nueva petición
+# se abandona (ver "InferenceSession.cancelled"); las jugadas, en cambio, se
+# hacen siempre, en el orden en el que se han pedido.
+#
+# El motor solo se usa desde el hilo del trabajador: todo lo que la interfaz
+# necesita saber de una jugada (las casillas reveladas y si la partida ha
+# terminado) llega con la señal "revealed", y las banderas también se
+# cambian en este hilo ("request_flag"). La interfaz solo lee del motor la
+# colocación de las minas y el número de minas vecinas, que no cambian.
+class SuggestionWorker(QObject):
+
+    # Casillas reveladas por una jugada, estado de la partida después de la
+    # jugada (PLAYING, LOST o WON) y generación de la petición
+    revealed = pyqtSignal(list, str, int)
+    # Casilla sugerida (False si la partida ha terminado) y generación
+    suggested = pyqtSignal(object, int)
+
+    # Señales internas con las que la interfaz pasa las peticiones al hilo
+    # del trabajador
+    reveal_requested = pyqtSignal(int, int, int)
+    play_game_requested = pyqtSignal(int)
+    flag_requested = pyqtSignal(int, int)
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self.generation = 0
+        # Generación de la petición que se está atendiendo
+        self.current = 0
+        self.engine.inference_session.cancelled = self.is_stale
+
+        self.reveal_requested.connect(self.reveal)
+        self.play_game_requested.connect(self.play_game)
+        self.flag_requested.connect(self.change_flagged_state)
+
+        self.worker_thread = QThread()
+        self.moveToThread(self.worker_thread)
+        self.worker_thread.start()
+
+    def is_stale(self):
+        return self.current != self.generation
+
+    # Abandona la petición en curso y termina el hilo
+    def stop(self):
+        self.generation += 1
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+
+    # Las funciones siguientes se llaman desde la interfaz. Las jugadas
+    # devuelven la generación de la nueva petición; las banderas no cambian
+    # la sugerencia, por lo que no abandonan la que se está calculando.
+
+    def request_reveal(self, i, j):
+        self.generation += 1
+        self.reveal_requested.emit(i, j, self.generation)
+        return self.generation
+
+    def request_play_game(self):
+        self.generation += 1
+        self.play_game_requested.emit(self.generation)
+        return self.generation
+
+    def request_flag(self, i, j):
+        self.flag_requested.emit(i, j)
+
+    def game_state(self):
+        if self.engine.lost:
+            return LOST
+        if self.engine.is_end_game():
+            return WON
+        return PLAYING
+
+# Las siguientes funciones se ejecutan en el hilo del trabajador:
+
+    @pyqtSlot(int, int, int)
+    def reveal(self, i, j, generation):
+        self.current = generation
+        if self.engine.suggested_pos is not False and self.engine.is_hidden(i, j):
+            self.revealed.emit(self.engine.reveal(i, j, suggest=False),
+                               self.game_state(), generation)
+        self.suggest(generation)
+
+    @pyqtSlot(int, int)
+    def change_flagged_state(self, i, j):
+        self.engine.change_flagged_state(i, j)
+
+    def suggest(self, generation):
+        if self.engine.suggested_pos is None:
+            if self.is_stale():
+                return
+            try:
+                self.engine.update_suggestion()
+            except ses.QueryCancelled:
+                return
+
+        self.suggested.emit(self.engine.suggested_pos, generation)
+
+    # Resuelve automáticamente el tablero, mostrando cada jugada a medida que
+    # se hace y escribiendo los pasos en la consola. Se detiene si llega
+    # otra petición.
+    @pyqtSlot(int)
+    def play_game(self, generation):
+        self.current = generation
+        if self.engine.suggested_pos is False:
+            return
+
+        print('Pasos de la resolución automática:\n')
+        try:
+            while not self.is_stale():
+                if self.engine.suggested_pos is None:
+                    self.engine.update_suggestion()
+                if not self.engine.suggested_pos:
+                    break
+                safe = sorted(self.engine.constraint_propagation.safe)
+                if safe:
+                    revealed = self.engine.reveal_safe_squares(suggest=False)
+                    step = 'Casillas seguras: {0}'.format(safe)
+                else:
+                    i = self.engine.suggested_pos[0]
+                    j = self.engine.suggested_pos[1]
+                    approximate = eng.APPROXIMATE_PATH in self.engine.answered_by
+                    revealed = self.engine.reveal(i, j, suggest=False)
+                    step = 'Casilla seleccionada: {0}{1}'.format(
+                        (i, j), ' (aproximada)' if approximate else '')
+                self.revealed.emit(revealed, self.game_state(), generation)
+                print('{0}\n{1}\n'.format(self.engine, step))
+                print('============================')
+        except ses.QueryCancelled:
+            return
+
+        state = self.game_state()
+        if state == LOST:
+            print('\tDERROTA\n============================')
+        elif state == WON:
+            print('\tVICTORIA\n============================')
+        self.suggested.emit(self.engine.suggested_pos, generation)
@@ -0,0 +1,473 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import functools
+import statistics
+import subprocess
+
+from src import engine as eng
+from src import bitboard_engine as bb
+from src import sparse_engine as se
+from src.inference import bayesian_network as bn
+from src.inference import session as ses
+from src.inference import pattern_cache as pc
+from src.inference import belief_propagation as lbp
+from src.inference import batched_belief_propagation as bbp
+
+
+# Tableros de distintos tamaños y densidades de minas:
+# (altura, anchura, número de minas)
+CONFIGURATIONS = (
+    (5, 5, 5),
+    (9, 9, 10),
+    (9, 9, 20),
+    (16, 16, 40),
+    (16, 30, 99)
+)
+
+QUICK_CONFIGURATIONS = (
+    (5, 5, 5),
+    (9, 9, 10)
+)
+
+# Tableros enormes, solo para "sparse" (ver "--large")
+LARGE_CONFIGURATIONS = (
+    (400, 400, 14000),
+    (1000, 1000, 2000)
+)
+
+# Jugadas de cada partida de "bench_sparse"
+SPARSE_MOVES = 20
+
+# Aumento máximo del tiempo (en proporción) respecto a la referencia antes
+# de considerarlo una regresión
+DEFAULT_TOLERANCE = 0.2
+
+
+# Ejecuta "func" "repeat" veces y devuelve las estadísticas del tiempo de
+# cada ejecución (en segundos). Si se indica "setup", se llama antes de cada
+# ejecución (fuera de la medición) y su resultado se pasa a "func".
+def measure(func, repeat, setup=None):
+    times = []
+
+    for k in range(repeat):
+        args = setup() if setup else None
+        start = time.perf_counter()
+        func(args)
+        times.append(time.perf_counter() - start)
+
+    return {
+        'repeat': repeat,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times)
+    }
+
+
+# Tablero con una partida a medias, para medir las consultas sobre una
+# frontera real: se juega la partida con la semilla "seed" hasta la primera
+# jugada en la que hace falta una sugerencia probabilística.
+def prepare_board(height, width, num_of_mines, seed=0):
+    while True:
+        board = eng.BoardEngine(height, width, num_of_mines, seed=seed)
+        board.reveal(*board.suggested_pos)
+        while board.suggested_pos and board.constraint_propagation.safe:
+            board.reveal_safe_squares()
+
+        if board.suggested_pos and board.get_frontier_components()[0]:
+            return board
+        seed += 1
+
+
+# Construcción de la red bayesiana (sin usar la red ya construida)
+def bench_generate_BN(height, width, num_of_mines, repeat):
+    def setup():
+        bn._cached_networks.pop((height, width, num_of_mines), None)
+
+    return measure(lambda args: bn.generate_BN(height, width, num_of_mines),
+                   repeat, setup)
+
+
+# Una consulta de eliminación de variables sobre una casilla de la frontera
+def bench_query(height, width, num_of_mines, repeat):
+    board = prepare_board(height, width, num_of_mines)
+    components, interior = board.get_frontier_components()
+    i, j = components[0][0][0]
+    var = bn.bn_X_name(i, j, width)
+
+    def setup():
+        return eng.create_inference('variable_elimination', height, width,
+                                    num_of_mines)
+
+    return measure(lambda inference: inference.query([var], board.evidences),
+                   repeat, setup)
+
+
+# Cálculo completo de una sugerencia (sin resultados guardados de jugadas
+# anteriores ni de otras partidas)
+def bench_suggest(height, width, num_of_mines, repeat):
+    board = prepare_board(height, width, num_of_mines)
+
+    def setup():
+        board.inference = eng.create_inference('variable_elimination', height,
+                                               width, num_of_mines)
+        board.inference_session = ses.InferenceSession(board.inference)
+        board.inference_session.add_evidence(board.evidences)
+        board.evidences = board.inference_session.evidence
+
+    return measure(lambda args: board.suggest_next_square(), repeat, setup)
+
+
+# Resolución completa de partidas (las mismas en cada ejecución)
+def bench_solve(height, width, num_of_mines, repeat):
+    name = eng.pattern_cache_name('variable_elimination', height, width,
+                                  num_of_mines)
+
+    def setup():
+        pc.get_pattern_cache(name).clear()
+
+    def solve(args):
+        for seed in range(5):
+            eng.BoardEngine(height, width, num_of_mines, seed=seed).play_game()
+
+    return measure(solve, repeat, setup)
+
+
+# Gestión del tablero sin inferencia (colocar las minas, revelar casillas y
+# calcular la frontera) con la representación "board_class": se revelan en
+# orden todas las casillas sin mina, calculando las componentes de la
+# frontera después de cada jugada
+def bench_board(board_class, height, width, num_of_mines, repeat):
+    def play(args):
+        for seed in range(5):
+            board = board_class(height, width, num_of_mines, None, seed)
+            for i in range(height):
+                for j in range(width):
+                    if board.is_hidden(i, j) and not board.is_mine(i, j):
+                        board.reveal(i, j, suggest=False)
+                        board.get_frontier_components()
+
+    return measure(play, repeat)
+
+
+# Primeras "SPARSE_MOVES" jugadas de una partida con "SparseBoardEngine" y la
+# enumeración (sin resultados guardados de otras partidas). En los tableros
+# enormes mide que el coste de cada jugada dependa de las casillas que
+# cambian y no del tamaño del tablero ni de las casillas ya reveladas.
+def bench_sparse(height, width, num_of_mines, repeat):
+    def setup():
+        pc.get_pattern_cache(eng.pattern_cache_name(
+            'enumeration', height, width, num_of_mines)).clear()
+
+    def play(args):
+        board = se.SparseBoardEngine(height, width, num_of_mines, seed=1)
+        for k in range(SPARSE_MOVES):
+            if not board.suggested_pos:
+                break
+            if board.constraint_propagation.safe:
+                board.reveal_safe_squares()
+            else:
+                board.reveal(*board.suggested_pos)
+
+    return measure(play, repeat, setup)
+
+
+BENCHMARKS = (
+    ('generate_BN', bench_generate_BN),
+    ('query', bench_query),
+    ('suggest_next_square', bench_suggest),
+    ('solve', bench_solve),
+    ('board', functools.partial(bench_board, eng.BoardEngine)),
+    ('bitboard', functools.partial(bench_board, bb.BitboardEngine)),
+    ('sparse', bench_sparse)
+)
+
+
+def run_benchmarks(configurations=CONFIGURATIONS, repeat=10, names=None):
+    results = {}
+
+    for name, bench in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for (height, width, num_of_mines) in configurations:
+            key = '{0}/{1}x{2}x{3}'.format(name, height, width, num_of_mines)
+            results[key] = bench(height, width, num_of_mines, repeat)
+            print('{0}: {1:.6f} seg'.format(key, results[key]['min']),
+                  file=sys.stderr)
+
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+
+
+# Diferencia máxima entre las probabilidades de "BatchedBeliefPropagation" y
+# las de "LoopyBeliefPropagation" (que usan criterios de convergencia
+# distintos)
+BATCHED_TOLERANCE = 1e-3
+
+
+# Comprueba que "BatchedBeliefPropagation" calcula las mismas probabilidades
+# que "LoopyBeliefPropagation" (con el mismo orden de actualización de los
+# mensajes) sobre la red completa, con las evidencias de "num_of_boards"
+# partidas (ver "prepare_board") resueltas en un solo lote. Solo se comparan
+# las partidas en las que ambos han convergido, ya que si no el resultado
+# depende del número de iteraciones. Devuelve la mayor diferencia.
+def check_batched_belief_propagation(height, width, num_of_mines,
+                                     num_of_boards=5):
+    boards = []
+    seed = 0
+    while len(boards) < num_of_boards:
+        boards.append(prepare_board(height, width, num_of_mines, seed))
+        seed = boards[-1].seed + 1
+
+    batched = bbp.BatchedBeliefPropagation(height, width, num_of_mines)
+    marginals = batched.query([board.evidences for board in boards])
+    scalar = lbp.LoopyBeliefPropagation(
+        bn.generate_BN(height, width, num_of_mines), parallel=True)
+
+    worst = 0.0
+    for board, marginal, converged in zip(boards, marginals,
+                                          batched.converged):
+        hidden = [(i, j) for i in range(height) for j in range(width)
+                  if board.is_hidden(i, j)]
+        variables = [bn.bn_X_name(i, j, width) for (i, j) in hidden]
+        result = scalar.query(variables, board.evidences)
+        if not (converged and scalar.converged):
+            continue
+        for (i, j), var in zip(hidden, variables):
+            worst = max(worst, abs(result[var].values[1]
+                                   - marginal[i*width + j, 1]))
+
+    return worst
+
+
+# Módulos que se usan sin interfaz gráfica (por ejemplo desde las órdenes de
+# "src/cli.py"), que deben importarse sin cargar PyQt5 ni pgmpy y en menos
+# de IMPORT_TIME_BUDGET segundos
+LIGHT_MODULES = ('src.cli', 'src.engine', 'src.server', 'src.selfplay',
+                 'src.replay', 'src.sparse_engine', 'src.bitboard_engine')
+HEAVY_MODULES = ('PyQt5', 'pgmpy')
+IMPORT_TIME_BUDGET = 0.5
+
+# Código que importa un módulo en un intérprete nuevo y escribe el tiempo
+# empleado y los módulos de HEAVY_MODULES que se han cargado
+IMPORT_CODE = '''
+import sys, time
+start = time.perf_counter()
+import {0}
+print(time.perf_counter() - start)
+print(' '.join(m for m in {1!r} if m in sys.modules))
+'''
+
+
+# Tiempo mínimo (en "repeat" intérpretes nuevos, para que no influyan los
+# módulos ya importados) de importar "module", y módulos de HEAVY_MODULES
+# que carga
+def measure_import(module, repeat=5):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for k in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_CODE.format(module, HEAVY_MODULES)],
+            cwd=root, check=True, stdout=subprocess.PIPE,
+            universal_newlines=True).stdout.split('\n')
+        times.append(float(output[0]))
+
+    return min(times), output[1].split()
+
+
+# Comprueba que cada módulo de LIGHT_MODULES se importa dentro del
+# presupuesto de tiempo y sin cargar PyQt5 ni pgmpy. Devuelve True si todos
+# lo cumplen.
+def check_imports(budget=IMPORT_TIME_BUDGET, repeat=5):
+    passed = True
+    for module in LIGHT_MODULES:
+        elapsed, heavy = measure_import(module, repeat)
+        print('import/{0}: {1:.4f} seg{2}'.format(
+            module, elapsed, ' (importa {0})'.format(', '.join(heavy))
+            if heavy else ''), file=sys.stderr)
+        passed &= elapsed <= budget and not heavy
+
+    return passed
+
+
+# Peticiones al servidor de sugerencias y parte del error que se espera en la
+# respuesta (None si debe responderse sin error). Los tableros imposibles
+# deben dar error con cualquier motor de inferencia.
+SERVER_CASES = (
+    ({'height': 3, 'width': 3, 'num_of_mines': 1,
+      'board': ['000', '111', '___']}, None),
+    ({'height': 3, 'width': 3, 'num_of_mines': 1,
+      'board': ['___', '_8_', '___']}, 'ValueError'),
+    ({'height': 1, 'width': 3, 'num_of_mines': 0,
+      'board': ['1__']}, 'ValueError'),
+    ({'height': 2, 'width': 3, 'num_of_mines': 2,
+      'board': ['11_', '___']}, 'ValueError')
+)
+
+
+# Peticiones que el servidor debe rechazar antes de crear ningún lote, y
+# respuesta de error esperada
+INVALID_REQUESTS = (
+    ('{"height": 3, "width": 3, "num_of_mines": 1, "board": [], '
+     '"backend": ["enumeration"]}',
+     "ValueError: Unknown inference backend: ['enumeration']"),
+    ('{"height": 3, "width": 3, "board": []}', "KeyError: 'num_of_mines'"),
+    ('[1, 2]', 'ValueError: Request must be a JSON object')
+)
+
+
+# Comprueba las respuestas del servidor (en el propio proceso) a cada
+# petición de SERVER_CASES con cada motor de inferencia y a cada una de
+# INVALID_REQUESTS. Devuelve True si todas son las esperadas.
+def check_server():
+    from src import server
+
+    cases = [(dict(request, backend=backend), error)
+             for request, error in SERVER_CASES
+             for backend in eng.INFERENCE_BACKENDS]
+
+    responses = {}
+    suggestions = server.SuggestionServer(workers=1)
+    for k, (request, error) in enumerate(cases):
+        request['id'] = k
+        suggestions.submit(json.dumps(request),
+                           lambda response: responses.update(
+                               {response['id']: response}))
+    invalid = []
+    for line, error in INVALID_REQUESTS:
+        suggestions.submit(line, invalid.append)
+    suggestions.close()
+
+    passed = True
+    for (line, error), response in zip(INVALID_REQUESTS, invalid):
+        ok = response.get('error') == error
+        print('server/{0}: {1}'.format(
+            line, response['error'] if ok else 'FALLO {0}'.format(response)),
+            file=sys.stderr)
+        passed &= ok
+
+    for request, error in cases:
+        response = responses.get(request['id'], {})
+        ok = (error in response.get('error', '') if error
+              else 'suggestion' in response)
+        print('server/{0}/{1}: {2}'.format(
+            request['backend'], request['board'],
+            response.get('error', 'ok') if ok else 'FALLO {0}'.format(response)),
+            file=sys.stderr)
+        passed &= ok
+
+    return passed
+
+
+# Compara el tiempo mínimo de cada medición con el de la referencia (el
+# mínimo es menos sensible que la media al ruido de otros procesos). Devuelve
+# la lista de duplas (medición, proporción actual/referencia) de las
+# mediciones que han empeorado más de "tolerance".
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+
+    for key, result in sorted(current['results'].items()):
+        reference = baseline['results'].get(key)
+        if reference is None:
+            continue
+        ratio = result['min']/reference['min']
+        print('{0}: {1:.2f}x'.format(key, ratio), file=sys.stderr)
+        if ratio > 1 + tolerance:
+            regressions.append((key, ratio))
+
+    return regressions
+
+
+# Uso:
+#     $ python -m tests.benchmark --output actual.json
+#     $ python -m tests.benchmark --baseline referencia.json
+#     $ python -m tests.benchmark --large
+#
+# Con "--large" solo se mide "sparse" (por defecto, una vez) en los tableros
+# de "LARGE_CONFIGURATIONS".
+#
+# Devuelve un código de salida distinto de 0 si alguna medición ha empeorado
+# respecto a la referencia.
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Mide el rendimiento de la inferencia.')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=None,
+                        help='ejecuciones de cada medición (por defecto, '
+                             '10, o 1 con --large)')
+    parser.add_argument('--quick', action='store_true',
+                        help='solo los tableros pequeños')
+    parser.add_argument('--large', action='store_true',
+                        help='solo los tableros enormes, con el motor del '
+                             'tablero para pocas minas')
+    parser.add_argument('--only', action='append', default=None,
+                        choices=[name for name, bench in BENCHMARKS])
+    parser.add_argument('--check-batched', action='store_true',
+                        help='comprueba la propagación de creencias por '
+                             'lotes en lugar de medir el rendimiento')
+    parser.add_argument('--check-imports', action='store_true',
+                        help='comprueba el tiempo de importación de los '
+                             'módulos sin interfaz gráfica en lugar de '
+                             'medir el rendimiento')
+    parser.add_argument('--check-server', action='store_true',
+                        help='comprueba las respuestas del servidor de '
+                             'sugerencias a peticiones válidas e imposibles '
+                             'en lugar de medir el rendimiento')
+    parser.add_argument('--import-budget', type=float,
+                        default=IMPORT_TIME_BUDGET)
+    args = parser.parse_args(argv)
+
+    if args.check_imports:
+        if not check_imports(args.import_budget):
+            sys.exit(1)
+        return
+
+    if args.check_server:
+        if not check_server():
+            sys.exit(1)
+        return
+
+    configurations = QUICK_CONFIGURATIONS if args.quick else CONFIGURATIONS
+    if args.large:
+        configurations = LARGE_CONFIGURATIONS
+        args.only = args.only if args.only else ['sparse']
+    if args.repeat is None:
+        args.repeat = 1 if args.large else 10
+    if args.check_batched:
+        failed = False
+        for (height, width, num_of_mines) in configurations:
+            worst = check_batched_belief_propagation(height, width,
+                                                     num_of_mines)
+            print('batched/{0}x{1}x{2}: {3:.2e}'.format(
+                height, width, num_of_mines, worst), file=sys.stderr)
+            failed |= worst > BATCHED_TOLERANCE
+        if failed:
+            sys.exit(1)
+        return
+
+    current = run_benchmarks(configurations, args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        for key, ratio in regressions:
+            print('REGRESIÓN {0}: {1:.2f}x'.format(key, ratio), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
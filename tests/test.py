@@ -1,51 +1,39 @@
 import sys
-import time
 
-from PyQt5.QtWidgets import QApplication
-
-from src import board as b
-
-def average_time(height, width, num_of_mines):
-    app = QApplication(sys.argv)
-
-    count = 0
-    ac = 0
-
-    while(count < 20):
-        board = b.Board(height, width, num_of_mines)
-        start = time.time()
-        board.play_game()
-        end = time.time()
-
-        if board.is_end_game():
-            count += 1
-            exe_time = end - start
-            ac += exe_time
-
-    print('Media de tiempo de ejecución: {0} seg'.format(ac/count))
+from src import selfplay
+
+
+# Tiempo medio de las partidas ganadas. Se juegan como mucho "max_games"
+# partidas (en paralelo) hasta reunir "num_of_games" victorias, para no
+# quedarse en un bucle infinito si el tablero es demasiado difícil.
+def average_time(height, width, num_of_mines, num_of_games=20,
+                 max_games=1000):
+    results = []
+    for result in selfplay.run_games(height, width, num_of_mines, max_games):
+        if result['won']:
+            results.append(result)
+            if len(results) == num_of_games:
+                break
+
+    if results:
+        count = len(results)
+        ac = sum(result['time'] for result in results)
+        print('Media de tiempo de ejecución: {0} seg'.format(ac/count))
+    else:
+        print('No se ha ganado ninguna partida de {0}'.format(max_games))
     sys.exit()
 
 
-def average_success(height, width, num_of_mines):
-    app = QApplication(sys.argv)
-
-    victory_count = 0
-    loss_count = 0
-    count = 0
-
-    while(count < 5):
-        count += 1
-        board = b.Board(height, width, num_of_mines)
-        start = time.time()
-        board.play_game()
-        end = time.time()
-
-        if board.is_end_game():
-            victory_count += 1
-        else:
-            loss_count += 1
+def average_success(height, width, num_of_mines, num_of_games=5):
+    results = list(selfplay.run_games(height, width, num_of_mines,
+                                      num_of_games))
+    summary = selfplay.summarize(results)
+    victory_count = summary['wins']
+    loss_count = summary['games'] - victory_count
+    count = summary['games']
 
     print('- Victorias: {0} de {1}'.format(victory_count, count))
     print('- Derrotas: {0} de {1}'.format(loss_count, count))
-    print('- Porcentaje de victoria: {0}'.format(victory_count/count)) 
-    sys.exit()
\ No newline at end of file
+    print('- Porcentaje de victoria: {0} (IC 95%: {1[0]:.4f} - {1[1]:.4f})'.format(
+        victory_count/count, summary['win_rate_ci']))
+    sys.exit()